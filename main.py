@@ -1,11 +1,24 @@
 import argparse
 import asyncio
-from http.server import HTTPServer
+import json
 import logging
-import threading
 
-from fileRecieverServer import FileRecieverServer
+from rose.engine import headless
+from rose.engine import replay
 from rose.engine import server
+from rose.engine import supervisor
+from rose.engine import tournament
+from rose.engine import tracing
+
+
+def seed_type(value):
+    """Parse a --seed value, seeds are recorded in replays"""
+    try:
+        seed = int(value)
+        replay.check_seed(seed)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return seed
 
 
 def main():
@@ -37,15 +50,114 @@ def main():
         default="random",
         help="Choose the track type. Can be 'same' or 'random'.",
     )
+    parser.add_argument(
+        "--seed",
+        type=seed_type,
+        default=None,
+        help="Seed the games, for reproducible tracks. Random by default",
+    )
+    parser.add_argument(
+        "--replay-dir",
+        default=None,
+        help="Record a replay of every game into this directory",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Trace the game steps and driver requests, download the trace "
+        "from GET /trace",
+    )
     parser.add_argument(
         "--log", default="WARNING", help="Set the logging level. E.g. --log DEBUG"
     )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Run one game as fast as the drivers respond, without servers, "
+        "and print the results as JSON",
+    )
+    parser.add_argument(
+        "--ticks",
+        type=int,
+        default=None,
+        help="Number of game ticks in headless and tournament modes",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        help="Seconds each driver has to answer a tick in headless and "
+        "tournament modes. Defaults to the live game deadline",
+    )
+    parser.add_argument(
+        "--tournament",
+        choices=tournament.FORMATS,
+        help="Play a headless tournament between the drivers, and print each "
+        "match as a JSON line when it finishes",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes. Tournaments default to the CPU count; "
+        "in server mode, shard the game rooms across this many engine processes",
+    )
 
     args = parser.parse_args()
 
     logging.basicConfig(level=getattr(logging, args.log.upper()))
 
+    if args.trace:
+        tracing.tracer.enable()
+
+    if args.headless:
+        results = asyncio.run(
+            headless.run_game(
+                args.drivers or [],
+                args.ticks,
+                args.track,
+                seed=args.seed,
+                replay_dir=args.replay_dir,
+                deadline=args.deadline,
+            )
+        )
+        print(json.dumps(results))
+        return
+
+    if args.tournament:
+        try:
+            tournament.check_drivers(args.drivers or [])
+        except ValueError as e:
+            parser.error(str(e))
+        for record in tournament.run_tournament(
+            args.drivers or [],
+            args.tournament,
+            args.ticks,
+            args.track,
+            args.workers,
+            seed=args.seed,
+            deadline=args.deadline,
+        ):
+            print(json.dumps(record), flush=True)
+        return
+
     loop = asyncio.get_event_loop()
+    if args.workers:
+        loop.run_until_complete(
+            supervisor.run(
+                args.port,
+                args.listen,
+                args.workers,
+                args.initial_rate,
+                args.running,
+                args.drivers,
+                args.track,
+                args.seed,
+                args.replay_dir,
+            )
+        )
+        return
+
     loop.run_until_complete(
         server.run(
             args.port,
@@ -54,17 +166,11 @@ def main():
             args.running,
             args.drivers,
             args.track,
+            args.seed,
+            args.replay_dir,
         )
     )
 
 
-def startServer():
-    server_address = ('', 8000)
-    httpd = HTTPServer(server_address, FileRecieverServer)
-    print("Serving on http://localhost:8000")
-    httpd.serve_forever()
-
 if __name__ == "__main__":
-    threading.Thread(target=startServer).start()
     main()
-    
@@ -8,3 +8,15 @@ JUMP = "jump"  # NOQA
 BRAKE = "brake"  # NOQA
 
 ALL = (NONE, RIGHT, LEFT, PICKUP, JUMP, BRAKE)
+
+# Compact action codes, used by the batch engine. The code of an action is
+# its index in ALL, so NONE is always 0.
+CODES = {action: code for code, action in enumerate(ALL)}
+
+
+def encode(action):
+    return CODES[action]
+
+
+def decode(code):
+    return ALL[code]
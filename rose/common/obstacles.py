@@ -12,6 +12,18 @@ BARRIER = "barrier"  # NOQA
 
 ALL = (NONE, CRACK, TRASH, PENGUIN, BIKE, WATER, BARRIER)
 
+# Compact obstacle codes, used internally by the engine. The code of an
+# obstacle is its index in ALL, so NONE is always 0.
+CODES = {obstacle: code for code, obstacle in enumerate(ALL)}
 
-def get_random_obstacle():
-    return random.choice(ALL)
+
+def encode(obstacle):
+    return CODES[obstacle]
+
+
+def decode(code):
+    return ALL[code]
+
+
+def get_random_obstacle(rng=random):
+    return rng.choice(ALL)
@@ -1,4 +1,15 @@
-from rose.common.actions import NONE, RIGHT, LEFT, PICKUP, JUMP, BRAKE, ALL
+from rose.common.actions import (
+    NONE,
+    RIGHT,
+    LEFT,
+    PICKUP,
+    JUMP,
+    BRAKE,
+    ALL,
+    CODES,
+    decode,
+    encode,
+)
 
 
 def test_constants():
@@ -12,3 +23,10 @@ def test_constants():
 
 def test_all_constant():
     assert ALL == (NONE, RIGHT, LEFT, PICKUP, JUMP, BRAKE)
+
+
+def test_codes():
+    assert encode(NONE) == 0
+    for action in ALL:
+        assert 0 <= CODES[action] < 256
+        assert decode(encode(action)) == action
@@ -7,6 +7,9 @@ from rose.common.obstacles import (
     WATER,
     BARRIER,
     ALL,
+    CODES,
+    decode,
+    encode,
     get_random_obstacle,
 )
 
@@ -29,3 +32,19 @@ def test_get_random_obstacle():
     # This test checks if the function returns a valid obstacle
     obstacle = get_random_obstacle()
     assert obstacle in ALL
+
+
+def test_get_random_obstacle_with_rng():
+    import random
+
+    obstacles = [get_random_obstacle(random.Random(7)) for i in range(3)]
+
+    assert obstacles[0] in ALL
+    assert obstacles == [obstacles[0]] * 3
+
+
+def test_codes():
+    assert encode(NONE) == 0
+    for obstacle in ALL:
+        assert 0 <= CODES[obstacle] < 256
+        assert decode(encode(obstacle)) == obstacle
@@ -0,0 +1,275 @@
+"""Vectorized batch simulation of many games in lockstep
+
+Requires numpy, which is only needed for batch simulation.
+"""
+
+import random
+
+import numpy as np
+
+from rose.common import actions
+from rose.common import obstacles
+from rose.engine import config
+from rose.engine import player
+from rose.engine import score
+from rose.engine import track
+
+# Obstacles and actions codes, see obstacles.CODES and actions.CODES
+_NONE = obstacles.encode(obstacles.NONE)
+_CRACK = obstacles.encode(obstacles.CRACK)
+_PENGUIN = obstacles.encode(obstacles.PENGUIN)
+_WATER = obstacles.encode(obstacles.WATER)
+_HARD = [
+    obstacles.encode(obstacle)
+    for obstacle in (obstacles.TRASH, obstacles.BIKE, obstacles.BARRIER)
+]
+_LEFT = actions.encode(actions.LEFT)
+_RIGHT = actions.encode(actions.RIGHT)
+_PICKUP = actions.encode(actions.PICKUP)
+_JUMP = actions.encode(actions.JUMP)
+_BRAKE = actions.encode(actions.BRAKE)
+
+
+class BatchGame(object):
+    def __init__(self, games, players=None, is_track_random=True, seed=None):
+        """
+        Creates a batch of games advancing in lockstep.
+
+        The games follow the rules of score.process, with every track stored
+        in one (games, height, width) array of obstacle codes, and every
+        player's position, score and counters in (games, players) arrays.
+        Like Track, rows are a circular buffer; since all games scroll
+        together they share one head offset.
+
+        Args:
+            games (int): The number of games.
+            players (int, optional): Players per game. Defaults to
+                config.max_players.
+            is_track_random (bool): If False, every lane of a game gets the
+                obstacle in the same cell.
+            seed (int, optional): Seed for the track generator.
+        """
+        if players is None:
+            players = config.max_players
+        self.games = games
+        self.players = players
+        self.is_track_random = is_track_random
+        self.height = config.matrix_height
+        self.width = config.matrix_width
+        self.rng = np.random.default_rng(seed)
+        self.tracks = np.zeros((games, self.height, self.width), dtype=np.uint8)
+        self.head = 0
+        self.lane = np.arange(players)
+        self.x = np.tile(self.lane * config.cells_per_player + 1, (games, 1))
+        self.y = np.full((games, players), self.height // 3 * 2)
+        self.score = np.zeros((games, players), dtype=np.int64)
+        self.pickups = np.zeros((games, players), dtype=np.int64)
+        self.hits = np.zeros((games, players), dtype=np.int64)
+        self.breaks = np.zeros((games, players), dtype=np.int64)
+        self.jumps = np.zeros((games, players), dtype=np.int64)
+        self._games = np.arange(games)
+
+    def matrix(self):
+        """Return a (games, height, width) copy of the tracks, in row order"""
+        rows = (self.head + np.arange(self.height)) % self.height
+        return self.tracks[:, rows]
+
+    def generate_rows(self):
+        """
+        Return a new (games, width) row of obstacle codes for every game,
+        distributed like Track._generate_row.
+        """
+        rows = np.zeros((self.games, self.width), dtype=np.uint8)
+        obstacle = self.rng.integers(0, len(obstacles.ALL), self.games)
+        lanes = np.arange(config.max_players) * config.cells_per_player
+
+        if self.is_track_random:
+            shape = (self.games, config.max_players)
+        else:
+            shape = (self.games, 1)
+        cells = self.rng.integers(0, config.cells_per_player, shape) + lanes
+
+        rows[self._games[:, None], cells] = obstacle[:, None]
+        return rows
+
+    def update(self, rows=None):
+        """
+        Scroll all the tracks by one row.
+
+        Args:
+            rows (numpy.ndarray, optional): (games, width) codes of the new
+                rows. Generated when not given.
+        """
+        if rows is None:
+            rows = self.generate_rows()
+        self.head = (self.head - 1) % self.height
+        self.tracks[:, self.head] = rows
+
+    def process(self, codes):
+        """
+        Apply the players actions, like score.process does for one game.
+
+        Args:
+            codes (numpy.ndarray): (games, players) actions codes.
+        """
+        g = self._games
+        x = self.x
+        y = self.y
+        codes = np.asarray(codes)
+        back = config.score_move_backward
+        forward = config.score_move_forward
+
+        # First handle right and left actions, they change in_lane status
+        x -= (codes == _LEFT) & (x > 0)
+        x += (codes == _RIGHT) & (x < self.width - 1)
+
+        # Players in their lane are processed first, keeping the player order
+        # otherwise, like the stable sort in score.process.
+        out_of_lane = x // config.cells_per_player != self.lane
+        order = np.argsort(out_of_lane, axis=1, kind="stable")
+
+        done_x = np.full((self.games, self.players), -1)
+        done_y = np.full((self.games, self.players), -1)
+
+        # Each rank depends on obstacles cleared and positions taken by the
+        # previous ranks, so ranks are processed in turn, games in parallel.
+        for rank in range(self.players):
+            p = order[:, rank]
+            px = x[g, p]
+            py = y[g, p]
+            action = codes[g, p]
+            row = (self.head + py) % self.height
+            obstacle = self.tracks[g, row, px]
+
+            jumped = (obstacle == _CRACK) & (action == _JUMP)
+            braked = (obstacle == _WATER) & (action == _BRAKE)
+            picked = (obstacle == _PENGUIN) & (action == _PICKUP)
+            hit = (
+                np.isin(obstacle, _HARD)
+                | ((obstacle == _CRACK) & ~jumped)
+                | ((obstacle == _WATER) & ~braked)
+            )
+
+            cleared = hit | picked
+            self.tracks[g[cleared], row[cleared], px[cleared]] = _NONE
+
+            points = np.where(hit, back, forward)
+            points += jumped * config.score_jump
+            points += braked * config.score_brake
+            points += picked * config.score_pickup
+
+            py = np.clip(py + hit, 2, self.height - 1)
+
+            # Fix up collisions with players processed before
+            collision = (
+                (done_x[:, :rank] == px[:, None]) & (done_y[:, :rank] == py[:, None])
+            ).any(axis=1)
+            points += collision * back
+            move_back = collision & (py < self.height - 1)
+            move_left = collision & ~move_back & (px > 0)
+            move_right = collision & ~move_back & ~move_left & (px < self.width - 1)
+            py = py + move_back
+            px = px - move_left + move_right
+
+            x[g, p] = px
+            y[g, p] = py
+            self.score[g, p] += points
+            self.hits[g, p] += hit
+            self.pickups[g, p] += picked
+            self.jumps[g, p] += jumped
+            self.breaks[g, p] += braked
+            done_x[:, rank] = px
+            done_y[:, rank] = py
+
+    def step(self, codes, rows=None):
+        """Go to the next game state, like logic.game_step"""
+        self.update(rows)
+        self.process(codes)
+
+    def run(self, policy, ticks=None):
+        """
+        Play ticks steps, asking policy for the actions of every step.
+
+        Args:
+            policy (callable): Called with this BatchGame before each step,
+                returns (games, players) actions codes.
+            ticks (int, optional): Defaults to config.game_duration.
+        """
+        if ticks is None:
+            ticks = config.game_duration
+        for tick in range(ticks):
+            self.step(policy(self))
+
+    def state(self):
+        """Return the players state arrays, keyed like Player.state()"""
+        return {
+            "x": self.x,
+            "y": self.y,
+            "score": self.score,
+            "pickups": self.pickups,
+            "hits": self.hits,
+            "breaks": self.breaks,
+            "jumps": self.jumps,
+        }
+
+
+def random_policy(rng):
+    """Return a policy choosing uniformly random actions"""
+
+    def policy(batch):
+        return rng.integers(0, len(actions.ALL), (batch.games, batch.players))
+
+    return policy
+
+
+def check_reference(games=8, ticks=100, players=None, seed=None):
+    """
+    Play random games on a BatchGame and on the scalar Track, Player and
+    score.process reference, and check they stay identical.
+
+    Raises:
+        AssertionError: When the engines disagree, naming the game and tick.
+    """
+    batch = BatchGame(games, players, seed=seed)
+    rng = np.random.default_rng(seed)
+    policy = random_policy(rng)
+
+    tracks = []
+    players_lists = []
+    for game in range(games):
+        t = track.Track()
+        tracks.append(t)
+        players_lists.append(
+            [player.Player(str(lane), 0, lane) for lane in range(batch.players)]
+        )
+
+    # The scalar track draws from the random module, keep its state intact
+    saved = random.getstate()
+    try:
+        for tick in range(ticks):
+            codes = policy(batch)
+            rows = batch.generate_rows()
+            batch.step(codes, rows)
+
+            for game in range(games):
+                t = tracks[game]
+                t.update()
+                for x, code in enumerate(rows[game]):
+                    t.set(x, 0, obstacles.decode(code))
+                for p, code in zip(players_lists[game], codes[game]):
+                    p.action = actions.decode(code)
+                    p.response_time = 0.0
+                score.process(players_lists[game], t)
+
+                expected = [[obstacles.encode(o) for o in r] for r in t.matrix()]
+                assert (
+                    batch.matrix()[game].tolist() == expected
+                ), f"track differs in game {game} at tick {tick}"
+                for i, p in enumerate(players_lists[game]):
+                    for key, values in batch.state().items():
+                        assert values[game, i] == getattr(p, key), (
+                            f"{key} of player {i} differs in game {game} "
+                            f"at tick {tick}"
+                        )
+    finally:
+        random.setstate(saved)
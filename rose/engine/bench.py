@@ -0,0 +1,334 @@
+"""Engine benchmarks, saved as JSON to compare between commits
+
+Run with `make bench`, or:
+
+    python -m rose.engine.bench --output bench.json --compare previous.json
+
+Each benchmark runs its operation `number` times per round, for `repeat`
+rounds, and reports the best, median and mean time per operation.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from rose.common import actions
+from rose.common import obstacles
+from rose.engine import config
+from rose.engine import headless
+from rose.engine import maps
+from rose.engine import net
+from rose.engine import score
+from rose.engine import stubdriver
+from rose.engine.delta import DeltaEncoder
+from rose.engine.player import Player
+from rose.engine.track import Track
+
+PLAYER_COUNTS = (1, 2, 4, 8, 16)
+# Track sizes as (height, players); the width is players * cells_per_player
+TRACK_SIZES = ((9, 2), (50, 4), (200, 8), (1000, 16))
+SPECTATOR_COUNTS = (1, 10, 100)
+
+
+@contextlib.contextmanager
+def track_size(height, players):
+    """Temporarily configure the track size and the number of players"""
+    saved = config.matrix_height, config.matrix_width, config.max_players
+    config.matrix_height = height
+    config.matrix_width = players * config.cells_per_player
+    config.max_players = players
+    try:
+        yield
+    finally:
+        config.matrix_height, config.matrix_width, config.max_players = saved
+
+
+def new_track(seed=0):
+    """Return a randomly generated track"""
+    track = Track(True, random.Random(seed))
+    for i in range(config.matrix_height):
+        track.update()
+    return track
+
+
+def new_players(count):
+    return [Player(str(lane), lane % 4, lane) for lane in range(count)]
+
+
+def measure(func, number, repeat):
+    """
+    Time func.
+
+    Returns:
+        dict: The best, median and mean seconds per call, with the number
+            and repeat used.
+    """
+    rounds = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        for j in range(number):
+            func()
+        rounds.append((time.perf_counter() - start) / number)
+    return {
+        "number": number,
+        "repeat": repeat,
+        "best": min(rounds),
+        "median": statistics.median(rounds),
+        "mean": statistics.mean(rounds),
+    }
+
+
+def bench_score(number, repeat):
+    """score.process, by number of players"""
+    results = []
+    for count in PLAYER_COUNTS:
+        with track_size(config.matrix_height, count):
+            track = new_track()
+            players = new_players(count)
+            rng = random.Random(0)
+
+            def process():
+                for player in players:
+                    player.action = rng.choice(actions.ALL)
+                    player.response_time = 0.0
+                score.process(players, track)
+
+            results.append(
+                {
+                    "name": "score.process",
+                    "params": {"players": count},
+                    **measure(process, number, repeat),
+                }
+            )
+    return results
+
+
+def bench_track(number, repeat):
+    """Track.update and Track.state, by track size"""
+    results = []
+    for height, players in TRACK_SIZES:
+        with track_size(height, players):
+            track = new_track()
+            params = {"height": height, "width": config.matrix_width}
+            results.append(
+                {
+                    "name": "Track.update",
+                    "params": params,
+                    **measure(track.update, number, repeat),
+                }
+            )
+            results.append(
+                {
+                    "name": "Track.state",
+                    "params": params,
+                    **measure(track.state, number, repeat),
+                }
+            )
+
+            # The same track size, playing a custom map as tall as the track
+            rows = [[obstacles.BIKE] * config.matrix_width for i in range(height)]
+            track.custom_map = maps.compile_rows(rows)
+            results.append(
+                {
+                    "name": "Track.update",
+                    "params": {**params, "custom_map": True},
+                    **measure(track.update, number, repeat),
+                }
+            )
+    return results
+
+
+class StubSpectator(object):
+    """A spectator that drops the updates, to time the encoding alone"""
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.needs_keyframe = True
+        self.received = 0
+
+    def wants_delta(self):
+        return self.protocol == "delta" and not self.needs_keyframe
+
+    def lagging(self):
+        return False
+
+    def offer(self, data):
+        self.received += len(data)
+
+
+def bench_broadcast(number, repeat):
+    """net.update_websockets, by protocol and number of spectators"""
+    results = []
+    state = {"rate": 1.0, "timeleft": 60, "game_seed": 0}
+    for protocol in ("full", "delta"):
+        for count in SPECTATOR_COUNTS:
+            track = new_track()
+            players = new_players(config.max_players)
+            spectators = {StubSpectator(protocol) for i in range(count)}
+            encoder = DeltaEncoder()
+
+            async def broadcast():
+                track.update()
+                await net.update_websockets(
+                    True, state, players, track, spectators, encoder
+                )
+
+            def step():
+                loop.run_until_complete(broadcast())
+
+            loop = asyncio.new_event_loop()
+            try:
+                results.append(
+                    {
+                        "name": "net.update_websockets",
+                        "params": {"protocol": protocol, "spectators": count},
+                        **measure(step, number, repeat),
+                    }
+                )
+            finally:
+                loop.close()
+    return results
+
+
+def bench_tick(number, repeat):
+    """A complete game step against local stub drivers"""
+
+    async def run():
+        runners = []
+        drivers = []
+        for name in ("A", "B"):
+            runner, url = await stubdriver.start(name)
+            runners.append(runner)
+            drivers.append(url)
+        try:
+            rounds = []
+            for i in range(repeat):
+                results = await headless.run_game(drivers, number, seed=i)
+                rounds.append(statistics.mean(results["timings"]))
+            return rounds
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+
+    rounds = asyncio.run(run())
+    return [
+        {
+            "name": "logic.game_step",
+            "params": {"drivers": 2},
+            "number": number,
+            "repeat": repeat,
+            "best": min(rounds),
+            "median": statistics.median(rounds),
+            "mean": statistics.mean(rounds),
+        }
+    ]
+
+
+BENCHMARKS = {
+    "score": bench_score,
+    "track": bench_track,
+    "broadcast": bench_broadcast,
+    "tick": bench_tick,
+}
+
+
+def run(names=None, number=200, repeat=5):
+    """
+    Run the benchmarks.
+
+    Args:
+        names (list, optional): Benchmarks to run, from BENCHMARKS. Defaults
+            to all of them.
+        number (int): Operations per round.
+        repeat (int): Rounds per benchmark.
+
+    Returns:
+        dict: The environment under "commit", "python" and "time", and the
+            results under "results".
+    """
+    results = []
+    for name in names or BENCHMARKS:
+        results.extend(BENCHMARKS[name](number, repeat))
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Return report lines of the median time of each benchmark, with its
+    ratio to the same benchmark in baseline when there is one.
+    """
+    previous = {
+        (r["name"], json.dumps(r["params"], sort_keys=True)): r
+        for r in baseline["results"]
+    }
+    lines = []
+    for r in results["results"]:
+        line = (
+            f"{r['name']:24} {json.dumps(r['params']):50} {r['median'] * 1e6:12.2f}us"
+        )
+        old = previous.get((r["name"], json.dumps(r["params"], sort_keys=True)))
+        if old is not None:
+            line += f" {r['median'] / old['median']:8.2f}x"
+        lines.append(line)
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the engine benchmarks.")
+    parser.add_argument(
+        "names",
+        nargs="*",
+        metavar="name",
+        help=f"Benchmarks to run: {', '.join(BENCHMARKS)}. Defaults to all",
+    )
+    parser.add_argument("--number", type=int, default=200, help="Operations per round")
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds per benchmark")
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    parser.add_argument(
+        "--compare", help="Show the ratio to the results in this JSON file"
+    )
+    args = parser.parse_args(argv)
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+
+    results = run(args.names, args.number, args.repeat)
+
+    baseline = {"results": []}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    for line in compare(results, baseline):
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
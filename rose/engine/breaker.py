@@ -0,0 +1,91 @@
+import logging
+import time
+
+from rose.engine import config
+
+log = logging.getLogger("breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker(object):
+    def __init__(self, name=""):
+        """
+        Creates a new CircuitBreaker, tracking the health of one driver.
+
+        The circuit opens after config.driver_breaker_threshold consecutive
+        failed requests, and the driver is skipped. Once the backoff delay
+        has passed, one probe request is let through: the circuit closes
+        when it succeeds, and opens again for twice as long when it fails,
+        up to config.driver_breaker_max_backoff.
+
+        Args:
+            name (str): The driver, for the logs.
+
+        Attributes:
+            status (str): "closed", "open" or "half_open" while probing.
+            failures (int): The number of consecutive failed requests.
+            backoff (float, optional): Seconds between probes while open.
+            opened (int): The number of times the circuit opened.
+        """
+        self.name = name
+        self.status = CLOSED
+        self.failures = 0
+        self.backoff = None
+        self.opened = 0
+        self._probe_at = None
+
+    def allow(self, now=None):
+        """Return True if a request should be sent to the driver"""
+        if self.status == CLOSED:
+            return True
+        if now is None:
+            now = time.monotonic()
+        if self.status == OPEN and now >= self._probe_at:
+            self.status = HALF_OPEN
+            return True
+        return False
+
+    def success(self):
+        """Record a successful request, closing the circuit"""
+        if self.status != CLOSED:
+            log.info("Driver %s recovered, closing its circuit", self.name)
+        self.status = CLOSED
+        self.failures = 0
+        self.backoff = None
+        self._probe_at = None
+
+    def failure(self, now=None):
+        """Record a failed request, opening the circuit when it is due"""
+        if now is None:
+            now = time.monotonic()
+        self.failures += 1
+        if self.status == HALF_OPEN:
+            self._open(min(self.backoff * 2, config.driver_breaker_max_backoff), now)
+        elif self.status == CLOSED and self.failures >= config.driver_breaker_threshold:
+            self.opened += 1
+            self._open(config.driver_breaker_backoff, now)
+
+    def state(self):
+        """Return read only serialize-able state for sending to client"""
+        return {
+            "state": self.status,
+            "failures": self.failures,
+            "backoff": self.backoff,
+            "opened": self.opened,
+        }
+
+    # Private
+
+    def _open(self, backoff, now):
+        log.warning(
+            "Driver %s failed %d times, skipping it for %0.1fs",
+            self.name,
+            self.failures,
+            backoff,
+        )
+        self.status = OPEN
+        self.backoff = backoff
+        self._probe_at = now + backoff
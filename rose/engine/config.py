@@ -18,3 +18,57 @@ score_move_backward = -10
 score_pickup = 10
 score_jump = 5
 score_brake = 4
+
+# Driver HTTP connection pool
+driver_connections_per_host = 4
+driver_keepalive_timeout = 30
+driver_dns_cache_ttl = 300
+
+# Driver response deadline, as a fraction of the tick period
+driver_deadline = 0.8
+# Action used when a driver misses its deadline: "none" or "last"
+driver_timeout_action = "none"
+# Driver circuit breaker: consecutive failures before a driver is skipped,
+# and the seconds between probe requests, doubling up to the maximum
+driver_breaker_threshold = 3
+driver_breaker_backoff = 1.0
+driver_breaker_max_backoff = 30.0
+
+# Delta websocket protocol: send a full keyframe every N updates
+ws_keyframe_interval = 30
+
+# Spectator outbound queue: updates queued before stale ones are coalesced
+ws_queue_size = 4
+# Consecutive coalesced updates before a lagging spectator is disconnected
+ws_max_lag = 10
+
+# Replay files: bytes buffered before writing, ticks between index entries
+replay_buffer_size = 65536
+replay_index_interval = 100
+
+# Sharded engine: virtual nodes per worker on the rooms hash ring, and the
+# seconds between checks restarting the workers that died
+supervisor_vnodes = 64
+supervisor_watchdog_interval = 1.0
+
+# Metrics: histogram buckets in seconds, and the recent samples kept for
+# driver response time quantiles
+metrics_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5]
+metrics_window = 1024
+metrics_quantiles = [0.5, 0.9, 0.99]
+
+# Tick scheduler, when the engine falls behind: "catchup" runs the missed
+# ticks back to back, up to tick_max_catchup of them, "skip" drops them
+tick_policy = "catchup"
+tick_max_catchup = 5
+
+# Tracing: the number of most recent spans kept
+trace_buffer_size = 100000
+
+# Custom maps directory, the first enabled CSV map in it is played
+map_dir = "map"
+# Largest custom map upload, in bytes
+map_max_size = 1024 * 1024
+# Named maps library database, and the number of compiled maps cached
+map_library = "map/maps.db"
+map_cache_size = 32
@@ -0,0 +1,94 @@
+"""Delta encoding of game state updates"""
+
+from rose.common import obstacles
+from rose.engine import config
+
+
+class DeltaEncoder(object):
+    def __init__(self, keyframe_interval=None):
+        """
+        Creates a new DeltaEncoder, remembering the last state sent to
+        spectators so the next update can be sent as a difference.
+
+        Args:
+            keyframe_interval (int, optional): Number of updates between full
+                keyframes. Defaults to config.ws_keyframe_interval.
+        """
+        if keyframe_interval is None:
+            keyframe_interval = config.ws_keyframe_interval
+        self.keyframe_interval = keyframe_interval
+        self._players = None
+        self._matrix = None
+        self._count = 0
+
+    def reset(self):
+        """Forget the previous state, the next update will be a keyframe"""
+        self._players = None
+        self._matrix = None
+        self._count = 0
+
+    def encode(self, started, state, players, track):
+        """
+        Remember the current game state and return the delta from the previous
+        one.
+
+        The track delta is the number of rows the track scrolled since the
+        previous update, followed by every cell that differs from the shifted
+        previous track; new rows scroll in empty, and cleared cells are sent
+        with an empty name.
+
+        Returns:
+            tuple: A tuple containing:
+                - bool: True if a keyframe is due for all delta spectators.
+                - dict: The delta payload, None when a keyframe is due.
+        """
+        player_states = [player.state() for player in players]
+        matrix = [tuple(row) for row in track.matrix()]
+        keyframe = (
+            self._players is None
+            or len(self._players) != len(player_states)
+            or self._count % self.keyframe_interval == 0
+        )
+
+        payload = None
+        if not keyframe:
+            shift = 1 if started else 0
+            payload = {
+                "started": started,
+                "rate": state["rate"],
+                "timeleft": state["timeleft"],
+                "players": self._players_delta(player_states),
+                "track": {
+                    "shift": shift,
+                    "set": self._track_delta(matrix, shift),
+                },
+            }
+
+        self._players = player_states
+        self._matrix = matrix
+        self._count += 1
+
+        return keyframe, payload
+
+    # Private
+
+    def _players_delta(self, player_states):
+        changes = []
+        for index, (old, new) in enumerate(zip(self._players, player_states)):
+            changed = {key: value for key, value in new.items() if old[key] != value}
+            if changed:
+                changed["index"] = index
+                changes.append(changed)
+        return changes
+
+    def _track_delta(self, matrix, shift):
+        empty = (obstacles.NONE,) * len(matrix[0]) if matrix else ()
+        cells = []
+        for y, row in enumerate(matrix):
+            old = self._matrix[y - shift] if y >= shift else empty
+            if row == old:
+                continue
+            for x, obs in enumerate(row):
+                if obs != old[x]:
+                    cells.append({"name": obs, "x": x, "y": y})
+        return cells
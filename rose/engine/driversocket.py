@@ -0,0 +1,90 @@
+import asyncio
+import json
+import logging
+
+log = logging.getLogger("driversocket")
+
+# Drivers entries naming a websocket driver connected to the room, "ws:name"
+PREFIX = "ws:"
+
+
+class DriverSocket(object):
+    def __init__(self, name):
+        """
+        Creates a new DriverSocket, a driver connected to the engine with a
+        persistent websocket instead of answering HTTP POST requests.
+
+        Each tick the engine pushes the same JSON document a POST request
+        would carry, with a "tick" sequence number, and the driver replies
+        on the same connection with the same JSON document as an HTTP
+        driver, echoing the tick. Replies to an earlier tick, arriving after
+        its deadline, are dropped.
+
+        The DriverSocket outlives the connection, so a driver reconnecting
+        under the same name keeps playing as the same player.
+
+        Args:
+            name (str): The driver name, unique in its room.
+        """
+        self.name = name
+        self.ws = None
+        self.tick = 0
+        self._waiter = None
+
+    @property
+    def connected(self):
+        return self.ws is not None
+
+    def attach(self, ws):
+        """Use a new driver connection, return False if one is connected"""
+        if self.ws is not None:
+            return False
+        self.ws = ws
+        log.info("Driver %s connected", self.name)
+        return True
+
+    def detach(self, ws):
+        """Forget a closed driver connection, failing its pending request"""
+        if self.ws is not ws:
+            return
+        self.ws = None
+        log.info("Driver %s disconnected", self.name)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_exception(ConnectionError("Driver disconnected"))
+
+    async def request(self, body):
+        """
+        Push the tick's state to the driver, and wait for its reply.
+
+        Args:
+            body (bytes): The driver request JSON document.
+
+        Returns:
+            dict: The decoded driver reply.
+        """
+        if self.ws is None:
+            raise ConnectionError("Driver not connected")
+        self.tick += 1
+        self._waiter = asyncio.get_running_loop().create_future()
+        try:
+            message = b'{"tick": %d, ' % self.tick + body[1:]
+            await self.ws.send_str(message.decode())
+            return await self._waiter
+        finally:
+            self._waiter = None
+
+    def receive(self, data):
+        """Handle a message from the driver"""
+        try:
+            reply = json.loads(data)
+        except ValueError:
+            log.warning("Driver %s sent invalid JSON", self.name)
+            return
+        if not isinstance(reply, dict) or reply.get("tick", self.tick) != self.tick:
+            return
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(reply)
+
+    def state(self):
+        """Return read only serialize-able state for sending to client"""
+        return {"name": self.name, "connected": self.connected, "tick": self.tick}
@@ -0,0 +1,92 @@
+"""Headless game runner"""
+
+import time
+
+from rose.engine import config
+from rose.engine import logic
+from rose.engine import net
+from rose.engine import replay
+
+
+async def run_game(
+    drivers,
+    ticks=None,
+    track_type="random",
+    rate=None,
+    seed=None,
+    replay_dir=None,
+    deadline=None,
+):
+    """
+    Run a complete game without a websocket server, as fast as the drivers
+    respond.
+
+    Each tick is a regular logic.game_step, with no spectators and no
+    sleeping between ticks.
+
+    Args:
+        drivers (list): List of driver URLs.
+        ticks (int, optional): Number of game ticks. Defaults to
+            config.game_duration.
+        track_type (str): Type of track can be "random" or "same".
+        rate (float, optional): Game rate used to derive the drivers deadline
+            as in a live game, when no deadline is given.
+        seed (int, optional): Seed for the game, None for a random seed.
+            Seeds are between 0 and replay.MAX_SEED.
+        replay_dir (str, optional): Directory to record the game replay in.
+        deadline (float, optional): Seconds each driver has to answer a tick,
+            a driver missing it plays config.driver_timeout_action. Defaults
+            to the deadline of the rate, or config.driver_deadline seconds.
+
+    Returns:
+        dict: The final players state under "players", the URL of each
+            player's driver under "drivers", the game seed under "seed", the
+            replay file under "replay", and the duration in seconds of each
+            tick under "timings".
+    """
+    replay.check_seed(seed)
+    if ticks is None:
+        ticks = config.game_duration
+    if deadline is None:
+        deadline = config.driver_deadline / (rate or 1)
+
+    state = {
+        "rate": rate,
+        "deadline": deadline,
+        "running": 1,
+        "reset": None,
+        "drivers": drivers,
+        "timeleft": None,
+        "track_type": track_type,
+        "seed": seed,
+        "replay_dir": replay_dir,
+    }
+    timings = []
+
+    session = net.create_session()
+    recorder = None
+    bodies = None
+    try:
+        track, players = await logic.initialize_game(state, session)
+        state["running"] = 1
+        state["timeleft"] = ticks
+        recorder = logic.open_recorder(state, players, track)
+
+        while state["timeleft"] > 0:
+            start = time.perf_counter()
+            bodies = await logic.game_step(
+                state, players, track, (), session, recorder=recorder, bodies=bodies
+            )
+            timings.append(time.perf_counter() - start)
+    finally:
+        await session.close()
+        if recorder is not None:
+            await recorder.close()
+
+    return {
+        "players": [player.state() for player in players],
+        "drivers": [player.URL for player in players],
+        "seed": state["game_seed"],
+        "replay": recorder.path if recorder is not None else None,
+        "timings": timings,
+    }
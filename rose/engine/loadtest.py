@@ -0,0 +1,413 @@
+"""Local load test, finding the engine scaling limits on one machine
+
+For each scenario, the harness starts:
+- an engine process;
+- a process running K stub drivers, answering after a latency drawn from a
+  distribution, and failing at a given error rate;
+- M websocket spectators, spread over the rooms.
+
+The drivers play in rooms of config.max_players. After a warmup, the
+harness measures the sustained tick rate, the percentage of overrun ticks,
+the spectators receive lag, and the engine CPU usage and peak RSS.
+
+    python -m rose.engine.loadtest --drivers 2 8 32 --spectators 0 100 \\
+        --rate 20 --duration 10 --latency exp:0.01 --error-rate 0.01
+
+Spectator lag is measured against the room's tick schedule: ticks are due on
+a fixed grid (see scheduler.TickScheduler), anchored on the earliest update
+received, so the lag of an update is how much later than that grid it
+arrived.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import random
+import re
+import socket
+import sys
+import time
+
+import aiohttp
+
+from rose.common import actions
+from rose.engine import config
+from rose.engine import server
+from rose.engine import stubdriver
+
+
+def parse_latency(spec):
+    """
+    Return a function drawing driver latencies in seconds.
+
+    Args:
+        spec (str): "const:s", "uniform:low,high", "exp:mean" or
+            "normal:mean,stddev"; negative draws are clamped to 0.
+
+    Raises:
+        ValueError: When the spec is invalid.
+    """
+    kind, _, params = spec.partition(":")
+    try:
+        values = [float(value) for value in params.split(",")] if params else []
+    except ValueError:
+        raise ValueError(f"Invalid latency: {spec}")
+
+    rng = random.Random()
+    if kind == "const" and len(values) == 1:
+        return lambda: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda: rng.uniform(*values)
+    if kind == "exp" and len(values) == 1:
+        return lambda: rng.expovariate(1 / values[0]) if values[0] else 0.0
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(0.0, rng.gauss(*values))
+    raise ValueError(f"Invalid latency: {spec}")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Stub drivers
+
+
+def run_drivers(count, latency, error_rate, conn):
+    """Drivers process entry point, sends the drivers URLs on conn"""
+    asyncio.run(serve_drivers(count, latency, error_rate, conn))
+
+
+async def serve_drivers(count, latency, error_rate, conn):
+    draw = parse_latency(latency)
+    rng = random.Random()
+    runners = []
+    urls = []
+
+    for index in range(count):
+        runner, url = await stubdriver.start(
+            f"load-{index}",
+            lambda: rng.choice(actions.ALL),
+            draw,
+            error_rate,
+            rng,
+        )
+        runners.append(runner)
+        urls.append(url)
+
+    conn.send(urls)
+    await asyncio.Event().wait()
+
+
+# Engine
+
+
+def run_engine(port, rate, log_level):
+    """Engine process entry point, games last as long as the load test"""
+    logging.basicConfig(level=log_level)
+    sys.stdout = open(os.devnull, "w")
+    config.game_duration = 2**31
+    asyncio.run(
+        server.run(port, "127.0.0.1", rate, False, [], "random", default_room=False)
+    )
+
+
+def process_stats(pid):
+    """
+    Return the CPU seconds used and the resident memory in bytes of a
+    process, from /proc.
+    """
+    with open(f"/proc/{pid}/stat") as f:
+        # The command name may contain spaces, fields are after it
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu, rss
+
+
+def parse_metrics(text, name):
+    """Return the sum of a metric samples, by room"""
+    values = {}
+    pattern = re.compile(rf'^{name}{{room="([^"]*)"[^}}]*}} (\S+)$')
+    for line in text.splitlines():
+        match = pattern.match(line)
+        if match:
+            room = match.group(1)
+            values[room] = values.get(room, 0) + float(match.group(2))
+    return values
+
+
+# Spectators
+
+
+async def watch(session, url, room, received, protocol):
+    """Record the arrival time of each update of a room"""
+    async with session.ws_connect(f"{url}/ws?room={room}&protocol={protocol}") as ws:
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            arrival = time.monotonic()
+            data = json.loads(msg.data)
+            if data["payload"].get("started"):
+                received.append((room, data["payload"]["timeleft"], arrival))
+
+
+def spectator_lags(received, rate):
+    """
+    Return the lag of each update against its room's tick schedule.
+
+    Args:
+        received (list): List of (room, timeleft, arrival) tuples.
+        rate (float): The game rate.
+    """
+    period = 1 / rate
+    anchors = {}
+    for room, timeleft, arrival in received:
+        # timeleft goes down by one every tick
+        anchor = arrival + timeleft * period
+        anchors[room] = min(anchors.get(room, anchor), anchor)
+    return [
+        arrival + timeleft * period - anchors[room]
+        for room, timeleft, arrival in received
+    ]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# Scenario
+
+
+async def measure(url, pid, drivers, spectators, rate, duration, warmup, protocol):
+    """Create the rooms, connect the spectators, and measure the engine"""
+    async with aiohttp.ClientSession() as session:
+        rooms = []
+        size = config.max_players
+        for index in range(math.ceil(len(drivers) / size)):
+            room = f"load-{index}"
+            room_drivers = ",".join(drivers[index * size : (index + 1) * size])
+            async with session.post(
+                f"{url}/admin?room={room}&create=1&drivers={room_drivers}"
+            ) as response:
+                response.raise_for_status()
+            rooms.append(room)
+
+        received = []
+        watchers = [
+            asyncio.create_task(
+                watch(session, url, rooms[i % len(rooms)], received, protocol)
+            )
+            for i in range(spectators if rooms else 0)
+        ]
+
+        for room in rooms:
+            await session.post(f"{url}/admin?room={room}&running=1")
+
+        await asyncio.sleep(warmup)
+        async with session.get(f"{url}/metrics") as response:
+            before = await response.text()
+        cpu_before, rss = process_stats(pid)
+        del received[:]
+        start = time.monotonic()
+
+        peak_rss = rss
+        while time.monotonic() - start < duration:
+            await asyncio.sleep(min(1.0, duration))
+            peak_rss = max(peak_rss, process_stats(pid)[1])
+
+        elapsed = time.monotonic() - start
+        cpu_after, rss = process_stats(pid)
+        async with session.get(f"{url}/metrics") as response:
+            after = await response.text()
+        samples = list(received)
+
+        for task in watchers:
+            task.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
+
+    def delta(name):
+        end = parse_metrics(after, name)
+        begin = parse_metrics(before, name)
+        return sum(end.get(room, 0) - begin.get(room, 0) for room in rooms)
+
+    ticks = delta("rose_tick_seconds_count")
+    overruns = delta("rose_tick_overruns_total")
+    lags = spectator_lags(samples, rate)
+    return {
+        "drivers": len(drivers),
+        "spectators": spectators,
+        "rooms": len(rooms),
+        "rate": rate,
+        "duration": elapsed,
+        "tick_rate": ticks / elapsed,
+        "target_tick_rate": rate * len(rooms),
+        "overrun_pct": 100 * overruns / ticks if ticks else None,
+        "skipped_ticks": delta("rose_ticks_skipped_total"),
+        "updates_received": len(samples),
+        "lag_p50": percentile(lags, 0.5),
+        "lag_p99": percentile(lags, 0.99),
+        "lag_max": max(lags) if lags else None,
+        "cpu_pct": 100 * (cpu_after - cpu_before) / elapsed,
+        "rss_mb": peak_rss / 2**20,
+    }
+
+
+async def wait_for_engine(url, timeout=10):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"{url}/rooms"):
+                    return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+def run_scenario(
+    drivers,
+    spectators,
+    rate=20.0,
+    duration=10.0,
+    warmup=2.0,
+    latency="const:0",
+    error_rate=0.0,
+    protocol="full",
+    log_level="CRITICAL",
+):
+    """
+    Run one load test scenario.
+
+    Args:
+        drivers (int): Number of stub drivers, K.
+        spectators (int): Number of websocket spectators, M.
+        rate (float): The game rate of every room.
+        duration (float): Measured seconds, after warmup seconds.
+        latency (str): Drivers latency distribution, see parse_latency.
+        error_rate (float): Fraction of driver requests failing.
+        protocol (str): The spectators protocol, "full" or "delta".
+        log_level (str): The engine logging level; driver errors are
+            logged on every request, so they are hidden by default.
+
+    Returns:
+        dict: The scenario parameters and measurements.
+    """
+    parse_latency(latency)
+    parent, child = multiprocessing.Pipe()
+    drivers_process = multiprocessing.Process(
+        target=run_drivers, args=(drivers, latency, error_rate, child), daemon=True
+    )
+    port = free_port()
+    engine = multiprocessing.Process(
+        target=run_engine, args=(port, rate, log_level), daemon=True
+    )
+    drivers_process.start()
+    engine.start()
+    try:
+        urls = parent.recv()
+        url = f"http://127.0.0.1:{port}"
+
+        async def run():
+            await wait_for_engine(url)
+            return await measure(
+                url, engine.pid, urls, spectators, rate, duration, warmup, protocol
+            )
+
+        result = asyncio.run(run())
+    finally:
+        for process in (engine, drivers_process):
+            process.terminate()
+            process.join()
+
+    result.update(latency=latency, error_rate=error_rate, protocol=protocol)
+    return result
+
+
+def format_result(result):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f}ms"
+
+    overrun = result["overrun_pct"]
+    return (
+        f"K={result['drivers']:<4} M={result['spectators']:<5} "
+        f"ticks/s {result['tick_rate']:7.1f}/{result['target_tick_rate']:<7.1f} "
+        f"overrun {'-' if overrun is None else f'{overrun:.1f}%':>6} "
+        f"lag p50 {ms(result['lag_p50']):>8} p99 {ms(result['lag_p99']):>8} "
+        f"cpu {result['cpu_pct']:5.1f}% rss {result['rss_mb']:.0f}MB"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the game engine.")
+    parser.add_argument(
+        "--drivers", type=int, nargs="+", default=[2], help="Numbers of drivers, K"
+    )
+    parser.add_argument(
+        "--spectators",
+        type=int,
+        nargs="+",
+        default=[0],
+        help="Numbers of spectators, M",
+    )
+    parser.add_argument("--rate", type=float, default=20.0, help="Game rate")
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Measured seconds per scenario"
+    )
+    parser.add_argument(
+        "--warmup", type=float, default=2.0, help="Seconds before measuring"
+    )
+    parser.add_argument(
+        "--latency",
+        default="const:0",
+        help="Drivers latency distribution: const:s, uniform:low,high, "
+        "exp:mean or normal:mean,stddev",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Driver errors fraction"
+    )
+    parser.add_argument("--protocol", choices=["full", "delta"], default="full")
+    parser.add_argument(
+        "--engine-log", default="CRITICAL", help="The engine logging level"
+    )
+    parser.add_argument("--output", help="Save the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        parse_latency(args.latency)
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = []
+    for drivers in args.drivers:
+        for spectators in args.spectators:
+            result = run_scenario(
+                drivers,
+                spectators,
+                args.rate,
+                args.duration,
+                args.warmup,
+                args.latency,
+                args.error_rate,
+                args.protocol,
+                args.engine_log.upper(),
+            )
+            print(format_result(result), flush=True)
+            results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
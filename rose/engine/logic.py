@@ -1,153 +1,423 @@
 import asyncio
 import logging
+import os
 import random
-import aiohttp
+import struct
+import time
 
 from rose.engine import config
+from rose.engine import driversocket
 
+from rose.engine import maplibrary
+from rose.engine import maps
+from rose.engine import metrics
 from rose.engine import score
+from rose.engine import tracing
 from rose.engine import net
+from rose.engine import replay
+from rose.engine.delta import DeltaEncoder
 from rose.engine.player import Player
+from rose.engine.scheduler import TickScheduler
 from rose.engine.track import Track
 
 log = logging.getLogger("logic")
 
 
-async def initialize_game(state):
-    """Reset game settings and return re-initialized track and players."""
+async def initialize_game(state, session, driver_sockets=None, breakers=None):
+    """
+    Reset game settings and return re-initialized track and players.
+
+    The game gets its own random generator, seeded with state["seed"], or
+    with a new random seed if it is None. The seed actually used is kept in
+    state["game_seed"], so the game can be replayed.
+    """
     state["reset"] = None
     state["running"] = 0
     state["timeleft"] = config.game_duration
-    track = initialize_track(state["track_type"] != "same")
-    players = await initialize_players(state["drivers"])
+    seed = state.get("seed")
+    if seed is None:
+        seed = random.randrange(2**32)
+    state["game_seed"] = seed
+    rng = random.Random(seed)
+    custom_map = await load_map(state)
+    track = initialize_track(state["track_type"] != "same", rng, custom_map)
+    players = await initialize_players(
+        state["drivers"], session, rng, driver_sockets, breakers
+    )
     return track, players
 
 
-def initialize_track(is_track_random):
+async def load_map(state):
+    """
+    Return the compiled custom map of the game, None for random rows.
+
+    The game plays state["map"] from the map library when it is set, and
+    the active map of the maps directory otherwise.
+    """
+    name = state.get("map")
+    if name:
+        custom_map = await maplibrary.library.get_async(name)
+        if custom_map is None:
+            log.warning("Map %s not found, using random rows", name)
+        return custom_map
+    return await maps.load_active_async()
+
+
+def initialize_track(is_track_random, rng=None, custom_map=None):
     """
     Initialize and return a new track.
 
     Args:
         is_track_random (bool): If False, the track will have the same obstacles for both players.
                                 If True, obstacles will be randomized.
+        rng (random.Random, optional): The game's random generator.
+        custom_map (CompiledMap, optional): The custom map to play.
 
     Returns:
         Track: An initialized track object.
     """
-    track = Track(is_track_random)
+    track = Track(is_track_random, rng, custom_map)
     track.reset()
     return track
 
 
-async def initialize_players(drivers):
+async def initialize_players(
+    drivers, session, rng=random, driver_sockets=None, breakers=None
+):
     """
     Asynchronously initialize players from a list of driver URLs.
 
+    The info request goes through the game's pooled session, so each
+    player starts the game with a warm connection to its driver. Drivers
+    named "ws:name" are websocket drivers connected to the room instead,
+    and play under their name.
+
     Args:
         drivers (list): List of driver URLs to initialize players from.
-        players (list): List of Player objects.
+        session (aiohttp.ClientSession): The game's pooled driver session.
+        rng (random.Random, optional): The game's random generator.
+        driver_sockets (dict, optional): The room's websocket drivers, by
+            name.
+        breakers (dict, optional): The room's driver circuit breakers, by
+            driver URL. Players of the same driver share its breaker across
+            games, and the breakers of drivers no longer listed are dropped.
+            None gives every player a new breaker.
+
+    Returns:
+        list: List of Player objects.
     """
 
     # Init players
     players = []
 
+    if breakers is not None:
+        for driver in [driver for driver in breakers if driver not in drivers]:
+            del breakers[driver]
+
     if not drivers:
         return players
 
-    base_color = random.randint(0, 3)
-
-    async with aiohttp.ClientSession() as session:
-        for index, driver in enumerate(drivers):
-            try:
-                async with session.get(driver) as info:
-                    info_data = await info.json()
-                    player_name = info_data.get("info", {}).get("name")
-                    player_car = (base_color + index) % 3
-                    player_lane = index
-                    player = Player(player_name, player_car, player_lane)
-                    player.reset()
-                    player.URL = driver
-                    players.append(player)
-            except Exception as e:
-                log.error(f"error: {e}")
+    base_color = rng.randint(0, 3)
+
+    for index, driver in enumerate(drivers):
+        if driver.startswith(driversocket.PREFIX):
+            name = driver[len(driversocket.PREFIX) :]
+            socket = (driver_sockets or {}).get(name)
+            if socket is None or not socket.connected:
+                log.error(f"error: driver {name} is not connected")
+                continue
+            player = Player(name, (base_color + index) % 3, index)
+            player.URL = driver
+            player.socket = socket
+            attach_breaker(player, breakers)
+            players.append(player)
+            continue
+
+        try:
+            async with session.get(driver) as info:
+                info_data = await info.json()
+                player_name = info_data.get("info", {}).get("name")
+                player_car = (base_color + index) % 3
+                player_lane = index
+                player = Player(player_name, player_car, player_lane)
+                player.reset()
+                player.URL = driver
+                attach_breaker(player, breakers)
+                players.append(player)
+        except Exception as e:
+            log.error(f"error: {e}")
 
     return players
 
 
-async def game_loop(state, active_websockets):
+def attach_breaker(player, breakers):
+    """Give a player the breaker of its driver, kept in breakers by URL"""
+    if breakers is None:
+        return
+    breaker = breakers.get(player.URL)
+    if breaker is None:
+        breaker = breakers[player.URL] = player.breaker
+    player.breaker = breaker
+
+
+def open_recorder(state, players, track):
+    """
+    Return a replay recorder for a new game, None if recording is disabled
+    or fails.
+
+    Args:
+        state (dict): Dictionary containing game state data, replays are
+            recorded into state["replay_dir"] when it is set.
+        players (list): List of Player objects.
+        track (Track): the game track.
+    """
+    replay_dir = state.get("replay_dir")
+    if not replay_dir:
+        return None
+    # A game that cannot be recorded is still played
+    try:
+        os.makedirs(replay_dir, exist_ok=True)
+        path = replay.replay_path(replay_dir, state["game_seed"])
+        return replay.ReplayRecorder(path, state, players, track)
+    except (OSError, struct.error) as e:
+        log.error("Failed to record the game replay: %s", e)
+        return None
+
+
+async def game_loop(
+    state, active_websockets, scheduler=None, driver_sockets=None, breakers=None
+):
     """
     Asynchronously execute the game loop, using provided state and active websockets.
 
     Args:
         state (dict): Dictionary containing game state data (rate, running status, time left, etc.).
         active_websockets (set): A set of active websocket connections for communication.
+        scheduler (TickScheduler, optional): Paces the game ticks.
+        driver_sockets (dict, optional): The room's websocket drivers, by
+            name.
+        breakers (dict, optional): The room's driver circuit breakers, by
+            driver URL, kept across games.
 
     Returns:
         None
     """
 
-    # Initialize or reset the game, set up track and players
-    track, players = await initialize_game(state)
-
-    # Begin the main game loop
-    while True:
-        # Check if the game needs a reset (based on state)
-        if state["reset"] == 1:
-            track, players = await initialize_game(state)
+    # The driver session is owned by the game, and replaced on every reset
+    session = net.create_session()
 
-        # Stop game if timeleft is zero
-        if state["timeleft"] < 1:
-            state["running"] = 0
+    # Remembers what spectators last saw, for the delta protocol
+    encoder = DeltaEncoder()
 
-        # Check if the game is currently running and there's time left to play
-        if state["running"] == 1:
-            # Start executing a step in the game
-            task = asyncio.create_task(
-                game_step(state, players, track, active_websockets)
-            )
+    # Records the game ticks, replaced on every reset
+    recorder = None
 
-            # Pause the game loop for a specified duration, based on the rate defined in the state
-            await asyncio.sleep(1 / state["rate"])
+    # Driver requests prepared by the previous step, dropped on every reset
+    # and pause since the admin API may change the game in between
+    bodies = None
 
-            # If for some reason the game step hasn't finished executing, cancel it
-            if not task.done():
-                task.cancel()
+    # Ticks are due on monotonic deadlines
+    if scheduler is None:
+        scheduler = TickScheduler(state.get("room", ""))
+    loop = asyncio.get_running_loop()
 
-        # If the game is not running (e.g., paused or finished)
-        else:
-            # Update all connected clients (via websockets) with the current game state
-            await net.update_websockets(False, state, players, track, active_websockets)
-
-            await asyncio.sleep(1)
-
-
-async def game_step(state, players, track, active_websockets):
+    try:
+        # Initialize or reset the game, set up track and players
+        track, players = await initialize_game(state, session, driver_sockets, breakers)
+        recorder = open_recorder(state, players, track)
+
+        # Begin the main game loop
+        while True:
+            # Check if the game needs a reset (based on state)
+            if state["reset"] == 1:
+                # Drop connections to the previous drivers before starting over
+                await session.close()
+                session = net.create_session()
+                track, players = await initialize_game(
+                    state, session, driver_sockets, breakers
+                )
+                encoder.reset()
+                if recorder is not None:
+                    await recorder.close()
+                recorder = open_recorder(state, players, track)
+                scheduler.reset()
+                bodies = None
+
+            # The custom map changed, play the new one from the next row
+            if state.get("reload_map") == 1:
+                state["reload_map"] = 0
+                track.set_map(await load_map(state))
+
+            # Stop game if timeleft is zero
+            if state["timeleft"] < 1:
+                state["running"] = 0
+
+            # Check if the game is currently running and there's time left to play
+            if state["running"] == 1:
+                # Wait for the tick deadline, the game rate may change between ticks
+                await scheduler.wait(state["rate"], state.get("tick_policy"))
+
+                # Execute a step in the game, which prepares the next one
+                bodies = await game_step(
+                    state,
+                    players,
+                    track,
+                    active_websockets,
+                    session,
+                    encoder,
+                    recorder,
+                    bodies,
+                )
+
+                # Driver fetches are bounded by their own deadline, so a late
+                # step was finishing up; the scheduler makes up for it
+                if loop.time() > scheduler.next_deadline():
+                    log.warning("Game step overran the tick period")
+                    metrics.tick_overruns.inc((state.get("room", ""),))
+
+            # If the game is not running (e.g., paused or finished)
+            else:
+                # Update all connected clients (via websockets) with the current game state
+                await net.update_websockets(
+                    False, state, players, track, active_websockets, encoder
+                )
+
+                # Ticks start over from the time the game resumes
+                scheduler.reset()
+                bodies = None
+                await asyncio.sleep(1)
+    finally:
+        await session.close()
+        if recorder is not None:
+            await recorder.close()
+
+
+async def game_step(
+    state,
+    players,
+    track,
+    active_websockets,
+    session,
+    encoder=None,
+    recorder=None,
+    bodies=None,
+):
     """
     Execute a game step: Update the track, fetch drivers' actions, process actions, and update websockets.
 
+    The phases are pipelined without changing their outcome: the track is
+    updated while the driver requests are in flight, since the requests
+    carry the track from before the update, and the next step's driver
+    requests are prepared once the players moved, so they are sent as soon
+    as the next step starts. Spectators send the update from their own
+    queues, overlapping with the next step.
+
     Args:
         state (dict): Dictionary containing game state data (rate, running status, etc.).
         players (list): List of Player objects.
         track (Track): the game track.
         active_websockets (Any): Active websockets for communication (assuming a suitable data structure).
+        session (aiohttp.ClientSession): The game's pooled driver session.
+        encoder (DeltaEncoder, optional): Delta encoder for spectator updates.
+        recorder (ReplayRecorder, optional): Records the step to a replay.
+        bodies (list, optional): The driver requests prepared by the
+            previous step, None to prepare them now.
+
+    Returns:
+        list: The driver requests for the next step.
     """
 
-    try:
-        # Fetch players actions using an asynchronous HTTP session
-        await net.fetch_drivers_actions(players, track.matrix())
+    room = state.get("room", "")
+    phases = metrics.tick_phase_seconds
+    fetch = None
 
-        # Update track
+    try:
+        start = time.perf_counter()
+
+        # Dispatch the players actions requests using the game's pooled HTTP
+        # session, each driver must answer within its share of the tick period
+        if bodies is None:
+            bodies = net.encode_driver_requests(players, track.matrix())
+        deadline = driver_deadline(state)
+        fetch_start = time.perf_counter()
+        fetch = asyncio.create_task(
+            net.fetch_drivers_actions(session, players, None, deadline, bodies)
+        )
+        # Let the requests go out before updating the track
+        await asyncio.sleep(0)
+
+        # Update track, while waiting for the drivers
+        track_start = time.perf_counter()
         track.update()
+        _phase_done(phases, room, "track", track_start)
+
+        await fetch
+        phase_start = _phase_done(phases, room, "fetch", fetch_start)
 
         # Process the actions of the players
+        if recorder is not None:
+            recorder.capture(players, track)
         score.process(players, track)
+        phase_start = _phase_done(phases, room, "score", phase_start)
+        if recorder is not None:
+            recorder.record(state, players, track)
 
         # Send data to all WebSocket connections
-        await net.update_websockets(True, state, players, track, active_websockets)
+        phase_start = time.perf_counter()
+        await net.update_websockets(
+            True, state, players, track, active_websockets, encoder
+        )
+        phase_start = _phase_done(phases, room, "broadcast", phase_start)
+
+        # Prepare the next step driver requests, from the state it starts with
+        bodies = net.encode_driver_requests(players, track.matrix())
+        _phase_done(phases, room, "prepare", phase_start)
 
         # Progress the game's timer
         state["timeleft"] -= 1
+        end = time.perf_counter()
+        metrics.tick_seconds.observe(end - start, (room,))
+        tracing.tracer.record(
+            "game_step", _trace_track(room), start, end, {"timeleft": state["timeleft"]}
+        )
+        return bodies
 
     except asyncio.CancelledError:
         log.info("Game step was canceled!")
+        metrics.ticks_cancelled.inc((room,))
         raise
+
+    finally:
+        # The drivers' requests never outlive their step
+        if fetch is not None and not fetch.done():
+            fetch.cancel()
+
+
+def _phase_done(histogram, room, phase, start):
+    """Record a game step phase duration, and return the phase end time"""
+    end = time.perf_counter()
+    histogram.observe(end - start, (room, phase))
+    tracing.tracer.record(phase, _trace_track(room), start, end)
+    return end
+
+
+def _trace_track(room):
+    return f"room {room}" if room else "game"
+
+
+def driver_deadline(state):
+    """
+    Return the time in seconds each driver has to answer in a game step.
+
+    Args:
+        state (dict): Dictionary containing game state data.
+
+    Returns:
+        float or None: The game's own deadline if it has one, otherwise the
+            share of the tick period, None if the game is not paced by a rate.
+    """
+    if state.get("deadline") is not None:
+        return state["deadline"]
+    if not state["rate"]:
+        return None
+    return config.driver_deadline / state["rate"]
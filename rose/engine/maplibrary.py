@@ -0,0 +1,227 @@
+"""Named custom maps, stored compiled in SQLite
+
+The map library keeps many maps by name, each with its compiled rows and its
+metadata, in one SQLite database in WAL mode, so the engine workers keep
+reading it while a map is added. Maps are looked up by their indexed name,
+and the most recently used compiled maps are kept in an LRU cache, so
+starting a game never parses a CSV file.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from rose.engine import config
+from rose.engine import maps
+
+log = logging.getLogger("maplibrary")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS maps (
+    name TEXT PRIMARY KEY,
+    width INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    obstacles TEXT NOT NULL,
+    rows BLOB NOT NULL,
+    random_cells TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+INFO_COLUMNS = "name, width, length, obstacles, created, updated"
+
+
+class MapLibrary(object):
+    def __init__(self, path=None, cache_size=None):
+        """
+        Creates a new MapLibrary, opening the database on first use.
+
+        Args:
+            path (str, optional): The database file. Defaults to
+                config.map_library.
+            cache_size (int, optional): The number of compiled maps kept.
+                Defaults to config.map_cache_size.
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self._db = None
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, name, compiled):
+        """
+        Store a compiled map, replacing the map of the same name.
+
+        Returns:
+            dict: The map metadata.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute(
+                    "INSERT INTO maps VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (name) DO UPDATE SET"
+                    " width = excluded.width, length = excluded.length,"
+                    " obstacles = excluded.obstacles, rows = excluded.rows,"
+                    " random_cells = excluded.random_cells,"
+                    " updated = excluded.updated",
+                    (
+                        name,
+                        compiled.width,
+                        len(compiled),
+                        json.dumps(compiled.histogram()),
+                        b"".join(compiled.rows),
+                        json.dumps(compiled.random_cells),
+                        now,
+                        now,
+                    ),
+                )
+            self._forget(name)
+        return self.info(name)
+
+    def get(self, name, width=None):
+        """
+        Return a compiled map, None if there is no map of this name.
+
+        Args:
+            name (str): The map name.
+            width (int, optional): The track width. Defaults to
+                config.matrix_width.
+        """
+        if width is None:
+            width = config.matrix_width
+        compiled = self.cached(name, width)
+        if compiled is not None:
+            return compiled
+
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT width, rows, random_cells FROM maps WHERE name = ?",
+                    (name,),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        compiled = decode(row).resize(width)
+
+        with self._lock:
+            self._cache[(name, width)] = compiled
+            self._cache.move_to_end((name, width))
+            while len(self._cache) > (self.cache_size or config.map_cache_size):
+                self._cache.popitem(last=False)
+        return compiled
+
+    def cached(self, name, width=None):
+        """Return a compiled map if it is in the cache, None otherwise"""
+        if width is None:
+            width = config.matrix_width
+        with self._lock:
+            compiled = self._cache.get((name, width))
+            if compiled is not None:
+                self._cache.move_to_end((name, width))
+            return compiled
+
+    async def get_async(self, name, width=None):
+        """Return a compiled map, read off the event loop when not cached"""
+        compiled = self.cached(name, width)
+        if compiled is not None:
+            return compiled
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get, name, width)
+
+    def info(self, name):
+        """Return the metadata of a map, None if there is no map of this name"""
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(f"SELECT {INFO_COLUMNS} FROM maps WHERE name = ?", (name,))
+                .fetchone()
+            )
+        return None if row is None else info(row)
+
+    def list(self):
+        """Return the metadata of all the maps, by name"""
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(f"SELECT {INFO_COLUMNS} FROM maps ORDER BY name")
+                .fetchall()
+            )
+        return [info(row) for row in rows]
+
+    def delete(self, name):
+        """Delete a map, return False if there is no map of this name"""
+        with self._lock:
+            db = self._connect()
+            with db:
+                deleted = db.execute("DELETE FROM maps WHERE name = ?", (name,))
+            self._forget(name)
+        return deleted.rowcount > 0
+
+    def clear_cache(self):
+        """Forget the compiled maps, after another process changed the library"""
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            self._cache.clear()
+
+    # Private
+
+    def _connect(self):
+        if self._db is None:
+            path = self.path or config.map_library
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("PRAGMA synchronous = NORMAL")
+            self._db.execute(SCHEMA)
+        return self._db
+
+    def _forget(self, name):
+        for key in [key for key in self._cache if key[0] == name]:
+            del self._cache[key]
+
+
+def decode(row):
+    """Return the CompiledMap of a (width, rows, random_cells) row"""
+    width, data, random_cells = row
+    return maps.CompiledMap(
+        tuple(data[i : i + width] for i in range(0, len(data), width)),
+        tuple(tuple(cells) for cells in json.loads(random_cells)),
+        width,
+        None,
+        None,
+    )
+
+
+def info(row):
+    name, width, length, obstacles, created, updated = row
+    return {
+        "name": name,
+        "width": width,
+        "length": length,
+        "obstacles": json.loads(obstacles),
+        "created": created,
+        "updated": updated,
+    }
+
+
+# The engine map library
+library = MapLibrary()
@@ -0,0 +1,364 @@
+"""Custom maps, compiled once and cached
+
+A custom map is a CSV file with one track row per line, and one obstacle
+name per cell. Maps are compiled into an immutable CompiledMap holding each
+row as obstacle codes, so a game only has to index it on every tick.
+Compiled maps are cached by path, and recompiled when the file changes.
+"""
+
+import asyncio
+import codecs
+import collections
+import csv
+import logging
+import os
+import tempfile
+import threading
+
+from rose.common import obstacles
+from rose.engine import config
+
+log = logging.getLogger("maps")
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class CompiledMap(
+    collections.namedtuple(
+        "CompiledMap", ["rows", "random_cells", "width", "path", "mtime"]
+    )
+):
+    """
+    An immutable compiled custom map.
+
+    Attributes:
+        rows (tuple): Each row's obstacle codes, as bytes of the track width.
+        random_cells (tuple): For each row, the tuple of the x positions of
+            its invalid cells, which get a random obstacle instead.
+        width (int): The track width the map was compiled for.
+        path (str, optional): The map file.
+        mtime (int, optional): The map file modification time, in ns.
+    """
+
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def fill(self, index, row):
+        """
+        Fill a track row in place with the map row at index.
+
+        Random cells are left empty, a track plays the map returned by
+        draw().
+
+        Args:
+            index (int): The map row, wraps around the map length.
+            row (memoryview): The track row to fill.
+        """
+        row[:] = self.rows[index % len(self.rows)]
+
+    def draw(self, rng):
+        """
+        Return the map with an obstacle drawn for each random cell.
+
+        The obstacles are drawn once, so they stay in place every time the
+        track loops over the map.
+
+        Args:
+            rng (random.Random): The game's random generator.
+        """
+        if not any(self.random_cells):
+            return self
+        rows = []
+        for row, cells in zip(self.rows, self.random_cells):
+            row = bytearray(row)
+            for x in cells:
+                row[x] = obstacles.CODES[obstacles.get_random_obstacle(rng)]
+            rows.append(bytes(row))
+        return CompiledMap(
+            tuple(rows), tuple(() for _ in rows), self.width, self.path, self.mtime
+        )
+
+    def histogram(self):
+        """Return the number of cells of each obstacle, and of random cells"""
+        counts = collections.Counter()
+        for row in self.rows:
+            counts.update(row)
+        counts.pop(obstacles.CODES[obstacles.NONE], None)
+        result = {obstacles.ALL[code]: count for code, count in sorted(counts.items())}
+        randoms = sum(len(cells) for cells in self.random_cells)
+        if randoms:
+            result["random"] = randoms
+        return result
+
+    def resize(self, width):
+        """Return the map for another track width, truncating or padding rows"""
+        if width == self.width:
+            return self
+        padding = bytes(max(0, width - self.width))
+        return CompiledMap(
+            tuple(row[:width] + padding for row in self.rows),
+            tuple(tuple(x for x in cells if x < width) for cells in self.random_cells),
+            width,
+            self.path,
+            self.mtime,
+        )
+
+
+def parse_cell(value):
+    """Return the obstacle named by a map cell, None if it is invalid"""
+    name = value.strip().strip('"').strip().lower()
+    if name in obstacles.CODES:
+        return name
+    return None
+
+
+class MapCompiler(object):
+    def __init__(self, width=None, strict=False):
+        """
+        Creates a new MapCompiler, compiling a map one row at a time.
+
+        Cells beyond the track width are ignored, and missing cells are
+        empty.
+
+        Args:
+            width (int, optional): The track width. Defaults to
+                config.matrix_width.
+            strict (bool): Raise ValueError on invalid cells, instead of
+                giving them a random obstacle.
+        """
+        self.width = config.matrix_width if width is None else width
+        self.strict = strict
+        self.invalid = 0
+        self._rows = []
+        self._random_cells = []
+
+    def add(self, cells):
+        """Compile the next row, from a list of cell strings"""
+        codes = bytearray(self.width)
+        randoms = []
+        for x, value in enumerate(cells[: self.width]):
+            obstacle = parse_cell(value)
+            if obstacle is not None:
+                codes[x] = obstacles.CODES[obstacle]
+            elif self.strict:
+                raise ValueError(
+                    f"Invalid obstacle {value!r} in row {len(self._rows) + 1}"
+                )
+            else:
+                randoms.append(x)
+        self.invalid += len(randoms)
+        self._rows.append(bytes(codes))
+        self._random_cells.append(tuple(randoms))
+
+    def result(self, path=None, mtime=None):
+        """Return the CompiledMap, None if there are no rows"""
+        if not self._rows:
+            return None
+        return CompiledMap(
+            tuple(self._rows), tuple(self._random_cells), self.width, path, mtime
+        )
+
+
+def compile_rows(rows, width=None, path=None, mtime=None):
+    """
+    Compile map rows.
+
+    Invalid cells are logged, and get a random obstacle in the game.
+
+    Args:
+        rows (iterable): The map rows, each a list of cell strings.
+        width (int, optional): The track width. Defaults to
+            config.matrix_width.
+
+    Returns:
+        CompiledMap: The compiled map, None if there are no rows.
+    """
+    compiler = MapCompiler(width)
+    for cells in rows:
+        compiler.add(cells)
+    if compiler.invalid:
+        log.warning("%s: %d invalid map obstacles", path or "map", compiler.invalid)
+    return compiler.result(path, mtime)
+
+
+def read_map(path, width=None):
+    """Read and compile a map file, None if it is empty"""
+    with open(path, newline="", encoding="utf-8") as f:
+        mtime = os.fstat(f.fileno()).st_mtime_ns
+        return compile_rows(csv.reader(f, skipinitialspace=True), width, path, mtime)
+
+
+def load(path, width=None):
+    """
+    Return the compiled map of a file, compiling it only if the cached one
+    is missing or out of date.
+    """
+    if width is None:
+        width = config.matrix_width
+    mtime = os.stat(path).st_mtime_ns
+    key = (path, width)
+
+    with _lock:
+        cached = _cache.get(key)
+    if cached is not None and cached.mtime == mtime:
+        return cached
+
+    compiled = read_map(path, width)
+    with _lock:
+        _cache[key] = compiled
+    return compiled
+
+
+class MapTooLarge(ValueError):
+    pass
+
+
+class MapUpload(object):
+    def __init__(self, path=None, limit=None):
+        """
+        Creates a new MapUpload, receiving a map file in chunks.
+
+        Chunks are written to a temporary file next to path, and compiled
+        as their lines complete, so an invalid map fails early and a large
+        one is never held in memory. commit() atomically replaces path with
+        the new map.
+
+        Args:
+            path (str, optional): The map file to replace. Without it the
+                map is only compiled.
+            limit (int, optional): The maximum map size in bytes. Defaults
+                to config.map_max_size.
+        """
+        self.path = path
+        self.limit = config.map_max_size if limit is None else limit
+        self.size = 0
+        self._file = None
+        if path is not None:
+            directory = os.path.dirname(path) or "."
+            os.makedirs(directory, exist_ok=True)
+            self._file = tempfile.NamedTemporaryFile(
+                dir=directory, prefix=".upload-", suffix=".part", delete=False
+            )
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._line = ""
+        self._compiler = MapCompiler(strict=True)
+
+    def write(self, chunk):
+        """
+        Receive the next chunk of the map.
+
+        Raises:
+            MapTooLarge: When the map grows past the size limit.
+            ValueError: When the map is not valid.
+        """
+        self.size += len(chunk)
+        if self.size > self.limit:
+            raise MapTooLarge(f"Map larger than {self.limit} bytes")
+        if self._file is not None:
+            self._file.write(chunk)
+        try:
+            text = self._line + self._decoder.decode(chunk)
+        except UnicodeDecodeError:
+            raise ValueError("Map is not UTF-8 text")
+        *lines, self._line = text.split("\n")
+        for line in lines:
+            self._add_line(line)
+
+    def commit(self):
+        """
+        Validate the end of the map, and replace the map file with it.
+
+        Returns:
+            CompiledMap: The new map, also stored in the maps cache when it
+                replaced a map file.
+        """
+        try:
+            self._line += self._decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            raise ValueError("Map is not UTF-8 text")
+        if self._line:
+            self._add_line(self._line)
+            self._line = ""
+
+        if self._compiler.result() is None:
+            raise ValueError("Map is empty")
+        if self._file is None:
+            return self._compiler.result()
+
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._file.name, self.path)
+
+        compiled = self._compiler.result(self.path, os.stat(self.path).st_mtime_ns)
+        with _lock:
+            _cache[(self.path, compiled.width)] = compiled
+        return compiled
+
+    def abort(self):
+        """Drop the received chunks"""
+        if self._file is None:
+            return
+        self._file.close()
+        try:
+            os.unlink(self._file.name)
+        except FileNotFoundError:
+            pass
+
+    # Private
+
+    def _add_line(self, line):
+        try:
+            cells = next(csv.reader([line.rstrip("\r")], skipinitialspace=True), [])
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV in row {len(self._compiler._rows) + 1}: {e}")
+        self._compiler.add(cells)
+
+
+def active_map_path(directory=None):
+    """
+    Return the path of the active custom map, None if there is none.
+
+    Hidden files are skipped, such as the maps being uploaded.
+
+    Args:
+        directory (str, optional): Defaults to config.map_dir.
+    """
+    if directory is None:
+        directory = config.map_dir
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return None
+    for name in names:
+        if name.startswith("."):
+            continue
+        if name.endswith(".csv") and "disabled" not in name:
+            return os.path.join(directory, name)
+    return None
+
+
+def load_active():
+    """Return the compiled active custom map, None if there is none"""
+    path = active_map_path()
+    if path is None:
+        return None
+    try:
+        return load(path)
+    except (OSError, csv.Error, UnicodeDecodeError) as e:
+        log.error("Failed to load map %s: %s", path, e)
+        return None
+
+
+async def load_active_async():
+    """Return the compiled active custom map, loaded off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, load_active)
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
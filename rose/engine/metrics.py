@@ -0,0 +1,222 @@
+"""Engine metrics, exposed in the Prometheus text format on /metrics
+
+Recording a sample is a dict lookup and a few additions, cheap enough to
+stay on in production; the text is only rendered when /metrics is scraped.
+"""
+
+import bisect
+import collections
+
+from rose.engine import config
+
+# Every metric, in registration order
+registry = []
+
+
+class Counter(object):
+    def __init__(self, name, help, labels=()):
+        """
+        Creates a new Counter, a value that only goes up.
+
+        Args:
+            name (str): The metric name.
+            help (str): The metric description.
+            labels (tuple): The label names, values are given as a tuple of
+                the same length when recording.
+        """
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = collections.defaultdict(float)
+        registry.append(self)
+
+    def inc(self, labels=(), value=1):
+        self.values[labels] += value
+
+    def clear(self):
+        self.values.clear()
+
+    def render(self):
+        lines = self._header("counter")
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value:g}")
+        return lines
+
+    # Private
+
+    def _header(self, kind):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {kind}"]
+
+
+class Gauge(Counter):
+    """A value that goes up and down"""
+
+    def set(self, value, labels=()):
+        self.values[labels] = value
+
+    def render(self):
+        lines = self._header("gauge")
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class Histogram(Counter):
+    def __init__(self, name, help, labels=(), buckets=None):
+        """
+        Creates a new Histogram, counting samples in cumulative buckets.
+
+        Args:
+            buckets (list, optional): Sorted upper bounds of the buckets.
+                Defaults to config.metrics_buckets.
+        """
+        super().__init__(name, help, labels)
+        self.buckets = list(buckets or config.metrics_buckets)
+        self.values = {}
+
+    def observe(self, value, labels=()):
+        counts = self.values.get(labels)
+        if counts is None:
+            # One count per bucket, then the +Inf bucket, count and sum
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-2] += 1
+        counts[-1] += value
+
+    def render(self):
+        lines = self._header("histogram")
+        for labels, counts in self.values.items():
+            total = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                total += count
+                le = _labels(self.labels + ("le",), labels + (f"{bound}",))
+                lines.append(f"{self.name}_bucket{le} {total}")
+            names = _labels(self.labels, labels)
+            lines.append(f"{self.name}_count{names} {counts[-2]}")
+            lines.append(f"{self.name}_sum{names} {counts[-1]:g}")
+        return lines
+
+
+class Summary(Counter):
+    def __init__(self, name, help, labels=(), window=None):
+        """
+        Creates a new Summary, reporting quantiles of the recent samples.
+
+        Args:
+            window (int, optional): The number of recent samples kept for
+                each labels values. Defaults to config.metrics_window.
+        """
+        super().__init__(name, help, labels)
+        self.window = window or config.metrics_window
+        self.values = {}
+        self.totals = {}
+
+    def observe(self, value, labels=()):
+        samples = self.values.get(labels)
+        if samples is None:
+            samples = self.values[labels] = collections.deque(maxlen=self.window)
+            self.totals[labels] = [0, 0.0]
+        samples.append(value)
+        totals = self.totals[labels]
+        totals[0] += 1
+        totals[1] += value
+
+    def clear(self):
+        self.values.clear()
+        self.totals.clear()
+
+    def quantile(self, q, labels=()):
+        """Return the q quantile of the recent samples, None if there are none"""
+        samples = self.values.get(labels)
+        if not samples:
+            return None
+        return _quantile(sorted(samples), q)
+
+    def render(self):
+        lines = self._header("summary")
+        for labels, samples in self.values.items():
+            ordered = sorted(samples)
+            for q in config.metrics_quantiles:
+                names = _labels(self.labels + ("quantile",), labels + (f"{q}",))
+                lines.append(f"{self.name}{names} {_quantile(ordered, q):g}")
+            count, total = self.totals[labels]
+            names = _labels(self.labels, labels)
+            lines.append(f"{self.name}_count{names} {count}")
+            lines.append(f"{self.name}_sum{names} {total:g}")
+        return lines
+
+
+def render():
+    """Return all the metrics in the Prometheus text format"""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    """Reset all the metrics"""
+    for metric in registry:
+        metric.clear()
+
+
+def _quantile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Engine metrics
+
+tick_seconds = Histogram("rose_tick_seconds", "Duration of the game steps", ("room",))
+tick_phase_seconds = Histogram(
+    "rose_tick_phase_seconds",
+    "Duration of each game step phase: fetch, track, score, broadcast",
+    ("room", "phase"),
+)
+tick_overruns = Counter(
+    "rose_tick_overruns_total",
+    "Game steps that did not finish within the tick period",
+    ("room",),
+)
+ticks_cancelled = Counter(
+    "rose_ticks_cancelled_total", "Game steps cancelled before finishing", ("room",)
+)
+driver_response_seconds = Summary(
+    "rose_driver_response_seconds", "Driver response time", ("driver",)
+)
+driver_errors = Counter(
+    "rose_driver_errors_total",
+    "Driver requests that failed: timeout, request or response",
+    ("driver", "error"),
+)
+driver_requests_skipped = Counter(
+    "rose_driver_requests_skipped_total",
+    "Driver requests skipped while the driver circuit is open",
+    ("driver",),
+)
+websocket_clients = Gauge("rose_websocket_clients", "Connected spectators", ("room",))
+websocket_messages_sent = Counter(
+    "rose_websocket_messages_sent_total", "Updates sent to spectators"
+)
+websocket_bytes_sent = Counter(
+    "rose_websocket_bytes_sent_total", "Update bytes sent to spectators"
+)
+tick_lateness_seconds = Histogram(
+    "rose_tick_lateness_seconds", "How late the ticks started", ("room",)
+)
+tick_jitter_seconds = Gauge(
+    "rose_tick_jitter_seconds", "Smoothed tick lateness variation", ("room",)
+)
+ticks_skipped = Counter(
+    "rose_ticks_skipped_total", "Missed ticks dropped by the scheduler", ("room",)
+)
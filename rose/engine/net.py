@@ -4,37 +4,107 @@ import json
 import time
 import logging
 
+from rose.common import actions
+from rose.engine import config
+from rose.engine import metrics
+from rose.engine import tracing
 
 log = logging.getLogger("net")
 
 
-async def fetch_drivers_actions(players, track_matrix):
+def create_session():
+    """
+    Create the pooled HTTP client session used to talk to the drivers.
+
+    The session is meant to live as long as a game: connections to each
+    driver are kept alive between ticks, and DNS lookups are cached, so
+    only the first request to a driver pays for connection setup.
+
+    Returns:
+        aiohttp.ClientSession: A new session; the caller must close it.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=0,
+        limit_per_host=config.driver_connections_per_host,
+        keepalive_timeout=config.driver_keepalive_timeout,
+        ttl_dns_cache=config.driver_dns_cache_ttl,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def fetch_drivers_actions(
+    session, players, track_matrix, timeout=None, bodies=None
+):
     """
     Asynchronously fetch actions for each player.
 
     Args:
+        session (aiohttp.ClientSession): The game's pooled driver session.
         players (list): List of Player objects.
         track_matrix (list of list): The matrix representation a 2D array of the track.
+        timeout (float, optional): Deadline in seconds for each driver.
+        bodies (list, optional): Request bodies prepared with
+            encode_driver_requests, in players order. Encoded from
+            track_matrix when not given.
 
     Returns:
         list: List of player actions fetched.
     """
-    async with aiohttp.ClientSession() as session:
-        await asyncio.gather(
-            *(fetch_driver_action(session, player, track_matrix) for player in players),
-            return_exceptions=True,
-        )
+    if bodies is None:
+        bodies = encode_driver_requests(players, track_matrix)
+    await asyncio.gather(
+        *(
+            fetch_driver_action(session, player, track_matrix, timeout, body)
+            for player, body in zip(players, bodies)
+        ),
+        return_exceptions=True,
+    )
 
 
-async def fetch_driver_action(session, player, track_matrix):
+def encode_driver_requests(players, track_matrix):
     """
-    Asynchronously fetch content from a URL using a POST request and return the parsed JSON
-    along with the time it took to get the response.
+    Return the POST request body for each player's driver.
+
+    The track is JSON encoded once and shared by all the bodies, which are
+    the same bytes as encoding each player's request on its own.
+
+    Args:
+        players (list): List of Player objects.
+        track_matrix (list of list): The matrix representation a 2D array of the track.
+
+    Returns:
+        list: List of bytes, in players order.
+    """
+    track_json = json.dumps(track_matrix)
+    return [
+        (
+            f'{{"info": {{"car": {{"x": {player.x}, "y": {player.y}}}}}, '
+            f'"track": {track_json}}}'
+        ).encode()
+        for player in players
+    ]
+
+
+async def fetch_driver_action(session, player, track_matrix, timeout=None, body=None):
+    """
+    Asynchronously fetch content from a URL using a POST request, or from a
+    websocket driver, and return the parsed JSON along with the time it took
+    to get the response. Both are timed the same way.
+
+    A driver that does not answer within timeout seconds gets the fallback
+    action from config.driver_timeout_action, and its late_responses counter
+    is incremented.
+
+    Failed requests are recorded by the player's circuit breaker; while the
+    circuit is open the driver is skipped and gets no action, except for
+    the breaker's probe requests.
 
     Args:
         session (aiohttp.ClientSession): An active ClientSession for making the request.
         player (Player): The player object containing name, URL, and position.
         track_matrix (list of list): The matrix representation a 2D array of the track.
+        timeout (float, optional): Deadline in seconds, None to wait forever.
+        body (bytes, optional): The prepared request body.
 
     Returns:
         tuple: A tuple containing:
@@ -42,11 +112,40 @@ async def fetch_driver_action(session, player, track_matrix):
             - float: The time taken (in seconds) to get the response.
             - str or None: The error message, if any. None if no error occurred.
     """
+    if not player.breaker.allow():
+        return skip_driver(player)
+
     start_time = time.time()
+    trace_start = time.perf_counter()
 
     try:
-        response_data = await send_post_request(session, player, track_matrix)
-        return process_driver_response(player, response_data, start_time)
+        response_data = await asyncio.wait_for(
+            send_driver_request(session, player, track_matrix, body), timeout
+        )
+        result = process_driver_response(player, response_data, start_time)
+        if player.httperror is not None:
+            metrics.driver_errors.inc((player.URL, "response"))
+            player.breaker.failure()
+        else:
+            player.breaker.success()
+        metrics.driver_response_seconds.observe(player.response_time, (player.URL,))
+        trace_request(player, trace_start, player.httperror)
+        return result
+
+    except asyncio.TimeoutError:
+        elapsed_time = time.time() - start_time
+        player.response_time = elapsed_time
+        log.warning("Driver %s missed the %0.3fs deadline", player.name, timeout)
+
+        player.late_responses += 1
+        player.action = timeout_action(player)
+        player.httperror = "Driver response timeout"
+        player.breaker.failure()
+        metrics.driver_errors.inc((player.URL, "timeout"))
+        metrics.driver_response_seconds.observe(elapsed_time, (player.URL,))
+        trace_request(player, trace_start, player.httperror)
+
+        return None, elapsed_time
 
     except Exception as e:
         elapsed_time = time.time() - start_time
@@ -56,14 +155,50 @@ async def fetch_driver_action(session, player, track_matrix):
 
         player.action = None
         player.httperror = "Error POST to driver"
+        player.breaker.failure()
+        metrics.driver_errors.inc((player.URL, "request"))
+        metrics.driver_response_seconds.observe(elapsed_time, (player.URL,))
+        trace_request(player, trace_start, error_msg)
 
         return None, elapsed_time
 
 
-async def send_post_request(session, player, track_matrix):
-    data = {"info": {"car": {"x": player.x, "y": player.y}}, "track": track_matrix}
+def skip_driver(player):
+    """Give no action to a player whose driver circuit is open, without a request"""
+    player.action = actions.NONE
+    player.response_time = None
+    player.httperror = "Driver circuit open"
+    metrics.driver_requests_skipped.inc((player.URL,))
+    return None, 0.0
 
-    async with session.post(player.URL, data=json.dumps(data).encode()) as response:
+
+def trace_request(player, start, error):
+    """Record a driver request span on the driver's timeline"""
+    if tracing.tracer.enabled:
+        tracing.tracer.record(
+            "POST" if player.socket is None else "WS",
+            f"driver {player.URL}",
+            start,
+            time.perf_counter(),
+            {"name": player.name, "action": player.action, "error": error},
+        )
+
+
+async def send_driver_request(session, player, track_matrix, body=None):
+    """Send the driver request over the driver's websocket, or with a POST"""
+    if player.socket is None:
+        return await send_post_request(session, player, track_matrix, body)
+    if body is None:
+        body = encode_driver_requests([player], track_matrix)[0]
+    return await player.socket.request(body)
+
+
+async def send_post_request(session, player, track_matrix, body=None):
+    if body is None:
+        data = {"info": {"car": {"x": player.x, "y": player.y}}, "track": track_matrix}
+        body = json.dumps(data).encode()
+
+    async with session.post(player.URL, data=body) as response:
         return await response.json()
 
 
@@ -74,6 +209,7 @@ def process_driver_response(player, response_data, start_time):
     try:
         player.name = response_data.get("info").get("name")
         player.action = response_data.get("info").get("action")
+        player.last_action = player.action
         player.httperror = None
         return response_data, elapsed_time
 
@@ -87,27 +223,89 @@ def process_driver_response(player, response_data, start_time):
         return None, elapsed_time
 
 
-async def update_websockets(started, state, players, track, active_websockets):
-    """Generate game state data and send it to all active websockets."""
-    data = {
+def timeout_action(player):
+    """Return the action to use for a player whose driver missed its deadline."""
+    if config.driver_timeout_action == "last":
+        return player.last_action
+    return actions.NONE
+
+
+def update_data(started, state, players, track):
+    """Return the complete game state update message."""
+    return {
         "action": "update",
         "payload": {
             "started": started,
             "rate": state["rate"],
             "timeleft": state["timeleft"],
+            "seed": state.get("game_seed"),
             "players": [player.state() for player in players],
             "track": track.state(),
         },
     }
 
-    await send_to_all_websockets(data, active_websockets)
+
+async def update_websockets(
+    started, state, players, track, active_websockets, encoder=None
+):
+    """
+    Generate game state data and send it to all active websockets.
+
+    When a delta encoder is given, spectators using the delta protocol get
+    only the changes since the previous update, except when a keyframe is
+    due or they have not received a complete state yet.
+    """
+    if not active_websockets:
+        return
+
+    coalesce_lagging_websockets(active_websockets)
+
+    if encoder is None:
+        data = update_data(started, state, players, track)
+        await send_to_all_websockets(data, active_websockets)
+        return
+
+    keyframe, delta = encoder.encode(started, state, players, track)
+    if keyframe:
+        for ws in active_websockets:
+            ws.needs_keyframe = True
+
+    delta_websockets = [ws for ws in active_websockets if ws.wants_delta()]
+    full_websockets = [ws for ws in active_websockets if not ws.wants_delta()]
+
+    if delta_websockets:
+        data = {"action": "delta", "payload": delta}
+        await send_to_all_websockets(data, delta_websockets)
+
+    if full_websockets:
+        data = update_data(started, state, players, track)
+        await send_to_all_websockets(data, full_websockets)
+        for ws in full_websockets:
+            ws.needs_keyframe = False
+
+
+def coalesce_lagging_websockets(active_websockets):
+    """
+    Drop the stale queued updates of spectators that fell behind, and
+    disconnect the ones that keep lagging.
+    """
+    for ws in active_websockets:
+        if not ws.lagging():
+            continue
+
+        ws.coalesce()
+        if ws.lag_streak >= config.ws_max_lag:
+            log.warning("Disconnecting lagging spectator: %s", ws.state())
+            ws.disconnect()
 
 
 async def send_to_all_websockets(data, active_websockets):
-    """Send the given data to all active websocket connections."""
+    """
+    Queue the given data for all active websocket connections.
+
+    The data is encoded once, and each connection sends it from its own
+    queue, so a stalled spectator does not delay the others.
+    """
     json_encoded_data = json.dumps(data)
     for ws in active_websockets:
-        try:
-            await ws.send_str(json_encoded_data)
-        except Exception as e:
-            log.error("Fail ws send", e)
+        ws.offer(json_encoded_data)
@@ -1,5 +1,6 @@
 from rose.engine import config
 from rose.common import actions
+from rose.engine.breaker import CircuitBreaker
 
 
 class Player(object):
@@ -21,7 +22,16 @@ class Player(object):
                 'none'.
             response_time (float, optional): The duration the driver takes to
                 react. Starts as None.
+            last_action (str, optional): The last action received from the
+                driver, used when it misses a deadline. Defaults to 'none'.
+            late_responses (int, optional): The number of ticks the driver
+                missed its response deadline. Begins at 0.
             score (int, optional): The driver's current score. Begins at 0.
+            breaker (CircuitBreaker): The driver's health. A new player gets
+                a closed circuit, a room replaces it with the driver's
+                breaker from its previous games.
+            socket (DriverSocket, optional): The connection of a websocket
+                driver, None for an HTTP driver.
         """
         self.name = name
         self.car = car
@@ -32,6 +42,8 @@ class Player(object):
         self.action = None
         self.httperror = None
         self.response_time = None
+        self.last_action = None
+        self.late_responses = None
         self.score = None
         self.pickups = None
         self.misses = None
@@ -39,6 +51,8 @@ class Player(object):
         self.breaks = None
         self.jumps = None
         self.collisions = None
+        self.breaker = CircuitBreaker(name)
+        self.socket = None
         self.reset()
 
     def reset(self):
@@ -46,6 +60,8 @@ class Player(object):
         self.y = config.matrix_height // 3 * 2  # 1/3 of track
         self.action = actions.NONE
         self.response_time = None
+        self.last_action = actions.NONE
+        self.late_responses = 0
         self.score = 0
         self.pickups = 0
         self.misses = 0
@@ -76,6 +92,7 @@ class Player(object):
             "action": self.action,
             "response_time": self.response_time,
             "error": self.httperror,
+            "late_responses": self.late_responses,
             "lane": self.lane,
             "score": self.score,
             "pickups": self.pickups,
@@ -84,4 +101,5 @@ class Player(object):
             "breaks": self.breaks,
             "jumps": self.jumps,
             "collisions": self.collisions,
+            "breaker": self.breaker.state(),
         }
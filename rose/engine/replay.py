@@ -0,0 +1,392 @@
+"""Compact append-only game replay files
+
+A replay file starts with a header describing the game and its players,
+followed by one record per tick:
+
+    header:  magic, width, height, players count, seed, rate
+             and for each player: car, lane, name
+    record:  length, tick, timeleft, the new track row codes,
+             for each player: action code, response time, x, y, score,
+             hits, pickups, jumps, breaks,
+             and the cells the players cleared on this tick.
+
+Every config.replay_index_interval ticks, the tick and file offset of its
+record are appended to a sparse index file next to the replay, so playback
+can seek without reading the whole file.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import json
+import logging
+import math
+import os
+import struct
+import time
+
+from rose.common import actions
+from rose.engine import config
+from rose.engine import net
+from rose.engine.player import Player
+from rose.engine.track import Track
+
+log = logging.getLogger("replay")
+
+MAGIC = b"ROSERPL1"
+SUFFIX = ".rpl"
+INDEX_SUFFIX = ".idx"
+
+# Game seeds are recorded as unsigned 64 bit integers
+MAX_SEED = 2**64 - 1
+
+_HEADER = struct.Struct("<8sBBBQd")
+_PLAYER = struct.Struct("<BBH")
+_RECORD = struct.Struct("<HII")
+_TICK_PLAYER = struct.Struct("<BfBBiIIII")
+_CELL = struct.Struct("<BB")
+_INDEX = struct.Struct("<IQ")
+
+# Action code for a missing or invalid driver action
+_NO_ACTION = 255
+
+Record = collections.namedtuple(
+    "Record", ["tick", "timeleft", "row", "players", "clears"]
+)
+PlayerRecord = collections.namedtuple(
+    "PlayerRecord",
+    [
+        "action",
+        "response_time",
+        "x",
+        "y",
+        "score",
+        "hits",
+        "pickups",
+        "jumps",
+        "breaks",
+    ],
+)
+
+
+def check_seed(seed):
+    """Raise ValueError unless seed can be recorded, None is a random seed"""
+    if seed is not None and not 0 <= seed <= MAX_SEED:
+        raise ValueError(f"Seed must be between 0 and {MAX_SEED}: {seed}")
+
+
+def replay_path(replay_dir, seed):
+    """Return a new replay file path for a game"""
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{seed}-{os.getpid()}{SUFFIX}"
+    return os.path.join(replay_dir, name)
+
+
+def list_replays(replay_dir):
+    """Return the names of the replay files in replay_dir"""
+    try:
+        return sorted(name for name in os.listdir(replay_dir) if name.endswith(SUFFIX))
+    except FileNotFoundError:
+        return []
+
+
+class ReplayRecorder(object):
+    def __init__(self, path, state, players, track):
+        """
+        Creates a new ReplayRecorder, appending a game's ticks to path.
+
+        Records are encoded on the event loop into a memory buffer; the
+        buffer is written to disk by a dedicated thread whenever it grows
+        past config.replay_buffer_size, and when the recorder is closed.
+
+        Args:
+            path (str): The replay file to create.
+            state (dict): Dictionary containing game state data.
+            players (list): List of Player objects.
+            track (Track): The game track.
+        """
+        self.path = path
+        self.ticks = 0
+        self._buffer = bytearray()
+        self._index = bytearray()
+        self._offset = 0
+        self._actions = None
+        self._codes = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+        self._buffer += _HEADER.pack(
+            MAGIC,
+            config.matrix_width,
+            config.matrix_height,
+            len(players),
+            state["game_seed"],
+            state["rate"] or 0.0,
+        )
+        for player in players:
+            name = (player.name or "").encode()
+            self._buffer += _PLAYER.pack(player.car, player.lane, len(name)) + name
+        self._offset = len(self._buffer)
+
+    def capture(self, players, track):
+        """Remember the actions and the track before score.process"""
+        self._actions = [player.action for player in players]
+        self._codes = track.codes()
+
+    def record(self, state, players, track):
+        """Append a record for the tick processed since capture"""
+        codes = track.codes()
+        width = config.matrix_width
+        clears = [
+            divmod(i, width)
+            for i, (old, new) in enumerate(zip(self._codes, codes))
+            if old != new
+        ]
+
+        body = bytearray(codes[:width])
+        for player, action in zip(players, self._actions):
+            body += _TICK_PLAYER.pack(
+                actions.CODES.get(action, _NO_ACTION),
+                math.nan if player.response_time is None else player.response_time,
+                player.x,
+                player.y,
+                player.score,
+                player.hits,
+                player.pickups,
+                player.jumps,
+                player.breaks,
+            )
+        body.append(len(clears))
+        for y, x in clears:
+            body += _CELL.pack(x, y)
+
+        if self.ticks % config.replay_index_interval == 0:
+            self._index += _INDEX.pack(self.ticks, self._offset)
+
+        record = _RECORD.pack(len(body), self.ticks, state["timeleft"]) + body
+        self._buffer += record
+        self._offset += len(record)
+        self.ticks += 1
+
+        if len(self._buffer) >= config.replay_buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered records to the writer thread"""
+        if not self._buffer:
+            return
+        data, index = bytes(self._buffer), bytes(self._index)
+        self._buffer.clear()
+        self._index.clear()
+        self._pending = self._executor.submit(self._write, data, index)
+
+    async def close(self):
+        """Write the remaining records, and stop the writer thread"""
+        # A game that never started leaves no replay behind
+        if self.ticks:
+            self.flush()
+        try:
+            if self._pending is not None:
+                await asyncio.wrap_future(self._pending)
+        except OSError as e:
+            log.error("Failed to write replay %s: %s", self.path, e)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    # Private
+
+    def _write(self, data, index):
+        with open(self.path, "ab") as f:
+            f.write(data)
+        if index:
+            with open(self.path + INDEX_SUFFIX, "ab") as f:
+                f.write(index)
+
+
+class ReplayReader(object):
+    def __init__(self, path):
+        """
+        Creates a new ReplayReader, reading the records of a replay file.
+
+        Attributes:
+            width, height (int): The track size.
+            seed (int): The game seed.
+            rate (float): The game rate, 0 if the game was not paced.
+            players (list): List of (name, car, lane) tuples.
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._read_header()
+        except (ValueError, struct.error):
+            self._file.close()
+            raise
+        self._start = self._file.tell()
+        self._index = self._load_index()
+
+    def close(self):
+        self._file.close()
+
+    def seek(self, tick):
+        """Position the reader so the next record read is tick"""
+        offset = self._start
+        for indexed_tick, indexed_offset in self._index:
+            if indexed_tick > tick:
+                break
+            offset = indexed_offset
+        self._file.seek(offset)
+
+        while True:
+            position = self._file.tell()
+            header = self._file.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            size, record_tick, timeleft = _RECORD.unpack(header)
+            if record_tick >= tick:
+                self._file.seek(position)
+                return
+            self._file.seek(size, os.SEEK_CUR)
+
+    def read(self):
+        """Return the next Record, None at the end of the replay"""
+        header = self._file.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            return None
+        size, tick, timeleft = _RECORD.unpack(header)
+        body = self._file.read(size)
+        if len(body) < size:
+            return None
+
+        row = body[: self.width]
+        offset = self.width
+        players = []
+        for i in range(len(self.players)):
+            values = _TICK_PLAYER.unpack_from(body, offset)
+            offset += _TICK_PLAYER.size
+            players.append(PlayerRecord(*values))
+        count = body[offset]
+        offset += 1
+        clears = [
+            _CELL.unpack_from(body, offset + i * _CELL.size) for i in range(count)
+        ]
+        return Record(tick, timeleft, row, players, clears)
+
+    def read_many(self, count):
+        """Return up to count next records"""
+        records = []
+        for i in range(count):
+            record = self.read()
+            if record is None:
+                break
+            records.append(record)
+        return records
+
+    # Private
+
+    def _read_header(self):
+        """Read the header, raise ValueError or struct.error if it is invalid"""
+        magic, self.width, self.height, count, self.seed, self.rate = _HEADER.unpack(
+            self._file.read(_HEADER.size)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"Not a replay file: {self.path}")
+
+        self.players = []
+        for i in range(count):
+            car, lane, size = _PLAYER.unpack(self._file.read(_PLAYER.size))
+            name = self._file.read(size).decode()
+            self.players.append((name, car, lane))
+
+    def _load_index(self):
+        try:
+            with open(self.path + INDEX_SUFFIX, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        return [
+            _INDEX.unpack_from(data, offset)
+            for offset in range(0, len(data) - _INDEX.size + 1, _INDEX.size)
+        ]
+
+
+class Playback(object):
+    def __init__(self, reader):
+        """
+        Creates a new Playback, rebuilding the game track and players from
+        replay records.
+        """
+        self.reader = reader
+        self.timeleft = None
+        self.track = Track()
+        self.players = []
+        for name, car, lane in reader.players:
+            player = Player(name, car, lane)
+            self.players.append(player)
+
+    def apply(self, record):
+        """Advance the track and players to the state after record"""
+        self.timeleft = record.timeleft
+        self.track.push(record.row)
+        for x, y in record.clears:
+            self.track.clear(x, y)
+
+        for player, values in zip(self.players, record.players):
+            if values.action == _NO_ACTION:
+                player.action = None
+            else:
+                player.action = actions.decode(values.action)
+            if math.isnan(values.response_time):
+                player.response_time = None
+            else:
+                player.response_time = values.response_time
+            player.x = values.x
+            player.y = values.y
+            player.score = values.score
+            player.hits = values.hits
+            player.pickups = values.pickups
+            player.jumps = values.jumps
+            player.breaks = values.breaks
+
+    def first_tick(self, tick):
+        """Return the first record to read to rebuild the track at tick"""
+        return max(0, tick - self.reader.height + 1)
+
+
+async def play(ws, reader, speed=1.0, tick=0):
+    """
+    Stream a replay to a websocket client as regular game updates.
+
+    Args:
+        ws (aiohttp.web.WebSocketResponse): The client connection.
+        reader (ReplayReader): The replay to play.
+        speed (float): Speed multiplier of the recorded game rate, games
+            recorded without a rate play at one tick per second.
+        tick (int): The first tick to send; the track is rebuilt from the
+            records before it.
+    """
+    loop = asyncio.get_running_loop()
+    playback = Playback(reader)
+    await loop.run_in_executor(None, reader.seek, playback.first_tick(tick))
+
+    rate = (reader.rate or 1.0) * speed
+    state = {"rate": rate, "timeleft": None, "game_seed": reader.seed}
+    deadline = loop.time()
+
+    while not ws.closed:
+        records = await loop.run_in_executor(None, reader.read_many, 64)
+        if not records:
+            break
+
+        for record in records:
+            playback.apply(record)
+            if record.tick < tick:
+                continue
+
+            state["timeleft"] = record.timeleft
+            data = net.update_data(True, state, playback.players, playback.track)
+            try:
+                await ws.send_str(json.dumps(data))
+            except ConnectionResetError:
+                return
+
+            deadline += 1 / rate
+            await asyncio.sleep(max(0, deadline - loop.time()))
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+
+from rose.engine import config
+from rose.engine import driversocket
+from rose.engine import logic
+from rose.engine.scheduler import TickScheduler
+
+log = logging.getLogger("room")
+
+
+class Room(object):
+    def __init__(self, name, rate, drivers, track_type, seed=None, replay_dir=None):
+        """
+        Creates a new Room, one game with its own state, track, players and
+        spectators, running in the engine's event loop.
+
+        Args:
+            name (str): The unique name of the room.
+            rate (float): The game rate in ticks per second.
+            drivers (list): List of driver URLs.
+            track_type (str): Type of track can be "random" or "same".
+            seed (int, optional): Seed for the games, None for random.
+            replay_dir (str, optional): Directory to record game replays in.
+
+        Attributes:
+            state (dict): The game state, shared with the game loop.
+            active_websockets (set): The room's spectators, shared with the
+                game loop.
+            scheduler (TickScheduler): Paces the room's game ticks.
+            driver_sockets (dict): The DriverSocket of each websocket driver
+                connected to the room, or listed in its drivers, by name.
+            breakers (dict): The CircuitBreaker of each driver, by URL, kept
+                across the room's games.
+        """
+        self.name = name
+        self.state = {
+            "room": name,
+            "rate": rate,
+            "running": 0,
+            "reset": None,
+            "drivers": list(drivers or []),
+            "timeleft": config.game_duration,
+            "track_type": track_type,
+            "seed": seed,
+            "game_seed": None,
+            "replay_dir": replay_dir,
+            "tick_policy": config.tick_policy,
+            "map": None,
+            "reload_map": None,
+        }
+        self.active_websockets = set()
+        self.scheduler = TickScheduler(name)
+        self.driver_sockets = {}
+        self.breakers = {}
+        self.task = None
+
+    def start(self):
+        """Start the room's game loop"""
+        # IMPORTANT: state and active_websockets are references, changes here
+        # will affect the game loop.
+        self.task = asyncio.create_task(
+            logic.game_loop(
+                self.state,
+                self.active_websockets,
+                self.scheduler,
+                self.driver_sockets,
+                self.breakers,
+            )
+        )
+        self.task.add_done_callback(self._loop_done)
+
+    async def stop(self):
+        """Stop the game loop and disconnect the spectators"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        for spectator in list(self.active_websockets):
+            spectator.disconnect()
+        for socket in self.driver_sockets.values():
+            if socket.ws is not None:
+                await socket.ws.close()
+
+    def forget_driver(self, socket):
+        """Drop a disconnected websocket driver the room does not play"""
+        if socket.connected:
+            return
+        if driversocket.PREFIX + socket.name in self.state["drivers"]:
+            return
+        if self.driver_sockets.get(socket.name) is socket:
+            del self.driver_sockets[socket.name]
+
+    # Private
+
+    def _loop_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            log.error("room %s game loop failed: %s", self.name, task.exception())
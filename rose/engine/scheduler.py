@@ -0,0 +1,123 @@
+import asyncio
+import logging
+
+from rose.engine import config
+from rose.engine import metrics
+
+log = logging.getLogger("scheduler")
+
+POLICIES = ("catchup", "skip")
+
+
+class TickScheduler(object):
+    def __init__(self, room=""):
+        """
+        Creates a new TickScheduler, pacing game ticks on monotonic deadlines.
+
+        Tick n is due at start + n * period, so the time spent running a
+        tick and the sleep overshoot are absorbed by the next wait, instead
+        of accumulating.
+
+        When the engine falls behind by whole ticks, the "catchup" policy
+        runs the missed ticks back to back, up to config.tick_max_catchup of
+        them, and the "skip" policy drops them, running the next tick at
+        once. Either way, later ticks stay on the original deadlines.
+
+        Args:
+            room (str): The room name, for the metrics labels.
+
+        Attributes:
+            ticks (int): The number of ticks started.
+            skipped (int): The number of missed ticks dropped.
+            lateness (float, optional): How late the last tick started.
+            max_lateness (float): The latest tick start.
+            jitter (float): Smoothed variation of the lateness between
+                consecutive ticks, like the RFC 3550 interarrival jitter.
+        """
+        self.room = room
+        self.ticks = 0
+        self.skipped = 0
+        self.lateness = None
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+        self.jitter = 0.0
+        self._deadline = None
+        self._period = None
+
+    def reset(self):
+        """Start the next tick immediately, after a pause or a rate change"""
+        self._deadline = None
+        self.lateness = None
+
+    def next_deadline(self):
+        """Return the loop time the next tick is due, None after a reset"""
+        if self._deadline is None:
+            return None
+        return self._deadline + self._period
+
+    async def wait(self, rate, policy=None):
+        """
+        Sleep until the next tick is due.
+
+        Args:
+            rate (float): The game rate in ticks per second.
+            policy (str, optional): "catchup" or "skip". Defaults to
+                config.tick_policy.
+
+        Returns:
+            float: How late the tick starts, in seconds.
+        """
+        loop = asyncio.get_running_loop()
+        period = 1 / rate
+        now = loop.time()
+
+        if self._deadline is None or period != self._period:
+            self._deadline = now
+            self._period = period
+        else:
+            self._deadline += period
+            missed = int((now - self._deadline) // period)
+            if missed > 0:
+                self._fall_behind(missed, policy or config.tick_policy)
+
+        delay = self._deadline - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        lateness = max(0.0, loop.time() - self._deadline)
+        self._record(lateness)
+        return lateness
+
+    def state(self):
+        """Return read only serialize-able state for sending to client"""
+        return {
+            "ticks": self.ticks,
+            "skipped": self.skipped,
+            "lateness": self.lateness,
+            "max_lateness": self.max_lateness,
+            "mean_lateness": self.total_lateness / self.ticks if self.ticks else None,
+            "jitter": self.jitter,
+        }
+
+    # Private
+
+    def _fall_behind(self, missed, policy):
+        if policy == "skip":
+            dropped = missed
+        else:
+            dropped = max(0, missed - config.tick_max_catchup)
+        if dropped:
+            log.warning("Engine fell behind, skipping %d ticks", dropped)
+            self._deadline += dropped * self._period
+            self.skipped += dropped
+            metrics.ticks_skipped.inc((self.room,), dropped)
+
+    def _record(self, lateness):
+        if self.lateness is not None:
+            self.jitter += (abs(lateness - self.lateness) - self.jitter) / 16
+        self.lateness = lateness
+        self.ticks += 1
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        metrics.tick_lateness_seconds.observe(lateness, (self.room,))
+        metrics.tick_jitter_seconds.set(self.jitter, (self.room,))
@@ -8,6 +8,16 @@ from rose.common import obstacles
 
 log = logging.getLogger("score")
 
+# Obstacles codes, the track stores and compares obstacles as small ints
+_NONE = obstacles.encode(obstacles.NONE)
+_CRACK = obstacles.encode(obstacles.CRACK)
+_PENGUIN = obstacles.encode(obstacles.PENGUIN)
+_WATER = obstacles.encode(obstacles.WATER)
+_HARD = frozenset(
+    obstacles.encode(obstacle)
+    for obstacle in (obstacles.TRASH, obstacles.BIKE, obstacles.BARRIER)
+)
+
 
 def process(players, track):
     """
@@ -52,9 +62,10 @@ def process(players, track):
     # Now handle obstacles, preferring players in their own lane.
 
     for player in sorted_players:
-        obstacle = track.get(player.x, player.y)
+        code = track.get_code(player.x, player.y)
+        obstacle = obstacles.decode(code)
 
-        if obstacle == obstacles.NONE:
+        if code == _NONE:
             # Move forward, leaving the obstacle on the track.
             player.score += config.score_move_forward
 
@@ -64,7 +75,7 @@ def process(players, track):
                 config.score_move_forward,
             )
 
-        elif obstacle in (obstacles.TRASH, obstacles.BIKE, obstacles.BARRIER):
+        elif code in _HARD:
             # Move back consuming the obstacle.
             track.clear(player.x, player.y)
             player.y += 1
@@ -80,7 +91,7 @@ def process(players, track):
                 player.y,
             )
 
-        elif obstacle == obstacles.CRACK:
+        elif code == _CRACK:
             if player.action == actions.JUMP:
                 # Move forward leaving the obstacle on the track
                 points = config.score_move_forward + config.score_jump
@@ -109,7 +120,7 @@ def process(players, track):
                     player.y,
                 )
 
-        elif obstacle == obstacles.WATER:
+        elif code == _WATER:
             if player.action == actions.BRAKE:
                 # Move forward leaving the obstacle on the track
                 points = config.score_move_forward + config.score_brake
@@ -138,7 +149,7 @@ def process(players, track):
                     player.y,
                 )
 
-        elif obstacle == obstacles.PENGUIN:
+        elif code == _PENGUIN:
             if player.action == actions.PICKUP:
                 # Move forward and collect an aquatic bird
                 track.clear(player.x, player.y)
@@ -192,7 +203,7 @@ def process(players, track):
 
         log.info(
             "process_actions: name=%s lane=%d pos=%d,%d score=%d "
-            "response_time=%0.6f",
+            "response_time=%s",
             player.name,
             player.lane,
             player.x,
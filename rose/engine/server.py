@@ -1,31 +1,110 @@
+import asyncio
 import json
+import logging
+import os
+import struct
 
 import aiohttp
 from aiohttp import web
 
 from rose.engine import config
-from rose.engine import logic
+from rose.engine import maplibrary
+from rose.engine import maps
+from rose.engine import metrics
+from rose.engine import replay
+from rose.engine import tracing
+from rose.engine.driversocket import DriverSocket
+from rose.engine.room import Room
+from rose.engine.scheduler import POLICIES
+from rose.engine.spectator import PROTOCOLS, Spectator
 
-# Global active_websockets
-# IMPORTANT - shared with game loop in game.py
-active_websockets = set()
+log = logging.getLogger("server")
 
-# Global state
-# IMPORTANT - shared with game loop in game.py
-state = {"rate": None, "running": None, "reset": None, "drivers": [], "timeleft": None}
+# Game rooms by name, each runs its own game loop
+rooms = {}
+
+DEFAULT_ROOM = "default"
+
+# Longest websocket driver name
+MAX_DRIVER_NAME = 64
+
+# The uploaded map, and where deactivating it moves it
+CUSTOM_MAP_NAME = "custom_map.csv"
+DISABLED_MAP_NAME = "disabled_custom_map.csv"
+# Longest map library name
+MAX_MAP_NAME = 64
+# Map upload bytes read and written at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Room for the multipart boundaries and part headers around the map
+MULTIPART_OVERHEAD = 16 * 1024
+# The map pages may be served from another origin
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": "POST, OPTIONS",
+    "Access-Control-Allow-Headers": "Content-Type",
+}
+
+# Settings for new rooms, and the replays directory
+defaults = {
+    "rate": 1.0,
+    "drivers": [],
+    "track_type": "random",
+    "seed": None,
+    "replay_dir": None,
+}
+
+
+def get_room(request):
+    """Return the room selected by the request ?room= query, or None"""
+    return rooms.get(request.rel_url.query.get("room", DEFAULT_ROOM))
+
+
+def create_room(name, running=False):
+    """Create a room with the default settings, and start its game loop"""
+    room = Room(
+        name,
+        defaults["rate"],
+        defaults["drivers"],
+        defaults["track_type"],
+        defaults["seed"],
+        defaults["replay_dir"],
+    )
+    room.state["running"] = 1 if running else 0
+    rooms[name] = room
+    room.start()
+    return room
 
 
 async def admin_handler(request):
     """
-    Handle admin requests to set the game rate.
+    Handle admin requests to control a game room.
+
+    The room is selected with ?room=name, defaulting to the default room.
+    ?create=1 creates a new room, and ?delete=1 stops and removes it.
 
     Args:
         request (aiohttp.web.Request): The request object.
 
     Returns:
-        aiohttp.web.Response: A response indicating the new game rate or an error message.
+        aiohttp.web.Response: A response with the room state or an error message.
     """
-    global state
+    name = request.rel_url.query.get("room", DEFAULT_ROOM)
+
+    if request.rel_url.query.get("create") == "1":
+        if name in rooms:
+            return web.Response(text="Room already exists", status=409)
+        create_room(name)
+
+    room = rooms.get(name)
+    if room is None:
+        return web.Response(text="Room not found", status=404)
+
+    if request.rel_url.query.get("delete") == "1":
+        del rooms[name]
+        await room.stop()
+        return web.Response(text=json.dumps(room.state))
+
+    state = room.state
 
     rate = request.rel_url.query.get("rate")
     if rate:
@@ -41,6 +120,12 @@ async def admin_handler(request):
         except ValueError:
             return web.Response(text="Invalid running provided", status=400)
 
+    tick_policy = request.rel_url.query.get("tick_policy")
+    if tick_policy:
+        if tick_policy not in POLICIES:
+            return web.Response(text="Invalid tick_policy provided", status=400)
+        state["tick_policy"] = tick_policy
+
     reset = request.rel_url.query.get("reset")
     if reset:
         try:
@@ -48,6 +133,28 @@ async def admin_handler(request):
         except ValueError:
             return web.Response(text="Invalid reset provided", status=400)
 
+    # Seed for the next games, "random" for a new random seed on every game
+    seed = request.rel_url.query.get("seed")
+    if seed:
+        try:
+            seed = None if seed == "random" else int(seed)
+            replay.check_seed(seed)
+        except ValueError:
+            return web.Response(text="Invalid seed provided", status=400)
+        state["seed"] = seed
+        state["running"] = 0
+        state["reset"] = 1
+
+    # Map for the next games by name in the map library, an empty name for
+    # the active map of the maps directory
+    if "map" in request.rel_url.query:
+        map_name = request.rel_url.query["map"] or None
+        if map_name and await maplibrary.library.get_async(map_name) is None:
+            return web.Response(text="Invalid map provided", status=400)
+        state["map"] = map_name
+        state["running"] = 0
+        state["reset"] = 1
+
     # This expects the drivers to be passed as a comma-separated list in the query param
     # e.g., ?drivers=http://localhost:8081/drv2,http://driver.com:8090/
     drivers = request.rel_url.query.get("drivers")
@@ -60,20 +167,62 @@ async def admin_handler(request):
     return web.Response(text=json.dumps(state))
 
 
+async def rooms_handler(request):
+    """
+    Handle requests for the list of game rooms.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: A JSON list with the state, spectators count,
+            tick scheduler statistics and websocket drivers of each room.
+    """
+    return web.Response(
+        text=json.dumps(
+            [
+                {
+                    **room.state,
+                    "spectators": len(room.active_websockets),
+                    "scheduler": room.scheduler.state(),
+                    "driver_sockets": [
+                        socket.state() for socket in room.driver_sockets.values()
+                    ],
+                }
+                for room in rooms.values()
+            ]
+        )
+    )
+
+
 async def websocket_handler(request):
     """
     Handle WebSocket connections, echoing received messages with a prefix.
 
+    Clients select a room with ?room=name, defaulting to the default room,
+    and may pass ?protocol=delta to receive delta encoded updates.
+
     Args:
         request (aiohttp.web.Request): The request object.
 
     Returns:
         aiohttp.web.WebSocketResponse: The WebSocket response object.
     """
+    room = get_room(request)
+    if room is None:
+        return web.Response(text="Room not found", status=404)
+
+    protocol = request.rel_url.query.get("protocol", "full")
+    if protocol not in PROTOCOLS:
+        return web.Response(text="Invalid protocol provided", status=400)
+
     ws = web.WebSocketResponse()
     await ws.prepare(request)
 
-    active_websockets.add(ws)
+    active_websockets = room.active_websockets
+    spectator = Spectator(ws, protocol)
+    sender = asyncio.create_task(spectator.run())
+    active_websockets.add(spectator)
     try:
         async for msg in ws:
             if msg.type == web.WSMsgType.TEXT:
@@ -82,12 +231,392 @@ async def websocket_handler(request):
             elif msg.type == web.WSMsgType.ERROR:
                 print(f"WebSocket error: {ws.exception()}")
     finally:
-        active_websockets.remove(ws)
+        active_websockets.discard(spectator)
+        sender.cancel()
         await ws.close()
 
     return ws
 
 
+async def driver_handler(request):
+    """
+    Handle WebSocket connections of drivers playing over a persistent
+    connection instead of HTTP POST requests.
+
+    Drivers select a room with ?room=name, defaulting to the default room,
+    and connect with ?name=driver. The room plays them once its drivers list
+    has "ws:driver". Each tick the engine pushes the driver request, and the
+    driver replies with its action on the same connection.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.WebSocketResponse: The WebSocket response object.
+    """
+    room = get_room(request)
+    if room is None:
+        return web.Response(text="Room not found", status=404)
+
+    name = request.rel_url.query.get("name", "")
+    if not 0 < len(name) <= MAX_DRIVER_NAME or "," in name:
+        return web.Response(text="Invalid name provided", status=400)
+
+    socket = room.driver_sockets.get(name)
+    if socket is None:
+        socket = room.driver_sockets[name] = DriverSocket(name)
+    if socket.connected:
+        return web.Response(text="Driver already connected", status=409)
+
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    socket.attach(ws)
+    try:
+        async for msg in ws:
+            if msg.type == web.WSMsgType.TEXT:
+                socket.receive(msg.data)
+            elif msg.type == web.WSMsgType.ERROR:
+                log.warning("Driver %s websocket error: %s", name, ws.exception())
+    finally:
+        socket.detach(ws)
+        room.forget_driver(socket)
+        await ws.close()
+
+    return ws
+
+
+async def spectators_handler(request):
+    """
+    Handle requests for the spectators send statistics of a room.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: A JSON list with the state of each spectator.
+    """
+    room = get_room(request)
+    if room is None:
+        return web.Response(text="Room not found", status=404)
+    spectators = [spectator.state() for spectator in room.active_websockets]
+    return web.Response(text=json.dumps(spectators))
+
+
+async def replays_handler(request):
+    """
+    Handle requests for the list of recorded replays.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: A JSON list of replay names.
+    """
+    replays = []
+    if defaults["replay_dir"]:
+        replays = replay.list_replays(defaults["replay_dir"])
+    return web.Response(text=json.dumps(replays))
+
+
+async def replay_handler(request):
+    """
+    Handle WebSocket connections playing back a recorded game.
+
+    The query selects the replay by name, the speed multiplier (default 1)
+    and the tick to start from (default 0).
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.WebSocketResponse: The WebSocket response object.
+    """
+    name = request.rel_url.query.get("name", "")
+    replay_dir = defaults["replay_dir"]
+    if not replay_dir or name not in replay.list_replays(replay_dir):
+        return web.Response(text="Replay not found", status=404)
+
+    try:
+        speed = float(request.rel_url.query.get("speed", 1))
+        tick = int(request.rel_url.query.get("tick", 0))
+        if speed <= 0 or tick < 0:
+            raise ValueError
+    except ValueError:
+        return web.Response(text="Invalid speed or tick provided", status=400)
+
+    loop = asyncio.get_running_loop()
+    path = os.path.join(replay_dir, name)
+    try:
+        reader = await loop.run_in_executor(None, replay.ReplayReader, path)
+    except FileNotFoundError:
+        return web.Response(text="Replay not found", status=404)
+    except (ValueError, struct.error, OSError) as e:
+        log.warning("Invalid replay %s: %s", name, e)
+        return web.Response(text="Invalid replay file", status=400)
+
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    try:
+        await replay.play(ws, reader, speed, tick)
+    finally:
+        reader.close()
+        await ws.close()
+
+    return ws
+
+
+async def metrics_handler(request):
+    """
+    Handle requests for the engine metrics.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: The metrics in the Prometheus text format.
+    """
+    metrics.websocket_clients.clear()
+    for name, room in rooms.items():
+        metrics.websocket_clients.set(len(room.active_websockets), (name,))
+    return web.Response(text=metrics.render(), content_type="text/plain")
+
+
+async def trace_handler(request):
+    """
+    Handle requests for the game steps trace.
+
+    GET returns the recorded spans as a Chrome trace_event JSON document.
+    POST controls tracing with ?enabled=1 or 0, and ?clear=1 to drop the
+    recorded spans, and returns the tracer state.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: The trace, or the tracer state.
+    """
+    if request.method == "GET":
+        return web.Response(
+            text=json.dumps(tracing.tracer.dump()), content_type="application/json"
+        )
+
+    enabled = request.rel_url.query.get("enabled")
+    if enabled:
+        if enabled not in ("0", "1"):
+            return web.Response(text="Invalid enabled provided", status=400)
+        if enabled == "1":
+            tracing.tracer.enable()
+        else:
+            tracing.tracer.disable()
+
+    if request.rel_url.query.get("clear") == "1":
+        tracing.tracer.clear()
+
+    return web.Response(text=json.dumps(tracing.tracer.state()))
+
+
+def reload_map(name=None):
+    """
+    Have the running games playing a changed map reload it from their next
+    tick.
+
+    Args:
+        name (str, optional): The map library name, None for the active map
+            of the maps directory.
+    """
+    for room in rooms.values():
+        if room.state.get("map") == name:
+            room.state["reload_map"] = 1
+
+
+def map_response(text, status=200):
+    return web.Response(text=text, status=status, headers=CORS_HEADERS)
+
+
+async def upload_handler(request):
+    """
+    Handle custom map uploads.
+
+    The map is the first file of a multipart/form-data request. It is
+    compiled in chunks off the event loop, then with ?name=map_name stored
+    in the map library, and otherwise streamed to a temporary file which
+    replaces the custom map. The running games reload their map.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: A response with a status message.
+    """
+    if not request.content_type.startswith("multipart/form-data"):
+        return map_response("Invalid content type", 400)
+    limit = config.map_max_size + MULTIPART_OVERHEAD
+    if request.content_length is not None and request.content_length > limit:
+        return map_response("Map too large", 413)
+
+    name = request.rel_url.query.get("name")
+    if name is not None and not 0 < len(name) <= MAX_MAP_NAME:
+        return map_response("Invalid name provided", 400)
+
+    loop = asyncio.get_running_loop()
+    path = None if name else os.path.join(config.map_dir, CUSTOM_MAP_NAME)
+    upload = None
+    try:
+        reader = await request.multipart()
+        async for part in reader:
+            if upload is not None or not getattr(part, "filename", None):
+                continue
+            upload = await loop.run_in_executor(None, maps.MapUpload, path)
+            while True:
+                chunk = await part.read_chunk(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await loop.run_in_executor(None, upload.write, chunk)
+
+        if upload is None:
+            return map_response("No valid file part found", 400)
+        compiled = await loop.run_in_executor(None, upload.commit)
+        upload = None
+        if name:
+            await loop.run_in_executor(None, maplibrary.library.add, name, compiled)
+    except maps.MapTooLarge as e:
+        return map_response(str(e), 413)
+    except ValueError as e:
+        return map_response(str(e), 400)
+    finally:
+        if upload is not None:
+            await loop.run_in_executor(None, upload.abort)
+
+    reload_map(name or None)
+    return map_response("File uploaded successfully.")
+
+
+async def activate_map_handler(request):
+    """
+    Handle requests to play the deactivated custom map again.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: A response with a status message.
+    """
+    src = os.path.join(config.map_dir, DISABLED_MAP_NAME)
+    dst = os.path.join(config.map_dir, CUSTOM_MAP_NAME)
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, os.rename, src, dst)
+    except FileNotFoundError:
+        return map_response(f"{DISABLED_MAP_NAME} not found", 404)
+    reload_map()
+    return map_response("Map activated")
+
+
+async def deactivate_map_handler(request):
+    """
+    Handle requests to go back to random tracks, keeping the custom map.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: A response with a status message.
+    """
+    src = os.path.join(config.map_dir, CUSTOM_MAP_NAME)
+    dst = os.path.join(config.map_dir, DISABLED_MAP_NAME)
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, os.rename, src, dst)
+    except FileNotFoundError:
+        pass
+    reload_map()
+    return map_response("Map deactivated")
+
+
+async def reload_map_handler(request):
+    """
+    Handle requests to reload a custom map in the running games, after
+    another process changed it. The map is selected with ?name=map_name in
+    the map library, and is the active map of the maps directory otherwise.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: A response with a status message.
+    """
+    maplibrary.library.clear_cache()
+    reload_map(request.rel_url.query.get("name") or None)
+    return web.Response(text="Map reloaded")
+
+
+async def maps_handler(request):
+    """
+    Handle requests for the map library.
+
+    GET returns the metadata of every map: its name, width, length in rows
+    and number of cells of each obstacle. POST with ?name=map_name&delete=1
+    deletes a map.
+
+    Args:
+        request (aiohttp.web.Request): The request object.
+
+    Returns:
+        aiohttp.web.Response: A JSON list of the maps metadata, or a status
+            message.
+    """
+    loop = asyncio.get_running_loop()
+    if request.method == "GET":
+        library = await loop.run_in_executor(None, maplibrary.library.list)
+        return map_response(json.dumps(library))
+
+    name = request.rel_url.query.get("name", "")
+    if request.rel_url.query.get("delete") != "1":
+        return map_response("Invalid request", 400)
+    if not await loop.run_in_executor(None, maplibrary.library.delete, name):
+        return map_response("Map not found", 404)
+    reload_map(name)
+    return map_response("Map deleted")
+
+
+async def options_handler(request):
+    """Answer CORS preflight requests for the map endpoints"""
+    return web.Response(status=204, headers=CORS_HEADERS)
+
+
+# Map management endpoints, also served by the supervisor of a sharded engine
+MAP_ROUTES = {
+    "/upload": upload_handler,
+    "/activateRandomMap": activate_map_handler,
+    "/deactivateRandomMap": deactivate_map_handler,
+    "/maps": maps_handler,
+}
+
+
+def make_app():
+    """Return the engine web application"""
+    app = web.Application()
+
+    # Add application routes
+    app.router.add_get("/ws", websocket_handler)
+    app.router.add_get("/driver", driver_handler)
+    app.router.add_post("/admin", admin_handler)
+    app.router.add_get("/rooms", rooms_handler)
+    app.router.add_get("/spectators", spectators_handler)
+    app.router.add_get("/replays", replays_handler)
+    app.router.add_get("/replay", replay_handler)
+    app.router.add_get("/metrics", metrics_handler)
+    app.router.add_get("/trace", trace_handler)
+    app.router.add_post("/trace", trace_handler)
+    for path, handler in MAP_ROUTES.items():
+        app.router.add_post(path, handler)
+        app.router.add_route("OPTIONS", path, options_handler)
+    app.router.add_get("/maps", maps_handler)
+    app.router.add_post("/reloadMap", reload_map_handler)
+
+    return app
+
+
 async def run(
     http_port,
     listen_address,
@@ -95,9 +624,14 @@ async def run(
     initial_running,
     initial_drivers,
     track_type,
+    initial_seed=None,
+    replay_dir=None,
+    default_room=True,
 ):
     """
-    Start the servers (HTTP and Websocket) and the game loop.
+    Start the servers (HTTP and Websocket) and the default room game loop.
+
+    More rooms can be created and deleted with the admin API.
 
     Args:
         http_port (int): The port to listen on for the HTTP server.
@@ -109,20 +643,18 @@ async def run(
         public (str): Path to the static files directory.
         theme (str): Path to the static them resources directory.
         track_type (str): Type of track can be "random" or "same".
+        initial_seed (int, optional): Seed for the games, None for random.
+        replay_dir (str, optional): Directory to record game replays in.
+        default_room (bool): Create the default room, workers of a sharded
+            engine only create it on the worker owning it.
     """
-    global state
-
-    state["rate"] = initial_rate
-    state["running"] = 1 if initial_running else 0
-    state["drivers"] = initial_drivers
-    state["timeleft"] = config.game_duration
-    state["track_type"] = track_type
-
-    app = web.Application()
+    defaults["rate"] = initial_rate
+    defaults["drivers"] = initial_drivers or []
+    defaults["track_type"] = track_type
+    defaults["seed"] = initial_seed
+    defaults["replay_dir"] = replay_dir
 
-    # Add application routes
-    app.router.add_get("/ws", websocket_handler)
-    app.router.add_post("/admin", admin_handler)
+    app = make_app()
 
     runner = aiohttp.web.AppRunner(app)
     await runner.setup()
@@ -136,6 +668,13 @@ async def run(
     print(f"Listen        {listen_address}:{http_port}")
     print(f"Server URL    http://127.0.0.1:{http_port}")
 
-    # Start game loop
-    # IMPORTANT: state and active_websockets are references, changes in this file will affect the game loop.
-    await logic.game_loop(state, active_websockets)
+    # Start the default room game loop, and serve until cancelled
+    if default_room:
+        create_room(DEFAULT_ROOM, initial_running)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for room in list(rooms.values()):
+            await room.stop()
+        rooms.clear()
+        await runner.cleanup()
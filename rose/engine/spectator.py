@@ -0,0 +1,127 @@
+import asyncio
+import collections
+import logging
+import time
+
+from rose.engine import config
+from rose.engine import metrics
+
+log = logging.getLogger("spectator")
+
+PROTOCOLS = ("full", "delta")
+
+
+class Spectator(object):
+    def __init__(self, ws, protocol="full"):
+        """
+        Creates a new Spectator, a websocket client watching the game.
+
+        Updates are queued with offer() and sent by the spectator's own run()
+        task, so a slow client never delays the broadcast to the others.
+
+        Args:
+            ws (aiohttp.web.WebSocketResponse): The client connection.
+            protocol (str): "full" to receive the complete game state on every
+                update, or "delta" to receive only what changed since the
+                previous update, with periodic keyframes.
+
+        Attributes:
+            needs_keyframe (bool): True until the client received a complete
+                game state it can apply deltas to.
+            sent (int): The number of updates sent to the client.
+            dropped (int): The number of stale updates dropped from the queue.
+            lag_streak (int): The number of consecutive updates the client
+                was still lagging, reset when its queue drains.
+            latency (float, optional): The duration of the last send.
+        """
+        self.ws = ws
+        self.protocol = protocol
+        self.needs_keyframe = True
+        self.disconnected = False
+        self.sent = 0
+        self.dropped = 0
+        self.lag_streak = 0
+        self.latency = None
+        self.max_latency = None
+        self.total_latency = 0.0
+        self._queue = collections.deque()
+        self._ready = asyncio.Event()
+        self._closing = None
+
+    def wants_delta(self):
+        return self.protocol == "delta" and not self.needs_keyframe
+
+    def offer(self, data):
+        """Queue an encoded update for sending, never blocks"""
+        if self.disconnected:
+            return
+        self._queue.append(data)
+        self._ready.set()
+
+    def lagging(self):
+        return len(self._queue) >= config.ws_queue_size
+
+    def coalesce(self):
+        """
+        Drop all queued updates, they are stale.
+
+        The next update the client gets must be complete, since it missed
+        the ones a delta would be based on.
+        """
+        self.dropped += len(self._queue)
+        self._queue.clear()
+        self.needs_keyframe = True
+        self.lag_streak += 1
+
+    def disconnect(self):
+        """Stop sending updates and close the connection"""
+        self.disconnected = True
+        self._queue.clear()
+        self._ready.set()
+        if self._closing is None:
+            self._closing = asyncio.ensure_future(self.ws.close())
+
+    async def send_str(self, data):
+        await self.ws.send_str(data)
+
+    async def run(self):
+        """Send queued updates until the connection closes"""
+        while not self.disconnected and not self.ws.closed:
+            if not self._queue:
+                self.lag_streak = 0
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+
+            data = self._queue.popleft()
+            start = time.perf_counter()
+            try:
+                await self.ws.send_str(data)
+            except Exception as e:
+                log.error("Fail ws send: %s", e)
+                break
+            self._record_send(time.perf_counter() - start)
+            metrics.websocket_messages_sent.inc()
+            metrics.websocket_bytes_sent.inc(value=len(data))
+
+    def state(self):
+        """Return read only serialize-able state for sending to client"""
+        return {
+            "protocol": self.protocol,
+            "queued": len(self._queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "lag_streak": self.lag_streak,
+            "latency": self.latency,
+            "max_latency": self.max_latency,
+            "mean_latency": self.total_latency / self.sent if self.sent else None,
+        }
+
+    # Private
+
+    def _record_send(self, latency):
+        self.sent += 1
+        self.latency = latency
+        self.total_latency += latency
+        if self.max_latency is None or latency > self.max_latency:
+            self.max_latency = latency
@@ -0,0 +1,47 @@
+"""Stub drivers, serving the driver HTTP API for benchmarks and tests"""
+
+import asyncio
+
+from aiohttp import web
+
+from rose.common import actions
+
+
+async def start(name, action=actions.NONE, latency=None, error_rate=0.0, rng=None):
+    """
+    Start a stub driver on a free local port.
+
+    Args:
+        name (str): The driver name.
+        action (str or callable): The action of every answer, or a function
+            returning the action of each answer.
+        latency (callable, optional): Returns the seconds to wait before each
+            answer. None answers at once.
+        error_rate (float): The fraction of requests failing with a 500.
+        rng (random.Random, optional): Draws the failing requests.
+
+    Returns:
+        tuple: The driver's aiohttp.web.AppRunner, to clean it up, and its URL.
+    """
+
+    async def info(request):
+        return web.json_response({"info": {"name": name}})
+
+    async def drive(request):
+        await request.read()
+        if latency is not None:
+            await asyncio.sleep(latency())
+        if error_rate and rng.random() < error_rate:
+            return web.Response(text="Stub driver error", status=500)
+        choice = action() if callable(action) else action
+        return web.json_response({"info": {"name": name, "action": choice}})
+
+    app = web.Application()
+    app.router.add_get("/", info)
+    app.router.add_post("/", drive)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/"
@@ -0,0 +1,528 @@
+"""Supervisor sharding game rooms across engine worker processes"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import multiprocessing
+
+import aiohttp
+from aiohttp import web
+
+from rose.engine import config
+from rose.engine import server
+from rose.engine import tracing
+
+log = logging.getLogger("supervisor")
+
+# Headers of one connection, not forwarded between the client and a worker.
+# The body is forwarded decoded, so its length and encoding are dropped too.
+HOP_HEADERS = frozenset(
+    (
+        "connection",
+        "keep-alive",
+        "proxy-authenticate",
+        "proxy-authorization",
+        "te",
+        "trailer",
+        "transfer-encoding",
+        "upgrade",
+        "host",
+        "content-length",
+        "content-encoding",
+    )
+)
+
+
+class HashRing(object):
+    def __init__(self, nodes, vnodes=None):
+        """
+        Creates a new consistent hash ring.
+
+        Each node is placed on the ring vnodes times, so keys spread evenly,
+        and adding or removing a node only moves the keys it owns.
+
+        Args:
+            nodes (list): List of node ids.
+            vnodes (int, optional): Points per node on the ring. Defaults to
+                config.supervisor_vnodes.
+        """
+        if vnodes is None:
+            vnodes = config.supervisor_vnodes
+        points = sorted(
+            (self._hash(f"{node}-{i}"), node) for node in nodes for i in range(vnodes)
+        )
+        self._hashes = [point[0] for point in points]
+        self._nodes = [point[1] for point in points]
+
+    def node_for(self, key):
+        """Return the node owning key"""
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+    # Private
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class Worker(object):
+    def __init__(self, index, port):
+        """
+        Creates a new Worker, an engine process serving the rooms it owns on
+        an internal port.
+        """
+        self.index = index
+        self.port = port
+        self.process = None
+        self.settings = None
+        self.restarts = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def dead(self):
+        """True if the worker was started, and its process exited"""
+        return self.process is not None and not self.process.is_alive()
+
+    def start(self, settings):
+        self.settings = settings
+        self.process = multiprocessing.Process(
+            target=run_worker,
+            args=(self.port, settings),
+            name=f"rose-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+
+    def stop(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def restart(self):
+        """Start a new process for a dead worker, its rooms start over"""
+        log.error(
+            "worker %d exited with code %s, restarting it",
+            self.index,
+            self.process.exitcode,
+        )
+        self.restarts += 1
+        self.start(self.settings)
+
+    def state(self):
+        """Return read only serialize-able state for sending to client"""
+        return {
+            "worker": self.index,
+            "port": self.port,
+            "pid": self.process.pid if self.process else None,
+            "alive": self.process is not None and self.process.is_alive(),
+            "restarts": self.restarts,
+        }
+
+
+def run_worker(port, settings):
+    """Worker process entry point, runs an engine on an internal port"""
+    if settings["trace"]:
+        tracing.tracer.enable()
+    asyncio.run(
+        server.run(
+            port,
+            "127.0.0.1",
+            settings["rate"],
+            settings["running"],
+            settings["drivers"],
+            settings["track_type"],
+            settings["seed"],
+            settings["replay_dir"],
+            settings["default_room"],
+        )
+    )
+
+
+class Supervisor(object):
+    def __init__(self, workers, base_port):
+        """
+        Creates a new Supervisor, routing requests to the worker owning the
+        requested room.
+
+        Args:
+            workers (int): Number of engine worker processes.
+            base_port (int): Workers listen on base_port + 1 and up.
+        """
+        self.workers = [Worker(i, base_port + 1 + i) for i in range(workers)]
+        self.ring = HashRing(range(workers))
+        self.session = None
+
+    def worker_for(self, room):
+        return self.workers[self.ring.node_for(room)]
+
+    def start_workers(self, settings):
+        """Fork the workers, only the default room owner creates it"""
+        owner = self.worker_for(server.DEFAULT_ROOM)
+        for worker in self.workers:
+            worker.start({**settings, "default_room": worker is owner})
+
+    def stop_workers(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def restart_dead_workers(self):
+        """Restart the workers whose process exited, return them"""
+        dead = [worker for worker in self.workers if worker.dead]
+        for worker in dead:
+            worker.restart()
+        return dead
+
+    async def watch_workers(self, interval=None):
+        """Restart the workers that die, until cancelled"""
+        while True:
+            await asyncio.sleep(interval or config.supervisor_watchdog_interval)
+            self.restart_dead_workers()
+
+    def make_app(self):
+        """Return the supervisor web application"""
+        app = web.Application()
+        app.router.add_get("/ws", self.websocket_handler)
+        app.router.add_get("/driver", self.websocket_handler)
+        app.router.add_post("/admin", self.proxy_handler)
+        app.router.add_get("/spectators", self.proxy_handler)
+        app.router.add_get("/rooms", self.rooms_handler)
+        app.router.add_get("/workers", self.workers_handler)
+        app.router.add_get("/replays", self.proxy_handler)
+        app.router.add_get("/replay", self.websocket_handler)
+        app.router.add_get("/metrics", self.metrics_handler)
+        app.router.add_get("/trace", self.trace_handler)
+        app.router.add_post("/trace", self.trace_handler)
+        for path in server.MAP_ROUTES:
+            app.router.add_post(path, self.map_handler)
+            app.router.add_route("OPTIONS", path, server.options_handler)
+        app.router.add_get("/maps", server.maps_handler)
+        return app
+
+    # Handlers
+
+    async def proxy_handler(self, request):
+        """
+        Forward an HTTP request to the worker owning its room, and its
+        response as is, with the status, body and headers of the worker.
+        """
+        worker = self._route(request)
+        url = worker.url + request.rel_url.path_qs
+        try:
+            async with self.session.request(
+                request.method,
+                url,
+                data=await request.read(),
+                headers=forward_headers(request.headers),
+            ) as response:
+                return web.Response(
+                    body=await response.read(),
+                    status=response.status,
+                    headers=forward_headers(response.headers),
+                )
+        except aiohttp.ClientError as e:
+            log.error("worker %d request failed: %s", worker.index, e)
+            return web.Response(text="Worker unavailable", status=502)
+
+    async def map_handler(self, request):
+        """
+        Change the custom map here, the workers share the map directory and
+        library, and have every worker reload it.
+        """
+        response = await server.MAP_ROUTES[request.path](request)
+        if response.status == 200:
+            params = {}
+            if request.rel_url.query.get("name"):
+                params["name"] = request.rel_url.query["name"]
+
+            async def reload(worker):
+                try:
+                    async with self.session.post(
+                        worker.url + "/reloadMap", params=params
+                    ):
+                        pass
+                except aiohttp.ClientError as e:
+                    log.error("worker %d map reload failed: %s", worker.index, e)
+
+            await asyncio.gather(*(reload(worker) for worker in self.workers))
+        return response
+
+    async def websocket_handler(self, request):
+        """Connect a websocket client to the worker owning its room"""
+        worker = self._route(request)
+        url = worker.url + request.rel_url.path_qs
+        try:
+            upstream = await self.session.ws_connect(url)
+        except aiohttp.WSServerHandshakeError as e:
+            return web.Response(text=e.message, status=e.status)
+        except aiohttp.ClientError as e:
+            log.error("worker %d websocket failed: %s", worker.index, e)
+            return web.Response(text="Worker unavailable", status=502)
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        forward = [
+            asyncio.create_task(self._pipe(upstream, ws)),
+            asyncio.create_task(self._pipe(ws, upstream)),
+        ]
+        try:
+            await asyncio.wait(forward, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in forward:
+                task.cancel()
+            await upstream.close()
+            await ws.close()
+
+        return ws
+
+    async def rooms_handler(self, request):
+        """List the rooms of all the workers"""
+        rooms = []
+        for worker, worker_rooms in await self._worker_rooms():
+            for room in worker_rooms:
+                rooms.append({**room, "worker": worker.index})
+        return web.Response(text=json.dumps(rooms))
+
+    async def workers_handler(self, request):
+        """
+        Show each worker's process and load, and the rooms it owns.
+
+        With ?room=name, also show which worker owns that room. A worker
+        found dead is restarted, and shows how many times it was.
+        """
+        self.restart_dead_workers()
+        workers = []
+        for worker, worker_rooms in await self._worker_rooms():
+            workers.append(
+                {
+                    **worker.state(),
+                    "rooms": [room["room"] for room in worker_rooms],
+                    "running": sum(1 for room in worker_rooms if room["running"]),
+                    "spectators": sum(room["spectators"] for room in worker_rooms),
+                }
+            )
+        data = {"workers": workers}
+
+        room = request.rel_url.query.get("room")
+        if room:
+            data["placement"] = {"room": room, "worker": self.worker_for(room).index}
+
+        return web.Response(text=json.dumps(data))
+
+    async def metrics_handler(self, request):
+        """Merge the metrics of all the workers, labeled by worker"""
+
+        async def fetch(worker):
+            try:
+                async with self.session.get(worker.url + "/metrics") as response:
+                    return worker, await response.text()
+            except aiohttp.ClientError:
+                return worker, ""
+
+        texts = await asyncio.gather(*(fetch(worker) for worker in self.workers))
+        return web.Response(text=merge_metrics(texts), content_type="text/plain")
+
+    async def trace_handler(self, request):
+        """
+        Control tracing on every worker, and merge their traces.
+
+        GET returns one trace_event document holding the spans of all the
+        workers, and POST returns the tracer state of each worker.
+        """
+
+        async def forward(worker):
+            url = worker.url + request.rel_url.path_qs
+            try:
+                async with self.session.request(request.method, url) as response:
+                    return worker, response.status, await response.text()
+            except aiohttp.ClientError as e:
+                log.error("worker %d request failed: %s", worker.index, e)
+                return worker, 502, None
+
+        results = await asyncio.gather(*(forward(worker) for worker in self.workers))
+
+        if request.method == "GET":
+            traces = [
+                (worker, json.loads(text))
+                for worker, status, text in results
+                if status == 200
+            ]
+            return web.Response(
+                text=json.dumps(merge_traces(traces)), content_type="application/json"
+            )
+
+        states = []
+        for worker, status, text in results:
+            if status == 400:
+                return web.Response(text=text, status=400)
+            if status == 200:
+                states.append({**json.loads(text), "worker": worker.index})
+            else:
+                states.append({"worker": worker.index, "error": "Worker unavailable"})
+        return web.Response(text=json.dumps(states))
+
+    # Private
+
+    def _route(self, request):
+        # Replays are not in a room, spread them by name
+        query = request.rel_url.query
+        key = query.get("room")
+        if not key and request.path == "/replay":
+            key = query.get("name")
+        key = key or server.DEFAULT_ROOM
+        return self.worker_for(key)
+
+    async def _worker_rooms(self):
+        async def fetch(worker):
+            try:
+                async with self.session.get(worker.url + "/rooms") as response:
+                    return worker, json.loads(await response.text())
+            except aiohttp.ClientError:
+                return worker, []
+
+        return await asyncio.gather(*(fetch(worker) for worker in self.workers))
+
+    @staticmethod
+    async def _pipe(source, destination):
+        async for msg in source:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                await destination.send_str(msg.data)
+            elif msg.type == aiohttp.WSMsgType.BINARY:
+                await destination.send_bytes(msg.data)
+            else:
+                break
+
+
+def forward_headers(headers):
+    """Return the (name, value) headers to forward through the supervisor"""
+    return [
+        (name, value)
+        for name, value in headers.items()
+        if name.lower() not in HOP_HEADERS
+    ]
+
+
+def merge_metrics(texts):
+    """
+    Merge Prometheus texts, adding a worker label to every sample.
+
+    Args:
+        texts (list): List of (Worker, text) tuples.
+
+    Returns:
+        str: The merged text, with each metric's samples grouped together.
+    """
+    headers = {}
+    samples = {}
+    for worker, text in texts:
+        name = None
+        for line in text.splitlines():
+            if line.startswith("#"):
+                name = line.split()[2]
+                headers.setdefault(name, []).append(line)
+                samples.setdefault(name, [])
+            elif line and name is not None:
+                label = f'worker="{worker.index}"'
+                sample, value = line.rsplit(" ", 1)
+                if sample.endswith("}"):
+                    sample = f"{sample[:-1]},{label}}}"
+                else:
+                    sample = f"{sample}{{{label}}}"
+                samples[name].append(f"{sample} {value}")
+
+    lines = []
+    for name, header in headers.items():
+        # HELP and TYPE lines are the same on every worker
+        lines.extend(header[:2])
+        lines.extend(samples[name])
+    return "\n".join(lines) + "\n"
+
+
+def merge_traces(traces):
+    """
+    Merge Chrome trace_event documents, naming each worker's process.
+
+    Args:
+        traces (list): List of (Worker, document) tuples. Each worker's
+            events already have its own pid.
+
+    Returns:
+        dict: The merged trace_event document.
+    """
+    events = []
+    for worker, trace in traces:
+        pids = set()
+        for event in trace["traceEvents"]:
+            pids.add(event["pid"])
+            events.append(event)
+        for pid in sorted(pids):
+            events.append(
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "args": {"name": f"worker {worker.index}"},
+                }
+            )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+async def run(
+    http_port,
+    listen_address,
+    workers,
+    initial_rate,
+    initial_running,
+    initial_drivers,
+    track_type,
+    initial_seed=None,
+    replay_dir=None,
+):
+    """
+    Fork the engine workers, and serve the supervisor on http_port.
+
+    Requests for a room are proxied to the worker that owns it on the
+    consistent hash ring, so one engine uses all the machine cores.
+
+    Args:
+        http_port (int): The public port, workers use the ports after it.
+        listen_address (str): The address for the supervisor to bind to.
+        workers (int): Number of engine worker processes.
+        Other arguments are the server.run settings for the workers.
+    """
+    supervisor = Supervisor(workers, http_port)
+    supervisor.start_workers(
+        {
+            "rate": initial_rate,
+            "running": initial_running,
+            "drivers": initial_drivers,
+            "track_type": track_type,
+            "seed": initial_seed,
+            "replay_dir": replay_dir,
+            "trace": tracing.tracer.enabled,
+        }
+    )
+
+    supervisor.session = aiohttp.ClientSession()
+    runner = web.AppRunner(supervisor.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, listen_address, http_port)
+    await site.start()
+    watchdog = asyncio.create_task(supervisor.watch_workers())
+
+    print(f"Workers       {workers}")
+    print(f"Listen        {listen_address}:{http_port}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        watchdog.cancel()
+        await runner.cleanup()
+        await supervisor.session.close()
+        supervisor.stop_workers()
@@ -0,0 +1,52 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from rose.common import actions  # noqa: E402
+from rose.common import obstacles  # noqa: E402
+from rose.engine import batch  # noqa: E402
+from rose.engine import config  # noqa: E402
+
+
+def test_matches_scalar_reference():
+    batch.check_reference(games=16, ticks=100, seed=0)
+
+
+def test_same_track_rows():
+    game = batch.BatchGame(4, is_track_random=False, seed=0)
+    rows = game.generate_rows()
+
+    for row in rows:
+        lanes = [
+            row[lane * config.cells_per_player : (lane + 1) * config.cells_per_player]
+            for lane in range(config.max_players)
+        ]
+        assert all((lane == lanes[0]).all() for lane in lanes)
+
+
+def test_pickup_penguin():
+    game = batch.BatchGame(2, seed=0)
+    x, y = game.x[0, 0], game.y[0, 0]
+    rows = np.zeros((2, game.width), dtype=np.uint8)
+    game.update(rows)
+    game.tracks[0, (game.head + y) % game.height, x] = obstacles.encode(
+        obstacles.PENGUIN
+    )
+    codes = np.full((2, game.players), actions.encode(actions.PICKUP))
+    game.process(codes)
+
+    assert game.score[0, 0] == config.score_move_forward + config.score_pickup
+    assert game.pickups[0, 0] == 1
+    assert game.score[1, 0] == config.score_move_forward
+    assert game.pickups[1, 0] == 0
+    assert game.matrix()[0, y, x] == obstacles.encode(obstacles.NONE)
+
+
+def test_run():
+    game = batch.BatchGame(8, seed=0)
+    game.run(batch.random_policy(np.random.default_rng(0)), ticks=10)
+    state = game.state()
+
+    assert state["score"].shape == (8, config.max_players)
+    assert (state["y"] >= 2).all()
+    assert (state["y"] < config.matrix_height).all()
@@ -0,0 +1,35 @@
+from rose.engine import bench
+from rose.engine import config
+
+
+def test_run_benchmarks():
+    results = bench.run(["score", "track", "broadcast"], number=2, repeat=1)
+    names = {r["name"] for r in results["results"]}
+    assert names == {
+        "score.process",
+        "Track.update",
+        "Track.state",
+        "net.update_websockets",
+    }
+    for r in results["results"]:
+        assert 0 < r["best"] <= r["median"]
+
+
+def test_track_size_is_restored():
+    saved = config.matrix_height, config.matrix_width, config.max_players
+    with bench.track_size(100, 8):
+        assert config.matrix_width == 8 * config.cells_per_player
+        track = bench.new_track()
+        assert len(track.matrix()) == 100
+    assert (config.matrix_height, config.matrix_width, config.max_players) == saved
+
+
+def test_compare():
+    result = {"name": "Track.update", "params": {"height": 9}, "median": 2.0}
+    other = {"name": "Track.state", "params": {"height": 9}, "median": 1.0}
+    lines = bench.compare(
+        {"results": [result, other]},
+        {"results": [{**result, "median": 4.0}]},
+    )
+    assert lines[0].endswith("0.50x")
+    assert not lines[1].endswith("x")
@@ -0,0 +1,74 @@
+import asyncio
+
+from rose.engine import config
+from rose.engine import logic
+from rose.engine.breaker import CircuitBreaker
+from rose.engine.driversocket import DriverSocket
+
+
+def test_opens_after_consecutive_failures(monkeypatch):
+    monkeypatch.setattr(config, "driver_breaker_threshold", 3)
+    breaker = CircuitBreaker()
+    breaker.failure(now=0)
+    breaker.failure(now=0)
+    breaker.success()
+    breaker.failure(now=0)
+    breaker.failure(now=0)
+    assert breaker.allow(now=0)
+
+    breaker.failure(now=0)
+    assert breaker.status == "open"
+    assert not breaker.allow(now=0)
+    assert breaker.opened == 1
+
+
+def test_probes_back_off_exponentially(monkeypatch):
+    monkeypatch.setattr(config, "driver_breaker_threshold", 1)
+    monkeypatch.setattr(config, "driver_breaker_backoff", 1.0)
+    monkeypatch.setattr(config, "driver_breaker_max_backoff", 3.0)
+    breaker = CircuitBreaker()
+    breaker.failure(now=0)
+
+    now = 0
+    for backoff in (1.0, 2.0, 3.0, 3.0):
+        assert breaker.backoff == backoff
+        assert not breaker.allow(now=now + backoff - 0.1)
+        now += backoff
+        # A single probe is let through
+        assert breaker.allow(now=now)
+        assert not breaker.allow(now=now)
+        breaker.failure(now=now)
+    assert breaker.opened == 1
+
+
+def test_probe_success_closes(monkeypatch):
+    monkeypatch.setattr(config, "driver_breaker_threshold", 1)
+    breaker = CircuitBreaker()
+    breaker.failure(now=0)
+    assert breaker.allow(now=config.driver_breaker_backoff)
+    breaker.success()
+    assert breaker.state() == {
+        "state": "closed",
+        "failures": 0,
+        "backoff": None,
+        "opened": 1,
+    }
+    assert breaker.allow(now=0)
+
+
+def test_rooms_keep_breakers_across_games():
+    socket = DriverSocket("alice")
+    socket.attach(object())
+    sockets = {"alice": socket}
+    breakers = {"ws:gone": CircuitBreaker()}
+
+    async def players():
+        return await logic.initialize_players(
+            ["ws:alice"], None, driver_sockets=sockets, breakers=breakers
+        )
+
+    (first,) = asyncio.run(players())
+    (second,) = asyncio.run(players())
+
+    assert second.breaker is first.breaker
+    assert list(breakers) == ["ws:alice"]
@@ -0,0 +1,86 @@
+from rose.common import obstacles
+from rose.engine import config
+from rose.engine import delta
+from rose.engine import player
+from rose.engine import track
+
+STATE = {"rate": 1.0, "timeleft": 60}
+
+
+def apply_delta(items, players, payload):
+    """Apply a delta payload the way a spectator would"""
+    shift = payload["track"]["shift"]
+    cells = {(i["x"], i["y"]): i["name"] for i in items}
+    cells = {(x, y + shift): name for (x, y), name in cells.items()}
+    for item in payload["track"]["set"]:
+        cells[(item["x"], item["y"])] = item["name"]
+    items = [
+        {"name": name, "x": x, "y": y}
+        for (x, y), name in cells.items()
+        if name != obstacles.NONE and y < config.matrix_height
+    ]
+    players = [dict(p) for p in players]
+    for change in payload["players"]:
+        change = dict(change)
+        players[change.pop("index")].update(change)
+    return items, players
+
+
+def sort_items(items):
+    return sorted(items, key=lambda i: (i["y"], i["x"]))
+
+
+def test_first_update_is_keyframe():
+    encoder = delta.DeltaEncoder()
+    keyframe, payload = encoder.encode(True, STATE, [], track.Track())
+
+    assert keyframe
+    assert payload is None
+
+
+def test_keyframe_interval():
+    encoder = delta.DeltaEncoder(keyframe_interval=3)
+    t = track.Track()
+    keyframes = [encoder.encode(True, STATE, [], t)[0] for i in range(7)]
+
+    assert keyframes == [True, False, False, True, False, False, True]
+
+
+def test_reset_forces_keyframe():
+    encoder = delta.DeltaEncoder()
+    t = track.Track()
+    encoder.encode(True, STATE, [], t)
+    encoder.reset()
+
+    assert encoder.encode(True, STATE, [], t)[0]
+
+
+def test_unchanged_state_is_empty():
+    encoder = delta.DeltaEncoder()
+    t = track.Track()
+    p = player.Player("A", car=0, lane=0)
+    encoder.encode(False, STATE, [p], t)
+    keyframe, payload = encoder.encode(False, STATE, [p], t)
+
+    assert not keyframe
+    assert payload["players"] == []
+    assert payload["track"] == {"shift": 0, "set": []}
+
+
+def test_delta_reproduces_full_state():
+    encoder = delta.DeltaEncoder(keyframe_interval=1000)
+    t = track.Track()
+    p = player.Player("A", car=0, lane=0)
+    encoder.encode(True, STATE, [p], t)
+    items, players = t.state(), [p.state()]
+
+    for i in range(20):
+        t.update()
+        t.clear(p.x, p.y)
+        p.score += 10
+        keyframe, payload = encoder.encode(True, STATE, [p], t)
+        assert not keyframe
+        items, players = apply_delta(items, players, payload)
+
+        assert sort_items(items) == sort_items(t.state())
+        assert players == [p.state()]
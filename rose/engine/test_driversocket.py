@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import pytest
+
+from rose.engine.driversocket import DriverSocket
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_str(self, data):
+        self.sent.append(json.loads(data))
+
+
+def test_request_and_reply():
+    async def check():
+        socket = DriverSocket("alice")
+        ws = FakeWebSocket()
+        assert socket.attach(ws)
+        assert not socket.attach(FakeWebSocket())
+
+        request = asyncio.create_task(socket.request(b'{"info": {}, "track": []}'))
+        await asyncio.sleep(0)
+        assert ws.sent == [{"tick": 1, "info": {}, "track": []}]
+
+        # Late replies to an earlier tick are dropped
+        socket.receive('{"tick": 0, "info": {"action": "left"}}')
+        socket.receive("not json")
+        assert not request.done()
+
+        socket.receive('{"tick": 1, "info": {"action": "jump"}}')
+        reply = await request
+        assert reply["info"]["action"] == "jump"
+
+    asyncio.run(check())
+
+
+def test_disconnect_fails_the_request():
+    async def check():
+        socket = DriverSocket("alice")
+        ws = FakeWebSocket()
+        socket.attach(ws)
+        request = asyncio.create_task(socket.request(b'{"info": {}}'))
+        await asyncio.sleep(0)
+        socket.detach(ws)
+        with pytest.raises(ConnectionError):
+            await request
+        assert socket.state() == {"name": "alice", "connected": False, "tick": 1}
+
+        with pytest.raises(ConnectionError):
+            await socket.request(b'{"info": {}}')
+
+    asyncio.run(check())
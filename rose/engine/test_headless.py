@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+from aiohttp import web
+
+from rose.common import actions
+from rose.engine import headless
+from rose.engine import logic
+from rose.engine import player
+from rose.engine import stubdriver
+from rose.engine import track
+
+
+async def run_with_drivers(*args, **kwargs):
+    runners = []
+    drivers = []
+    for name, action in (("A", actions.NONE), ("B", actions.PICKUP)):
+        runner, url = await stubdriver.start(name, action)
+        runners.append(runner)
+        drivers.append(url)
+    try:
+        return await headless.run_game(drivers, *args, **kwargs)
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def test_run_game():
+    results = asyncio.run(run_with_drivers(ticks=20))
+
+    assert [p["name"] for p in results["players"]] == ["A", "B"]
+    assert all(p["score"] != 0 for p in results["players"])
+    assert len(results["timings"]) == 20
+    assert all(t >= 0 for t in results["timings"])
+
+
+def test_run_game_without_drivers():
+    results = asyncio.run(headless.run_game([], ticks=5))
+
+    assert results["players"] == []
+    assert len(results["timings"]) == 5
+
+
+def test_run_game_bounds_silent_drivers():
+    async def run():
+        answered = asyncio.Event()
+
+        async def info(request):
+            return web.json_response({"info": {"name": "silent"}})
+
+        async def drive(request):
+            await answered.wait()
+            return web.json_response({})
+
+        app = web.Application()
+        app.router.add_get("/", info)
+        app.router.add_post("/", drive)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return await headless.run_game(
+                [f"http://127.0.0.1:{port}/"], ticks=3, deadline=0.05
+            )
+        finally:
+            answered.set()
+            await runner.cleanup()
+
+    results = asyncio.run(run())
+
+    [silent] = results["players"]
+    assert silent["late_responses"] >= 1
+    assert silent["error"] == "Driver response timeout"
+    assert len(results["timings"]) == 3
+
+
+def test_seeded_games_are_identical():
+    def final_state(results):
+        return [
+            {k: v for k, v in p.items() if k != "response_time"}
+            for p in results["players"]
+        ]
+
+    first = asyncio.run(run_with_drivers(ticks=30, seed=1234))
+    second = asyncio.run(run_with_drivers(ticks=30, seed=1234))
+
+    assert first["seed"] == second["seed"] == 1234
+    assert final_state(first) == final_state(second)
+
+
+def test_drivers_see_the_track_before_the_update():
+    t = track.Track()
+    players = [player.Player("A", 0, 0)]
+    state = {"rate": None, "timeleft": 2}
+    sent = []
+
+    class Session:
+        def post(self, url, data):
+            sent.append(data)
+            raise ConnectionError("no driver")
+
+    async def run():
+        before = t.matrix()
+        bodies = await logic.game_step(state, players, t, (), Session())
+        assert b'"track": ' + json.dumps(before).encode() in sent[0]
+        after = t.matrix()
+        await logic.game_step(state, players, t, (), Session(), bodies=bodies)
+        assert b'"track": ' + json.dumps(after).encode() in sent[1]
+
+    asyncio.run(run())
+
+
+def test_failed_step_cancels_the_driver_requests():
+    t = track.Track()
+    players = [player.Player("A", 0, 0)]
+    state = {"rate": None, "timeleft": 2}
+
+    class Request:
+        async def __aenter__(self):
+            await asyncio.sleep(60)
+
+        async def __aexit__(self, *exc):
+            pass
+
+    class Session:
+        def post(self, url, data):
+            return Request()
+
+    def update():
+        raise RuntimeError("track failed")
+
+    t.update = update
+
+    async def run():
+        try:
+            await logic.game_step(state, players, t, (), Session())
+        except RuntimeError:
+            pass
+        await asyncio.sleep(0.05)
+        return asyncio.all_tasks() - {asyncio.current_task()}
+
+    assert asyncio.run(run()) == set()
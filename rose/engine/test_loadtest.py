@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from rose.engine import loadtest
+
+
+def test_parse_latency():
+    assert loadtest.parse_latency("const:0.5")() == 0.5
+    assert 0.1 <= loadtest.parse_latency("uniform:0.1,0.2")() <= 0.2
+    assert loadtest.parse_latency("exp:0.01")() >= 0
+    assert loadtest.parse_latency("exp:0")() == 0
+    assert loadtest.parse_latency("normal:0,1")() >= 0
+
+
+@pytest.mark.parametrize("spec", ["", "const", "const:a", "uniform:1", "gamma:1"])
+def test_parse_invalid_latency(spec):
+    with pytest.raises(ValueError):
+        loadtest.parse_latency(spec)
+
+
+def test_spectator_lags():
+    # Ticks at 10 per second, the third update of room a is 50ms late
+    received = [
+        ("a", 10, 100.0),
+        ("a", 9, 100.1),
+        ("a", 8, 100.25),
+        ("b", 10, 200.0),
+    ]
+    lags = loadtest.spectator_lags(received, 10)
+    assert [round(lag, 6) for lag in lags] == [0, 0, 0.05, 0]
+
+
+def test_parse_metrics():
+    text = (
+        'rose_tick_seconds_count{room="a"} 3\n'
+        'rose_tick_seconds_count{room="b"} 4\n'
+        'rose_tick_overruns_total{room="a"} 1\n'
+    )
+    assert loadtest.parse_metrics(text, "rose_tick_seconds_count") == {
+        "a": 3,
+        "b": 4,
+    }
+
+
+def test_process_stats():
+    cpu, rss = loadtest.process_stats(os.getpid())
+    assert cpu > 0
+    assert rss > 0
+
+
+def test_run_scenario():
+    result = loadtest.run_scenario(2, 2, rate=20, duration=1, warmup=1.5)
+    assert result["rooms"] == 1
+    assert result["tick_rate"] > 10
+    assert result["updates_received"] > 0
+    assert result["rss_mb"] > 0
+    assert "K=2" in loadtest.format_result(result)
@@ -0,0 +1,92 @@
+import asyncio
+
+from rose.common import obstacles
+from rose.engine import maplibrary
+from rose.engine import maps
+
+
+def new_map(*names):
+    return maps.compile_rows([[name] * 3 for name in names])
+
+
+def test_add_and_get(tmp_path):
+    library = maplibrary.MapLibrary(str(tmp_path / "maps.db"))
+    compiled = new_map(obstacles.BIKE, obstacles.WATER)
+    info = library.add("two", compiled)
+    assert info["length"] == 2
+    assert info["obstacles"] == {obstacles.BIKE: 3, obstacles.WATER: 3}
+
+    loaded = library.get("two")
+    assert loaded.rows == compiled.rows
+    assert loaded.random_cells == compiled.random_cells
+    assert library.get("two") is loaded
+    assert library.get("missing") is None
+    library.close()
+
+
+def test_maps_persist_in_wal_mode(tmp_path):
+    path = str(tmp_path / "maps.db")
+    library = maplibrary.MapLibrary(path)
+    library.add("one", new_map(obstacles.CRACK))
+    library.close()
+
+    library = maplibrary.MapLibrary(path)
+    assert library.get("one").rows[0][:3] == bytes(
+        [obstacles.encode(obstacles.CRACK)] * 3
+    )
+    mode = library._connect().execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+    library.close()
+
+
+def test_add_replaces_the_cached_map(tmp_path):
+    library = maplibrary.MapLibrary(str(tmp_path / "maps.db"))
+    library.add("map", new_map(obstacles.BIKE))
+    library.get("map")
+    library.add("map", new_map(obstacles.TRASH, obstacles.TRASH))
+    assert len(library.get("map")) == 2
+    assert [info["name"] for info in library.list()] == ["map"]
+    library.close()
+
+
+def test_lru_cache(tmp_path):
+    library = maplibrary.MapLibrary(str(tmp_path / "maps.db"), cache_size=2)
+    for name in ("a", "b", "c"):
+        library.add(name, new_map(obstacles.BIKE))
+    library.get("a")
+    library.get("b")
+    library.get("a")
+    library.get("c")
+    assert library.cached("a") is not None
+    assert library.cached("b") is None
+    assert library.cached("c") is not None
+    library.close()
+
+
+def test_get_for_another_width(tmp_path):
+    library = maplibrary.MapLibrary(str(tmp_path / "maps.db"))
+    library.add("map", new_map(obstacles.BIKE))
+    narrow = library.get("map", width=2)
+    wide = library.get("map", width=12)
+    assert narrow.rows[0] == bytes([obstacles.encode(obstacles.BIKE)] * 2)
+    assert len(wide.rows[0]) == 12
+    library.close()
+
+
+def test_delete(tmp_path):
+    library = maplibrary.MapLibrary(str(tmp_path / "maps.db"))
+    library.add("map", new_map(obstacles.BIKE))
+    library.get("map")
+    assert library.delete("map")
+    assert not library.delete("map")
+    assert library.get("map") is None
+    assert library.list() == []
+    library.close()
+
+
+def test_get_async(tmp_path):
+    library = maplibrary.MapLibrary(str(tmp_path / "maps.db"))
+    library.add("map", new_map(obstacles.BIKE))
+    compiled = asyncio.run(library.get_async("map"))
+    assert asyncio.run(library.get_async("map")) is compiled
+    library.close()
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import random
+
+import pytest
+
+from rose.common import obstacles
+from rose.engine import config
+from rose.engine import maps
+
+
+def write_map(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    return str(path)
+
+
+def test_compile_rows():
+    compiled = maps.compile_rows([["bike", "", "WATER"], [' "penguin"', "crack"]])
+    bike, water, penguin, crack = (
+        obstacles.encode(o)
+        for o in (obstacles.BIKE, obstacles.WATER, obstacles.PENGUIN, obstacles.CRACK)
+    )
+    assert len(compiled) == 2
+    assert compiled.rows[0] == bytes([bike, 0, water] + [0] * (config.matrix_width - 3))
+    assert compiled.rows[1][:2] == bytes([penguin, crack])
+    assert compiled.random_cells == ((), ())
+
+
+def test_compile_rows_truncates_and_marks_invalid_cells():
+    row = ["bike", "rocket"] + ["bike"] * config.matrix_width
+    compiled = maps.compile_rows([row])
+    assert len(compiled.rows[0]) == config.matrix_width
+    assert compiled.random_cells == ((1,),)
+
+
+def test_compile_no_rows():
+    assert maps.compile_rows([]) is None
+
+
+def test_draw_random_cells():
+    compiled = maps.compile_rows([["rocket", "bike"]])
+    drawn = compiled.draw(random.Random(1))
+    assert drawn.random_cells == ((),)
+    assert drawn.rows[0][1] == obstacles.encode(obstacles.BIKE)
+    assert obstacles.decode(drawn.rows[0][0]) in obstacles.ALL
+    assert compiled.random_cells == ((0,),)
+
+
+def test_draw_without_random_cells():
+    compiled = maps.compile_rows([["bike"]])
+    assert compiled.draw(random.Random()) is compiled
+
+
+def test_fill_wraps_around():
+    compiled = maps.compile_rows([["bike"], ["water"]])
+    row = memoryview(bytearray(config.matrix_width))
+    compiled.fill(3, row)
+    assert row[0] == obstacles.encode(obstacles.WATER)
+
+
+def test_read_map_quoted_cells(tmp_path):
+    path = write_map(tmp_path / "m.csv", '"penguin", "", "bike",\n"", "water", "",\n')
+    compiled = maps.read_map(path)
+    assert len(compiled) == 2
+    assert compiled.random_cells == ((), ())
+    assert compiled.rows[1][1] == obstacles.encode(obstacles.WATER)
+
+
+def test_load_is_cached_by_mtime(tmp_path):
+    maps.clear_cache()
+    path = write_map(tmp_path / "m.csv", "bike\n")
+    first = maps.load(path)
+    assert maps.load(path) is first
+
+    write_map(path, "water\n")
+    os.utime(path, ns=(first.mtime + 10**9, first.mtime + 10**9))
+    second = maps.load(path)
+    assert second is not first
+    assert second.rows[0][0] == obstacles.encode(obstacles.WATER)
+
+
+def test_active_map_path(tmp_path):
+    assert maps.active_map_path(str(tmp_path / "missing")) is None
+    write_map(tmp_path / "disabled_custom_map.csv", "bike\n")
+    assert maps.active_map_path(str(tmp_path)) is None
+    write_map(tmp_path / "custom_map.csv", "bike\n")
+    assert maps.active_map_path(str(tmp_path)) == str(tmp_path / "custom_map.csv")
+
+
+def test_active_map_path_skips_uploads_in_progress(tmp_path):
+    path = str(tmp_path / "custom_map.csv")
+    upload = maps.MapUpload(path)
+    upload.write(b"bike\n")
+    assert maps.active_map_path(str(tmp_path)) is None
+
+    write_map(path, "water\n")
+    assert maps.active_map_path(str(tmp_path)) == path
+    # A hidden CSV file is never the active map either
+    write_map(tmp_path / ".backup.csv", "bike\n")
+    assert maps.active_map_path(str(tmp_path)) == path
+    upload.abort()
+
+
+def test_load_active_async(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "map_dir", str(tmp_path))
+    assert asyncio.run(maps.load_active_async()) is None
+    write_map(tmp_path / "custom_map.csv", "bike\n")
+    compiled = asyncio.run(maps.load_active_async())
+    assert compiled.rows[0][0] == obstacles.encode(obstacles.BIKE)
+
+
+def test_upload_in_chunks(tmp_path):
+    path = str(tmp_path / "custom_map.csv")
+    write_map(path, "water\n")
+    upload = maps.MapUpload(path)
+    for chunk in (b"bike,", b"pen", b"guin\r\ncrack,", b"trash"):
+        upload.write(chunk)
+    compiled = upload.commit()
+    assert compiled.rows[0][:2] == bytes(
+        [obstacles.encode(obstacles.BIKE), obstacles.encode(obstacles.PENGUIN)]
+    )
+    assert compiled.rows[1][:2] == bytes(
+        [obstacles.encode(obstacles.CRACK), obstacles.encode(obstacles.TRASH)]
+    )
+    with open(path, "rb") as f:
+        assert f.read() == b"bike,penguin\r\ncrack,trash"
+    # The uploaded map is already compiled
+    assert maps.load(path) is compiled
+    assert os.listdir(tmp_path) == ["custom_map.csv"]
+
+
+def test_upload_too_large(tmp_path):
+    upload = maps.MapUpload(str(tmp_path / "custom_map.csv"), limit=10)
+    upload.write(b"bike\n")
+    with pytest.raises(maps.MapTooLarge):
+        upload.write(b"bike,bike\n")
+    upload.abort()
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_invalid_keeps_the_map(tmp_path):
+    path = write_map(tmp_path / "custom_map.csv", "water\n")
+    upload = maps.MapUpload(path)
+    with pytest.raises(ValueError, match="row 2"):
+        upload.write(b"bike\nrocket\n")
+    upload.abort()
+    with open(path) as f:
+        assert f.read() == "water\n"
+    assert os.listdir(tmp_path) == ["custom_map.csv"]
+
+
+def test_upload_empty(tmp_path):
+    upload = maps.MapUpload(str(tmp_path / "custom_map.csv"))
+    with pytest.raises(ValueError, match="empty"):
+        upload.commit()
+    upload.abort()
+
+
+def test_histogram():
+    compiled = maps.compile_rows([["bike", "bike", "rocket"], ["water"]])
+    assert compiled.histogram() == {
+        obstacles.BIKE: 2,
+        obstacles.WATER: 1,
+        "random": 1,
+    }
+
+
+def test_resize():
+    compiled = maps.compile_rows([["bike", "rocket", "water"]], width=3)
+    narrow = compiled.resize(2)
+    assert narrow.rows == (bytes([obstacles.encode(obstacles.BIKE), 0]),)
+    assert narrow.random_cells == ((1,),)
+    assert compiled.resize(4).rows[0][3] == 0
+    assert compiled.resize(3) is compiled
+
+
+def test_upload_without_a_file(tmp_path):
+    upload = maps.MapUpload()
+    upload.write(b"bike\n")
+    compiled = upload.commit()
+    assert len(compiled) == 1
+    assert compiled.path is None
@@ -0,0 +1,79 @@
+import asyncio
+
+from rose.engine import config
+from rose.engine import logic
+from rose.engine import metrics
+from rose.engine import player
+from rose.engine import track
+
+
+def test_counter():
+    metrics.clear()
+    metrics.driver_errors.inc(("http://a", "timeout"))
+    metrics.driver_errors.inc(("http://a", "timeout"))
+    lines = metrics.driver_errors.render()
+    assert "# TYPE rose_driver_errors_total counter" in lines
+    assert 'rose_driver_errors_total{driver="http://a",error="timeout"} 2' in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics.clear()
+    metrics.tick_seconds.observe(0.003, ("r",))
+    metrics.tick_seconds.observe(0.2, ("r",))
+    metrics.tick_seconds.observe(10, ("r",))
+    lines = metrics.tick_seconds.render()
+    assert 'rose_tick_seconds_bucket{room="r",le="0.001"} 0' in lines
+    assert 'rose_tick_seconds_bucket{room="r",le="0.005"} 1' in lines
+    assert 'rose_tick_seconds_bucket{room="r",le="0.25"} 2' in lines
+    assert 'rose_tick_seconds_bucket{room="r",le="+Inf"} 3' in lines
+    assert 'rose_tick_seconds_count{room="r"} 3' in lines
+
+
+def test_summary_quantiles_use_recent_samples():
+    metrics.clear()
+    summary = metrics.driver_response_seconds
+    for i in range(config.metrics_window + 100):
+        summary.observe(i, ("d",))
+    assert summary.quantile(0.5, ("d",)) == 100 + config.metrics_window // 2
+    assert summary.quantile(0.5, ("other",)) is None
+    lines = summary.render()
+    assert (
+        f'rose_driver_response_seconds_count{{driver="d"}} {config.metrics_window + 100}'
+        in lines
+    )
+
+
+def test_labels_are_escaped():
+    metrics.clear()
+    metrics.websocket_clients.set(1, ('a"b',))
+    assert (
+        'rose_websocket_clients{room="a\\"b"} 1' in metrics.websocket_clients.render()
+    )
+
+
+def test_game_step_records_phases():
+    metrics.clear()
+    state = {"room": "r", "rate": None, "timeleft": 10}
+    t = track.Track()
+    players = [player.Player("A", 0, 0)]
+
+    async def fetch(session, players, track_matrix, timeout=None, bodies=None):
+        pass
+
+    saved = logic.net.fetch_drivers_actions
+    logic.net.fetch_drivers_actions = fetch
+    try:
+        asyncio.run(logic.game_step(state, players, t, set(), None))
+    finally:
+        logic.net.fetch_drivers_actions = saved
+
+    phases = metrics.tick_phase_seconds.values
+    assert set(phases) == {
+        ("r", "fetch"),
+        ("r", "track"),
+        ("r", "score"),
+        ("r", "broadcast"),
+        ("r", "prepare"),
+    }
+    assert metrics.tick_seconds.values[("r",)][-2] == 1
+    assert "rose_tick_phase_seconds_bucket" in metrics.render()
@@ -0,0 +1,120 @@
+import asyncio
+import json
+
+from rose.common import actions
+from rose.engine import config
+from rose.engine import net
+from rose.engine import player
+
+
+def test_create_session_pools_driver_connections():
+    async def check():
+        session = net.create_session()
+        try:
+            connector = session.connector
+            assert connector.limit_per_host == config.driver_connections_per_host
+            assert connector.limit == 0
+            assert not session.closed
+        finally:
+            await session.close()
+        assert session.closed
+
+    asyncio.run(check())
+
+
+class FakeResponse:
+    def __init__(self, data, delay):
+        self.data = data
+        self.delay = delay
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def json(self):
+        return self.data
+
+
+class FakeSession:
+    def __init__(self, action, delay=0):
+        self.action = action
+        self.delay = delay
+
+    def post(self, url, data):
+        return FakeResponse({"info": {"name": "A", "action": self.action}}, self.delay)
+
+
+def test_fetch_driver_action_in_time():
+    p = player.Player("A", car=0, lane=0)
+    asyncio.run(net.fetch_driver_action(FakeSession(actions.JUMP), p, [], 1.0))
+
+    assert p.action == actions.JUMP
+    assert p.last_action == actions.JUMP
+    assert p.late_responses == 0
+    assert p.httperror is None
+
+
+def test_fetch_driver_action_late_no_action(monkeypatch):
+    monkeypatch.setattr(config, "driver_timeout_action", "none")
+    p = player.Player("A", car=0, lane=0)
+    p.last_action = actions.LEFT
+    asyncio.run(
+        net.fetch_driver_action(FakeSession(actions.JUMP, delay=1), p, [], 0.01)
+    )
+
+    assert p.action == actions.NONE
+    assert p.late_responses == 1
+    assert p.httperror is not None
+
+
+def test_fetch_driver_action_late_last_action(monkeypatch):
+    monkeypatch.setattr(config, "driver_timeout_action", "last")
+    p = player.Player("A", car=0, lane=0)
+    p.last_action = actions.LEFT
+    asyncio.run(
+        net.fetch_driver_action(FakeSession(actions.JUMP, delay=1), p, [], 0.01)
+    )
+
+    assert p.action == actions.LEFT
+    assert p.late_responses == 1
+
+
+class FailingSession:
+    def __init__(self):
+        self.requests = 0
+
+    def post(self, url, data):
+        self.requests += 1
+        raise ConnectionRefusedError(url)
+
+
+def test_fetch_driver_action_skips_open_circuit(monkeypatch):
+    monkeypatch.setattr(config, "driver_breaker_threshold", 2)
+    monkeypatch.setattr(config, "driver_breaker_backoff", 60)
+    session = FailingSession()
+    p = player.Player("A", car=0, lane=0)
+    for i in range(4):
+        asyncio.run(net.fetch_driver_action(session, p, [], 1.0))
+
+    assert session.requests == 2
+    assert p.action == actions.NONE
+    assert p.httperror == "Driver circuit open"
+    assert p.state()["breaker"]["state"] == "open"
+
+    # The probe request closes the circuit once the driver is back
+    p.breaker._probe_at = 0
+    asyncio.run(net.fetch_driver_action(FakeSession(actions.JUMP), p, [], 1.0))
+    assert p.action == actions.JUMP
+    assert p.state()["breaker"]["state"] == "closed"
+
+
+def test_encode_driver_requests_matches_json():
+    players = [player.Player("A", car=0, lane=0), player.Player("B", car=1, lane=1)]
+    matrix = [["", "penguin"], ["crack", ""]]
+    bodies = net.encode_driver_requests(players, matrix)
+    for p, body in zip(players, bodies):
+        data = {"info": {"car": {"x": p.x, "y": p.y}}, "track": matrix}
+        assert body == json.dumps(data).encode()
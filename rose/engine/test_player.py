@@ -14,6 +14,7 @@ def test_player_initialization():
     assert player1.y == config.matrix_height // 3 * 2
     assert player1.action == actions.NONE
     assert player1.response_time is None
+    assert player1.late_responses == 0
     assert player1.score == 0
 
 
@@ -21,11 +22,13 @@ def test_player_reset():
     player1 = Player("John", 1, 1)
 
     player1.score = 50  # Modify player to make sure reset works
+    player1.late_responses = 3
     player1.reset()
     assert player1.x == player1.lane * config.cells_per_player + 1
     assert player1.y == config.matrix_height // 3 * 2
     assert player1.action == actions.NONE
     assert player1.response_time is None
+    assert player1.late_responses == 0
     assert player1.score == 0
 
 
@@ -77,6 +80,7 @@ def test_player_state():
         "action": actions.NONE,
         "response_time": None,
         "error": None,
+        "late_responses": 0,
         "lane": 1,
         "score": 0,
         "pickups": 0,
@@ -85,6 +89,7 @@ def test_player_state():
         "breaks": 0,
         "jumps": 0,
         "collisions": 0,
+        "breaker": {"state": "closed", "failures": 0, "backoff": None, "opened": 0},
     }
 
     assert player1.state() == expected_state
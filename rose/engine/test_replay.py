@@ -0,0 +1,124 @@
+import asyncio
+import os
+import random
+
+import pytest
+
+from rose.common import actions
+from rose.engine import config
+from rose.engine import headless
+from rose.engine import logic
+from rose.engine import player
+from rose.engine import replay
+from rose.engine import score
+from rose.engine import track
+
+
+def record_game(path, ticks):
+    """Play a random game, recording it, and return the state of each tick"""
+    rng = random.Random(3)
+    t = track.Track(rng=rng)
+    players = [player.Player("A", 0, 0), player.Player("B", 1, 1)]
+    state = {"rate": 2.0, "timeleft": ticks, "game_seed": 3}
+    recorder = replay.ReplayRecorder(path, state, players, t)
+    history = []
+
+    for tick in range(ticks):
+        t.update()
+        for p in players:
+            p.action = rng.choice(actions.ALL)
+            p.response_time = 0.01
+        recorder.capture(players, t)
+        score.process(players, t)
+        recorder.record(state, players, t)
+        history.append((t.state(), [(p.x, p.y, p.score, p.hits) for p in players]))
+        state["timeleft"] -= 1
+
+    asyncio.run(recorder.close())
+    return history
+
+
+def playback_states(path, start):
+    reader = replay.ReplayReader(path)
+    playback = replay.Playback(reader)
+    reader.seek(playback.first_tick(start))
+    states = {}
+    record = reader.read()
+    while record is not None:
+        playback.apply(record)
+        states[record.tick] = (
+            playback.track.state(),
+            [(p.x, p.y, p.score, p.hits) for p in playback.players],
+        )
+        record = reader.read()
+    reader.close()
+    return reader, states
+
+
+def test_header(tmp_path):
+    path = str(tmp_path / "game.rpl")
+    record_game(path, 5)
+    reader = replay.ReplayReader(path)
+    reader.close()
+
+    assert reader.seed == 3
+    assert reader.rate == 2.0
+    assert reader.players == [("A", 0, 0), ("B", 1, 1)]
+    assert (reader.width, reader.height) == (
+        config.matrix_width,
+        config.matrix_height,
+    )
+
+
+def test_playback_reproduces_game(tmp_path):
+    path = str(tmp_path / "game.rpl")
+    history = record_game(path, 40)
+    reader, states = playback_states(path, 0)
+
+    assert sorted(states) == list(range(40))
+    for tick, expected in enumerate(history):
+        assert states[tick] == expected
+
+
+def test_seek_with_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "replay_index_interval", 5)
+    path = str(tmp_path / "game.rpl")
+    history = record_game(path, 40)
+    reader, states = playback_states(path, 30)
+
+    assert os.path.exists(path + replay.INDEX_SUFFIX)
+    assert min(states) == 30 - config.matrix_height + 1
+    for tick in range(30, 40):
+        assert states[tick] == history[tick]
+
+
+def test_empty_game_leaves_no_file(tmp_path):
+    path = str(tmp_path / "game.rpl")
+    state = {"rate": 1.0, "timeleft": 10, "game_seed": 1}
+    recorder = replay.ReplayRecorder(path, state, [], track.Track())
+    asyncio.run(recorder.close())
+
+    assert not os.path.exists(path)
+    assert replay.list_replays(str(tmp_path)) == []
+
+
+def test_check_seed():
+    replay.check_seed(None)
+    replay.check_seed(0)
+    replay.check_seed(replay.MAX_SEED)
+    for seed in (-1, replay.MAX_SEED + 1):
+        with pytest.raises(ValueError):
+            replay.check_seed(seed)
+
+    with pytest.raises(ValueError):
+        asyncio.run(headless.run_game([], 1, seed=-1, replay_dir="unused"))
+
+
+def test_failing_recorder_does_not_stop_the_game(tmp_path):
+    state = {"rate": 1.0, "replay_dir": str(tmp_path), "game_seed": -1}
+    assert logic.open_recorder(state, [], track.Track()) is None
+
+    # The replay directory is a file
+    state = {"rate": 1.0, "replay_dir": str(tmp_path / "file"), "game_seed": 1}
+    (tmp_path / "file").write_text("")
+    assert logic.open_recorder(state, [], track.Track()) is None
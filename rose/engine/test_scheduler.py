@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from rose.engine import config
+from rose.engine import scheduler
+
+
+def run_ticks(s, rate, ticks, work=0, policy=None):
+    async def run():
+        for i in range(ticks):
+            await s.wait(rate, policy)
+            time.sleep(work)
+
+    start = time.monotonic()
+    asyncio.run(run())
+    return time.monotonic() - start
+
+
+def test_ticks_do_not_drift():
+    s = scheduler.TickScheduler()
+    # The tick work would add up to a whole second without deadlines
+    elapsed = run_ticks(s, 50, 51, work=0.01)
+    assert 1.0 <= elapsed < 1.1
+    assert s.ticks == 51
+    assert s.skipped == 0
+    assert s.state()["mean_lateness"] < 0.01
+
+
+def test_first_tick_is_immediate():
+    s = scheduler.TickScheduler()
+    elapsed = run_ticks(s, 1, 1)
+    assert elapsed < 0.5
+    assert s.next_deadline() is not None
+    s.reset()
+    assert s.next_deadline() is None
+
+
+def test_catchup_runs_missed_ticks():
+    s = scheduler.TickScheduler()
+    # The second tick takes 3 periods, the missed ticks run back to back
+    elapsed = run_ticks_with_stall(s, 20, 6, stall=0.15, policy="catchup")
+    assert s.skipped == 0
+    assert 0.25 <= elapsed < 0.35
+
+
+def test_catchup_is_bounded(monkeypatch):
+    monkeypatch.setattr(config, "tick_max_catchup", 1)
+    s = scheduler.TickScheduler()
+    run_ticks_with_stall(s, 20, 6, stall=0.15, policy="catchup")
+    assert s.skipped == 1
+
+
+def test_skip_drops_missed_ticks():
+    s = scheduler.TickScheduler()
+    elapsed = run_ticks_with_stall(s, 20, 6, stall=0.15, policy="skip")
+    # The ticks due while stalling are dropped, the others keep their deadlines
+    assert s.skipped == 2
+    assert s.max_lateness < 0.05
+    assert 0.35 <= elapsed < 0.45
+
+
+def test_rate_change_restarts_deadlines():
+    s = scheduler.TickScheduler()
+    elapsed = run_ticks(s, 10, 2) + run_ticks(s, 100, 2)
+    assert elapsed < 0.15
+    assert s.skipped == 0
+
+
+def run_ticks_with_stall(s, rate, ticks, stall, policy):
+    async def run():
+        for i in range(ticks):
+            await s.wait(rate, policy)
+            if i == 1:
+                time.sleep(stall)
+
+    start = time.monotonic()
+    asyncio.run(run())
+    return time.monotonic() - start
@@ -363,3 +363,12 @@ class TestCollisions(object):
         assert self.player2.y == 8
         # TODO: decrease score?
         assert self.player2.score == 0
+
+
+def test_process_logs_skipped_drivers(caplog):
+    # Drivers skipped by their circuit breaker have no response time
+    caplog.set_level("INFO", logger="score")
+    p = player.Player("A", car=0, lane=0)
+    p.response_time = None
+    score.process([p], track.Track())
+    assert "response_time=None" in caplog.text
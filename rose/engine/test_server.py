@@ -0,0 +1,316 @@
+import asyncio
+import json
+import os
+
+import aiohttp
+from aiohttp.test_utils import TestClient, TestServer
+
+from rose.engine import config
+from rose.engine import maplibrary
+from rose.engine import maps
+from rose.engine import server
+
+
+async def with_client(check):
+    client = TestClient(TestServer(server.make_app()))
+    await client.start_server()
+    server.create_room(server.DEFAULT_ROOM)
+    try:
+        await check(client)
+    finally:
+        for room in list(server.rooms.values()):
+            await room.stop()
+        server.rooms.clear()
+        await client.close()
+
+
+def test_create_and_delete_room():
+    async def check(client):
+        resp = await client.post("/admin?room=other&create=1&rate=5")
+        assert resp.status == 200
+        state = json.loads(await resp.text())
+        assert state["room"] == "other"
+        assert state["rate"] == 5.0
+
+        resp = await client.get("/rooms")
+        names = [room["room"] for room in json.loads(await resp.text())]
+        assert sorted(names) == ["default", "other"]
+
+        resp = await client.post("/admin?room=other&delete=1")
+        assert resp.status == 200
+        assert "other" not in server.rooms
+
+    asyncio.run(with_client(check))
+
+
+def test_rooms_are_independent():
+    async def check(client):
+        await client.post("/admin?room=other&create=1")
+        await client.post("/admin?room=other&rate=3")
+
+        assert server.rooms["other"].state["rate"] == 3.0
+        assert server.rooms["default"].state["rate"] == server.defaults["rate"]
+
+    asyncio.run(with_client(check))
+
+
+def test_invalid_seed():
+    async def check(client):
+        for seed in ("-1", "18446744073709551616", "abc"):
+            resp = await client.post(f"/admin?seed={seed}")
+            assert resp.status == 400
+        assert server.rooms["default"].state["seed"] == server.defaults["seed"]
+
+        resp = await client.post("/admin?seed=18446744073709551615")
+        assert json.loads(await resp.text())["seed"] == 2**64 - 1
+
+    asyncio.run(with_client(check))
+
+
+def test_unknown_room():
+    async def check(client):
+        resp = await client.post("/admin?room=missing&rate=2")
+        assert resp.status == 404
+
+        resp = await client.get("/ws?room=missing")
+        assert resp.status == 404
+
+    asyncio.run(with_client(check))
+
+
+def test_create_existing_room():
+    async def check(client):
+        resp = await client.post("/admin?create=1")
+        assert resp.status == 409
+
+    asyncio.run(with_client(check))
+
+
+def test_websocket_joins_room():
+    async def check(client):
+        await client.post("/admin?room=other&create=1")
+        ws = await client.ws_connect("/ws?room=other")
+        await asyncio.sleep(0.01)
+
+        assert len(server.rooms["other"].active_websockets) == 1
+        assert len(server.rooms["default"].active_websockets) == 0
+
+        await client.post("/admin?room=other&delete=1")
+        msg = await ws.receive()
+        assert ws.closed or msg.type.name in ("CLOSE", "CLOSED", "CLOSING")
+
+    asyncio.run(with_client(check))
+
+
+def test_metrics():
+    async def check(client):
+        resp = await client.get("/metrics")
+        assert resp.status == 200
+        text = await resp.text()
+        assert 'rose_websocket_clients{room="default"} 0' in text
+        assert "# TYPE rose_tick_seconds histogram" in text
+
+    asyncio.run(with_client(check))
+
+
+def test_trace():
+    async def check(client):
+        resp = await client.post("/trace?enabled=1&clear=1")
+        assert json.loads(await resp.text())["enabled"] is True
+
+        resp = await client.get("/trace")
+        assert "traceEvents" in json.loads(await resp.text())
+
+        resp = await client.post("/trace?enabled=0")
+        assert json.loads(await resp.text())["enabled"] is False
+
+        resp = await client.post("/trace?enabled=yes")
+        assert resp.status == 400
+
+    asyncio.run(with_client(check))
+
+
+def map_form(data):
+    form = aiohttp.FormData()
+    form.add_field("note", "hello")
+    form.add_field("file", data, filename="map.csv", content_type="text/csv")
+    return form
+
+
+def test_upload_map(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "map_dir", str(tmp_path))
+
+    async def check(client):
+        resp = await client.post("/upload", data=map_form(b"bike,water\n"))
+        assert resp.status == 200
+        assert resp.headers["Access-Control-Allow-Origin"] == "*"
+        with open(tmp_path / "custom_map.csv", "rb") as f:
+            assert f.read() == b"bike,water\n"
+        assert os.listdir(tmp_path) == ["custom_map.csv"]
+        # The running games play the new map from their next tick
+        assert server.rooms["default"].state["reload_map"] == 1
+
+    asyncio.run(with_client(check))
+    maps.clear_cache()
+
+
+def test_upload_invalid_map(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "map_dir", str(tmp_path))
+
+    async def check(client):
+        resp = await client.post("/upload", data=map_form(b"bike,rocket\n"))
+        assert resp.status == 400
+        assert "rocket" in await resp.text()
+        assert os.listdir(tmp_path) == []
+        assert server.rooms["default"].state["reload_map"] is None
+
+        resp = await client.post("/upload", data=b"bike")
+        assert resp.status == 400
+
+    asyncio.run(with_client(check))
+
+
+def test_upload_map_too_large(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "map_dir", str(tmp_path))
+    monkeypatch.setattr(config, "map_max_size", 8)
+
+    async def check(client):
+        resp = await client.post("/upload", data=map_form(b"bike,bike,bike\n"))
+        assert resp.status == 413
+        assert os.listdir(tmp_path) == []
+
+    asyncio.run(with_client(check))
+
+
+def test_activate_and_deactivate_map(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "map_dir", str(tmp_path))
+    (tmp_path / "custom_map.csv").write_text("bike\n")
+
+    async def check(client):
+        resp = await client.post("/deactivateRandomMap")
+        assert resp.status == 200
+        assert os.listdir(tmp_path) == ["disabled_custom_map.csv"]
+        assert server.rooms["default"].state["reload_map"] == 1
+
+        resp = await client.post("/activateRandomMap")
+        assert resp.status == 200
+        assert os.listdir(tmp_path) == ["custom_map.csv"]
+
+        resp = await client.post("/activateRandomMap")
+        assert resp.status == 404
+
+        resp = await client.options("/upload")
+        assert resp.status == 204
+
+    asyncio.run(with_client(check))
+
+
+def test_map_library(tmp_path, monkeypatch):
+    library = maplibrary.MapLibrary(str(tmp_path / "maps.db"))
+    monkeypatch.setattr(maplibrary, "library", library)
+    monkeypatch.setattr(config, "map_dir", str(tmp_path / "map"))
+
+    async def check(client):
+        resp = await client.post("/upload?name=hills", data=map_form(b"bike\n"))
+        assert resp.status == 200
+        assert not os.path.exists(tmp_path / "map")
+
+        resp = await client.get("/maps")
+        (info,) = json.loads(await resp.text())
+        assert info["name"] == "hills"
+        assert info["length"] == 1
+
+        resp = await client.post("/admin?map=missing")
+        assert resp.status == 400
+
+        resp = await client.post("/admin?map=hills")
+        state = json.loads(await resp.text())
+        assert state["map"] == "hills"
+        assert state["reset"] == 1
+        assert server.rooms["default"].state["reload_map"] is None
+
+        # Only the games playing a changed map reload it
+        resp = await client.post("/upload?name=hills", data=map_form(b"water\n"))
+        assert server.rooms["default"].state["reload_map"] == 1
+
+        resp = await client.post("/maps?name=hills&delete=1")
+        assert resp.status == 200
+        resp = await client.post("/maps?name=hills&delete=1")
+        assert resp.status == 404
+
+        resp = await client.post("/admin?map=")
+        assert json.loads(await resp.text())["map"] is None
+
+    asyncio.run(with_client(check))
+    library.close()
+
+
+def test_websocket_driver():
+    async def check(client):
+        driver = await client.ws_connect("/driver?name=alice")
+        resp = await client.get("/driver?name=alice")
+        assert resp.status == 409
+
+        await client.post("/admin?drivers=ws:alice&rate=20")
+        state = server.rooms["default"].state
+        while state["reset"] is not None:
+            await asyncio.sleep(0.05)
+        await client.post("/admin?running=1")
+
+        spectator = await client.ws_connect("/ws")
+        for tick in (1, 2):
+            request = await driver.receive_json()
+            assert request["tick"] == tick
+            assert "car" in request["info"]
+            assert len(request["track"]) == config.matrix_height
+            await driver.send_json(
+                {"tick": tick, "info": {"name": "alice", "action": "jump"}}
+            )
+
+        # The driver answered in time, timed like an HTTP driver
+        update = await spectator.receive_json()
+        (player,) = update["payload"]["players"]
+        assert player["name"] == "alice"
+        assert player["error"] is None
+        assert player["response_time"] > 0
+
+        await driver.close()
+        await spectator.close()
+
+    asyncio.run(with_client(check))
+
+
+def test_websocket_drivers_not_played_are_forgotten():
+    async def check(client):
+        await client.post("/admin?drivers=ws:alice")
+        alice = await client.ws_connect("/driver?name=alice")
+        bob = await client.ws_connect("/driver?name=bob")
+
+        resp = await client.get("/rooms")
+        (room,) = json.loads(await resp.text())
+        assert sorted(s["name"] for s in room["driver_sockets"]) == ["alice", "bob"]
+        assert all(s["connected"] for s in room["driver_sockets"])
+
+        await alice.close()
+        await bob.close()
+        sockets = server.rooms["default"].driver_sockets
+        while sockets["alice"].connected or "bob" in sockets:
+            await asyncio.sleep(0.01)
+        assert list(sockets) == ["alice"]
+
+    asyncio.run(with_client(check))
+
+
+def test_invalid_replays_are_rejected(tmp_path, monkeypatch):
+    (tmp_path / "short.rpl").write_bytes(b"RO")
+    (tmp_path / "other.rpl").write_bytes(b"x" * 64)
+    monkeypatch.setitem(server.defaults, "replay_dir", str(tmp_path))
+
+    async def check(client):
+        for name in ("short.rpl", "other.rpl"):
+            resp = await client.get(f"/replay?name={name}")
+            assert resp.status == 400
+        resp = await client.get("/replay?name=missing.rpl")
+        assert resp.status == 404
+
+    asyncio.run(with_client(check))
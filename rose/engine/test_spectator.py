@@ -0,0 +1,89 @@
+import asyncio
+
+from rose.engine import config
+from rose.engine import net
+from rose.engine.spectator import Spectator
+
+
+class FakeWebSocket:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.closed = False
+        self.messages = []
+
+    async def send_str(self, data):
+        await asyncio.sleep(self.delay)
+        self.messages.append(data)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_run_sends_queued_updates():
+    async def check():
+        ws = FakeWebSocket()
+        spectator = Spectator(ws)
+        sender = asyncio.create_task(spectator.run())
+        spectator.offer("a")
+        spectator.offer("b")
+        await asyncio.sleep(0.01)
+        sender.cancel()
+        return ws, spectator
+
+    ws, spectator = asyncio.run(check())
+
+    assert ws.messages == ["a", "b"]
+    assert spectator.sent == 2
+    assert spectator.dropped == 0
+    assert spectator.latency is not None
+    assert spectator.state()["queued"] == 0
+
+
+def test_coalesce_drops_stale_updates():
+    spectator = Spectator(FakeWebSocket(), protocol="delta")
+    spectator.needs_keyframe = False
+    for i in range(config.ws_queue_size):
+        spectator.offer(str(i))
+
+    assert spectator.lagging()
+    spectator.coalesce()
+
+    assert not spectator.lagging()
+    assert spectator.dropped == config.ws_queue_size
+    assert spectator.lag_streak == 1
+    assert not spectator.wants_delta()
+
+
+def test_slow_spectator_does_not_block_others():
+    async def check():
+        fast = Spectator(FakeWebSocket())
+        slow = Spectator(FakeWebSocket(delay=10))
+        senders = [asyncio.create_task(s.run()) for s in (fast, slow)]
+        for i in range(3):
+            await net.send_to_all_websockets({"tick": i}, [fast, slow])
+            await asyncio.sleep(0.01)
+        for sender in senders:
+            sender.cancel()
+        return fast, slow
+
+    fast, slow = asyncio.run(check())
+
+    assert fast.sent == 3
+    assert slow.sent == 0
+
+
+def test_lagging_spectator_is_disconnected():
+    async def check():
+        ws = FakeWebSocket()
+        spectator = Spectator(ws)
+        for i in range(config.ws_max_lag):
+            for j in range(config.ws_queue_size):
+                spectator.offer("update")
+            net.coalesce_lagging_websockets([spectator])
+        await asyncio.sleep(0)
+        return ws, spectator
+
+    ws, spectator = asyncio.run(check())
+
+    assert spectator.disconnected
+    assert ws.closed
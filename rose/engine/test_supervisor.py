@@ -0,0 +1,145 @@
+import asyncio
+import collections
+import json
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from rose.engine import supervisor
+
+
+def test_ring_is_stable():
+    ring = supervisor.HashRing(range(4))
+    other = supervisor.HashRing(range(4))
+    for i in range(100):
+        assert ring.node_for(f"room-{i}") == other.node_for(f"room-{i}")
+
+
+def test_ring_spreads_rooms():
+    ring = supervisor.HashRing(range(4))
+    counts = collections.Counter(ring.node_for(f"room-{i}") for i in range(1000))
+    assert set(counts) == {0, 1, 2, 3}
+    assert min(counts.values()) > 150
+
+
+def test_ring_moves_only_removed_node_rooms():
+    ring = supervisor.HashRing(range(4))
+    smaller = supervisor.HashRing(range(3))
+    for i in range(200):
+        room = f"room-{i}"
+        if ring.node_for(room) != 3:
+            assert smaller.node_for(room) == ring.node_for(room)
+
+
+def test_single_node_owns_all():
+    ring = supervisor.HashRing([0])
+    assert ring.node_for("default") == 0
+    assert ring.node_for("other") == 0
+
+
+def test_supervisor_worker_ports():
+    s = supervisor.Supervisor(3, 8880)
+    assert [w.port for w in s.workers] == [8881, 8882, 8883]
+    assert s.worker_for("default") in s.workers
+    assert s.workers[0].state()["alive"] is False
+
+
+def test_merge_metrics_labels_workers():
+    workers = supervisor.Supervisor(2, 8880).workers
+    text = (
+        "# HELP rose_a A\n"
+        "# TYPE rose_a counter\n"
+        'rose_a{room="x"} 1\n'
+        "# HELP rose_b B\n"
+        "# TYPE rose_b counter\n"
+        "rose_b 2\n"
+    )
+    merged = supervisor.merge_metrics([(workers[0], text), (workers[1], text)])
+    assert merged.splitlines() == [
+        "# HELP rose_a A",
+        "# TYPE rose_a counter",
+        'rose_a{room="x",worker="0"} 1',
+        'rose_a{room="x",worker="1"} 1',
+        "# HELP rose_b B",
+        "# TYPE rose_b counter",
+        'rose_b{worker="0"} 2',
+        'rose_b{worker="1"} 2',
+    ]
+
+
+def test_merge_traces_names_workers():
+    workers = supervisor.Supervisor(2, 8880).workers
+    traces = [
+        (
+            worker,
+            {
+                "traceEvents": [
+                    {"name": "game_step", "ph": "X", "pid": 100 + worker.index}
+                ],
+                "displayTimeUnit": "ms",
+            },
+        )
+        for worker in workers
+    ]
+    merged = supervisor.merge_traces(traces)
+    assert [event["pid"] for event in merged["traceEvents"]] == [100, 100, 101, 101]
+    assert merged["traceEvents"][1] == {
+        "name": "process_name",
+        "ph": "M",
+        "pid": 100,
+        "args": {"name": "worker 0"},
+    }
+
+
+def test_proxy_forwards_headers():
+    async def spectators(request):
+        return web.json_response(
+            {"room": request.query["room"], "agent": request.headers["X-Agent"]},
+            status=201,
+            headers={"Access-Control-Allow-Origin": "*"},
+        )
+
+    async def run():
+        worker_app = web.Application()
+        worker_app.router.add_get("/spectators", spectators)
+        worker_server = TestServer(worker_app)
+        await worker_server.start_server()
+
+        s = supervisor.Supervisor(1, 0)
+        s.workers[0].port = worker_server.port
+        s.session = aiohttp.ClientSession()
+        client = TestClient(TestServer(s.make_app()))
+        await client.start_server()
+        try:
+            resp = await client.get(
+                "/spectators?room=final", headers={"X-Agent": "test"}
+            )
+            assert resp.status == 201
+            assert resp.headers["Content-Type"] == "application/json; charset=utf-8"
+            assert resp.headers["Access-Control-Allow-Origin"] == "*"
+            assert json.loads(await resp.text()) == {"room": "final", "agent": "test"}
+        finally:
+            await client.close()
+            await s.session.close()
+            await worker_server.close()
+
+    asyncio.run(run())
+
+
+def exit_worker(port, settings):
+    pass
+
+
+def test_dead_workers_are_restarted(monkeypatch):
+    monkeypatch.setattr(supervisor, "run_worker", exit_worker)
+    s = supervisor.Supervisor(2, 8880)
+    s.start_workers({})
+    for worker in s.workers:
+        worker.process.join()
+
+    assert s.restart_dead_workers() == s.workers
+    assert [w.state()["restarts"] for w in s.workers] == [1, 1]
+    assert sorted(w.settings["default_room"] for w in s.workers) == [False, True]
+    for worker in s.workers:
+        worker.process.join()
@@ -0,0 +1,54 @@
+import pytest
+
+from rose.engine import tournament
+
+
+def test_round_robin():
+    matches = tournament.round_robin(["a", "b", "c"], size=2)
+
+    assert matches == [["a", "b"], ["a", "c"], ["b", "c"]]
+
+
+def test_check_drivers_rejects_duplicates():
+    tournament.check_drivers(["a", "b"])
+    with pytest.raises(ValueError, match="a"):
+        tournament.check_drivers(["a", "b", "a"])
+
+
+def test_run_tournament_rejects_duplicates():
+    with pytest.raises(ValueError):
+        next(tournament.run_tournament(["a", "a"], workers=1))
+
+
+def test_bracket_round_even():
+    matches, byes = tournament.bracket_round(["a", "b", "c", "d"])
+
+    assert matches == [["a", "b"], ["c", "d"]]
+    assert byes == []
+
+
+def test_bracket_round_odd():
+    matches, byes = tournament.bracket_round(["a", "b", "c"])
+
+    assert matches == [["a", "b"]]
+    assert byes == ["c"]
+
+
+def results(*scores):
+    return {
+        "players": [{"score": score} for score in scores],
+        "drivers": [f"driver{i}" for i in range(len(scores))],
+    }
+
+
+def test_winner():
+    assert tournament.winner(results(10, 20)) == "driver1"
+    assert tournament.winner(results(30, 20)) == "driver0"
+
+
+def test_winner_tie_goes_to_lower_lane():
+    assert tournament.winner(results(20, 20)) == "driver0"
+
+
+def test_winner_without_players():
+    assert tournament.winner(results()) is None
@@ -0,0 +1,52 @@
+import asyncio
+
+from rose.engine import headless
+from rose.engine import tracing
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = tracing.Tracer(4)
+    tracer.record("step", "room a", 1.0, 2.0)
+    assert tracer.dump()["traceEvents"] == []
+
+
+def test_ring_buffer_keeps_recent_spans():
+    tracer = tracing.Tracer(4)
+    tracer.enable()
+    for i in range(10):
+        tracer.record(f"span {i}", "room a", i, i + 0.5)
+    names = [e["name"] for e in tracer.dump()["traceEvents"] if e["ph"] == "X"]
+    assert names == ["span 6", "span 7", "span 8", "span 9"]
+    assert tracer.state() == {"enabled": True, "spans": 4, "size": 4}
+
+
+def test_dump_is_chrome_trace_format():
+    tracer = tracing.Tracer(4)
+    tracer.enable()
+    tracer.record("fetch", "room a", 1.0, 1.25, {"timeleft": 3})
+    tracer.record("POST", "driver b", 1.0, 1.5)
+    events = tracer.dump()["traceEvents"]
+
+    fetch, post, *metadata = events
+    assert fetch["ph"] == "X"
+    assert fetch["ts"] == 1e6
+    assert fetch["dur"] == 0.25e6
+    assert fetch["args"] == {"timeleft": 3}
+    assert fetch["tid"] != post["tid"]
+    assert {(e["tid"], e["args"]["name"]) for e in metadata} == {
+        (fetch["tid"], "room a"),
+        (post["tid"], "driver b"),
+    }
+
+
+def test_game_steps_are_traced(monkeypatch):
+    tracer = tracing.Tracer()
+    tracer.enable()
+    monkeypatch.setattr(tracing, "tracer", tracer)
+
+    asyncio.run(headless.run_game([], ticks=3))
+
+    names = [e["name"] for e in tracer.dump()["traceEvents"] if e["ph"] == "X"]
+    assert names.count("game_step") == 3
+    assert names.count("fetch") == 3
+    assert names.count("broadcast") == 3
@@ -0,0 +1,136 @@
+import random
+
+from rose.common import obstacles
+from rose.engine import config
+from rose.engine import maps
+from rose.engine import track
+
+
+def make_track(rng=None):
+    return track.Track(rng=rng)
+
+
+def test_reset_is_empty():
+    t = make_track()
+
+    assert t.matrix() == [
+        [obstacles.NONE] * config.matrix_width for y in range(config.matrix_height)
+    ]
+    assert t.state() == []
+
+
+def test_set_get_clear():
+    t = make_track()
+    t.set(1, 2, obstacles.BIKE)
+
+    assert t.get(1, 2) == obstacles.BIKE
+    assert t.matrix()[2][1] == obstacles.BIKE
+    assert t.state() == [{"name": obstacles.BIKE, "x": 1, "y": 2}]
+
+    t.clear(1, 2)
+
+    assert t.get(1, 2) == obstacles.NONE
+    assert t.state() == []
+
+
+def test_update_scrolls_down():
+    t = make_track()
+    t.set(1, 0, obstacles.BIKE)
+    t.set(2, config.matrix_height - 1, obstacles.WATER)
+    before = [list(row) for row in t.matrix()]
+    t.update()
+    after = t.matrix()
+
+    assert len(after) == config.matrix_height
+    assert after[1:] == before[:-1]
+    assert t.get(1, 1) == obstacles.BIKE
+    # The water scrolled off the track
+    assert t.get(2, config.matrix_height - 1) == obstacles.NONE
+
+
+def test_update_wraps_around():
+    t = make_track()
+    t.set(0, 0, obstacles.TRASH)
+    for i in range(config.matrix_height - 1):
+        t.update()
+        t.clear(0, 0)
+
+    assert t.get(0, config.matrix_height - 1) == obstacles.TRASH
+    assert [item["y"] for item in t.state() if item["x"] == 0] == [
+        config.matrix_height - 1
+    ]
+
+    t.update()
+
+    # The trash scrolled off the track
+    assert t.get(0, config.matrix_height - 1) == obstacles.NONE
+
+
+def test_cells_are_stored_as_codes():
+    t = make_track()
+    t.set(3, 4, obstacles.PENGUIN)
+
+    assert t.get_code(3, 4) == obstacles.encode(obstacles.PENGUIN)
+    assert t.get_code(0, 0) == obstacles.encode(obstacles.NONE)
+
+
+def test_custom_map_row():
+    t = make_track()
+    t.custom_map = maps.compile_rows([["bike", "", "water", "", "", "", ""]])
+    t.update()
+
+    assert t.matrix()[0] == [obstacles.BIKE, "", obstacles.WATER, "", "", ""]
+
+
+def test_custom_map_rows_loop():
+    custom_map = maps.compile_rows([["bike"], ["water"]])
+    t = track.Track(custom_map=custom_map)
+    for i in range(3):
+        t.update()
+
+    assert [row[0] for row in t.matrix()[:3]] == [
+        obstacles.BIKE,
+        obstacles.WATER,
+        obstacles.BIKE,
+    ]
+
+
+def test_custom_map_random_cells_are_drawn_once():
+    custom_map = maps.compile_rows([["rocket"] * config.matrix_width] * 2)
+    t = track.Track(rng=random.Random(7), custom_map=custom_map)
+    t.update()
+    t.update()
+    first = t.matrix()[:2]
+    t.update()
+    t.update()
+
+    assert t.matrix()[:2] == first
+
+
+def test_set_map_starts_from_the_first_row():
+    t = track.Track(custom_map=maps.compile_rows([["bike"], ["water"]]))
+    t.update()
+    t.set_map(maps.compile_rows([["crack"], ["trash"]]))
+    t.update()
+    assert t.get(0, 0) == obstacles.CRACK
+    t.set_map(None)
+    assert t.custom_map is None
+
+
+def test_seeded_tracks_are_identical():
+    tracks = [make_track(random.Random(42)) for i in range(2)]
+    for i in range(50):
+        for t in tracks:
+            t.update()
+
+        assert tracks[0].matrix() == tracks[1].matrix()
+
+
+def test_push_and_codes():
+    t = make_track()
+    row = bytes([obstacles.encode(obstacles.BIKE)] + [0] * (config.matrix_width - 1))
+    t.push(row)
+
+    assert t.get(0, 0) == obstacles.BIKE
+    assert t.codes()[: config.matrix_width] == row
+    assert len(t.codes()) == config.matrix_width * config.matrix_height
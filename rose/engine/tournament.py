@@ -0,0 +1,225 @@
+"""Tournament runner, playing headless matches on a process pool"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import os
+import random
+
+from rose.engine import config
+from rose.engine import headless
+from rose.engine import replay
+
+log = logging.getLogger("tournament")
+
+FORMATS = ("round-robin", "bracket")
+
+
+def check_drivers(drivers):
+    """
+    Raise ValueError if a driver is listed more than once.
+
+    Standings are kept by driver URL, so a repeated driver would play
+    against itself and merge the stats of both entries.
+    """
+    duplicates = sorted({driver for driver in drivers if drivers.count(driver) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate drivers: {', '.join(duplicates)}")
+
+
+def round_robin(drivers, size=None):
+    """
+    Return every match of a round robin tournament.
+
+    Args:
+        drivers (list): List of driver URLs.
+        size (int, optional): Drivers per match. Defaults to
+            config.max_players.
+
+    Returns:
+        list: List of matches, each a list of driver URLs.
+    """
+    if size is None:
+        size = config.max_players
+    return [list(match) for match in itertools.combinations(drivers, size)]
+
+
+def bracket_round(drivers):
+    """
+    Return the matches of one single elimination round.
+
+    Drivers are paired in order; with an odd number of drivers the last one
+    gets a bye and advances without playing.
+
+    Args:
+        drivers (list): List of driver URLs still in the tournament.
+
+    Returns:
+        tuple: A tuple containing:
+            - list: List of matches, each a list of two driver URLs.
+            - list: List of driver URLs advancing without a match.
+    """
+    matches = [drivers[i : i + 2] for i in range(0, len(drivers) - 1, 2)]
+    byes = drivers[len(matches) * 2 :]
+    return matches, byes
+
+
+def winner(result):
+    """
+    Return the driver URL of the match winner, None if no player finished.
+
+    Ties are won by the player in the lower lane.
+    """
+    if not result["players"]:
+        return None
+    best = max(
+        range(len(result["players"])),
+        key=lambda i: (result["players"][i]["score"], -i),
+    )
+    return result["drivers"][best]
+
+
+def play_match(drivers, ticks=None, track_type="random", seed=None, deadline=None):
+    """
+    Play one headless match in the calling process.
+
+    This is the process pool entry point: every call runs the game in its
+    own event loop, with its own driver session.
+
+    Returns:
+        dict: The headless.run_game results of the match.
+    """
+    return asyncio.run(
+        headless.run_game(drivers, ticks, track_type, seed=seed, deadline=deadline)
+    )
+
+
+def run_matches(
+    executor, matches, ticks=None, track_type="random", seeds=None, deadline=None
+):
+    """
+    Play matches in parallel, yielding results as each one finishes.
+
+    Args:
+        executor (concurrent.futures.Executor): The pool to play matches on.
+        matches (list): List of matches, each a list of driver URLs.
+        ticks (int, optional): Number of game ticks per match.
+        track_type (str): Type of track can be "random" or "same".
+        seeds (list, optional): The seed of each match, None for random seeds.
+        deadline (float, optional): Seconds each driver has to answer a tick.
+
+    Yields:
+        tuple: The index of the match in matches, and its results, or None
+            if the match failed.
+    """
+    if seeds is None:
+        seeds = [None] * len(matches)
+    futures = {
+        executor.submit(
+            play_match, match, ticks, track_type, seeds[index], deadline
+        ): index
+        for index, match in enumerate(matches)
+    }
+    for future in concurrent.futures.as_completed(futures):
+        index = futures[future]
+        try:
+            yield index, future.result()
+        except Exception as e:
+            log.error("match %s failed: %s", matches[index], e)
+            yield index, None
+
+
+def run_tournament(
+    drivers,
+    tournament_format="round-robin",
+    ticks=None,
+    track_type="random",
+    workers=None,
+    seed=None,
+    deadline=None,
+):
+    """
+    Run a tournament on a process pool, yielding each match as it finishes.
+
+    Round robin matches are all scheduled at once. Bracket rounds are
+    scheduled one at a time, since each round depends on the winners of the
+    previous one.
+
+    Every match gets its own seed, drawn from the tournament seed, so a
+    seeded tournament replays the same matches.
+
+    Args:
+        drivers (list): List of driver URLs.
+        tournament_format (str): "round-robin" or "bracket".
+        ticks (int, optional): Number of game ticks per match.
+        track_type (str): Type of track can be "random" or "same".
+        workers (int, optional): Number of worker processes. Defaults to the
+            number of CPUs.
+        seed (int, optional): Seed for the tournament, None for a random seed.
+        deadline (float, optional): Seconds each driver has to answer a tick.
+            Defaults to the headless.run_game deadline.
+
+    Yields:
+        dict: A match record with the round number, the match drivers, and the
+            results of the game, and last a record with the standings, and the
+            champion of a bracket.
+    """
+    if tournament_format not in FORMATS:
+        raise ValueError(f"Invalid tournament format: {tournament_format}")
+    check_drivers(drivers)
+    replay.check_seed(seed)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    rng = random.Random(seed)
+    standings = {driver: {"wins": 0, "score": 0} for driver in drivers}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        round_number = 0
+        remaining = list(drivers)
+        advancing = remaining
+
+        while True:
+            if tournament_format == "round-robin":
+                matches, byes = round_robin(remaining), []
+            else:
+                matches, byes = bracket_round(remaining)
+
+            advancing = list(byes)
+            seeds = [rng.randint(0, replay.MAX_SEED) for _ in matches]
+            for index, results in run_matches(
+                executor, matches, ticks, track_type, seeds, deadline
+            ):
+                record = {
+                    "round": round_number,
+                    "drivers": matches[index],
+                    "results": results,
+                }
+                if results is not None:
+                    for driver, player in zip(results["drivers"], results["players"]):
+                        standings[driver]["score"] += player["score"]
+                    match_winner = winner(results)
+                    if match_winner is not None:
+                        standings[match_winner]["wins"] += 1
+                        advancing.append(match_winner)
+                yield record
+
+            round_number += 1
+            if tournament_format == "round-robin" or len(advancing) <= 1:
+                break
+
+            # Keep the bracket order stable between rounds
+            remaining = [driver for driver in remaining if driver in advancing]
+
+    final = {
+        "standings": sorted(
+            ({"driver": driver, **stats} for driver, stats in standings.items()),
+            key=lambda s: (s["wins"], s["score"]),
+            reverse=True,
+        )
+    }
+    if tournament_format == "bracket" and len(advancing) == 1:
+        final["champion"] = advancing[0]
+    yield final
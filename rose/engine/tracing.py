@@ -0,0 +1,98 @@
+"""Optional tracing of game steps, exported in the Chrome trace format
+
+Spans are kept in a ring buffer holding the most recent
+config.trace_buffer_size spans, and dumped as a trace_event JSON document
+that chrome://tracing or https://ui.perfetto.dev can open. Each room gets
+its own timeline track for its game steps, and each driver another one for
+its requests.
+"""
+
+import collections
+import os
+
+from rose.engine import config
+
+
+class Tracer(object):
+    def __init__(self, size=None):
+        """
+        Creates a new Tracer, disabled until enable() is called.
+
+        Args:
+            size (int, optional): The number of spans kept. Defaults to
+                config.trace_buffer_size.
+        """
+        self.enabled = False
+        self._spans = collections.deque(maxlen=size or config.trace_buffer_size)
+        self._tracks = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._spans.clear()
+
+    def record(self, name, track, start, end, args=None):
+        """
+        Record a span, when tracing is enabled.
+
+        Args:
+            name (str): The span name.
+            track (str): The timeline the span shows on.
+            start, end (float): time.perf_counter() values.
+            args (dict, optional): Details shown with the span.
+        """
+        if self.enabled:
+            self._spans.append((name, track, start, end, args))
+
+    def state(self):
+        """Return read only serialize-able state for sending to client"""
+        return {
+            "enabled": self.enabled,
+            "spans": len(self._spans),
+            "size": self._spans.maxlen,
+        }
+
+    def dump(self):
+        """Return the recorded spans as a Chrome trace_event document"""
+        pid = os.getpid()
+        events = []
+        for name, track, start, end, args in list(self._spans):
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": start * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": self._track_id(track),
+            }
+            if args:
+                event["args"] = args
+            events.append(event)
+
+        for track, tid in self._tracks.items():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": track},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    # Private
+
+    def _track_id(self, track):
+        tid = self._tracks.get(track)
+        if tid is None:
+            tid = self._tracks[track] = len(self._tracks) + 1
+        return tid
+
+
+# The engine tracer
+tracer = Tracer()
@@ -1,115 +1,155 @@
+import logging
 import random
 
-import os
 from rose.engine import config
 from rose.common import obstacles
-from rose.engine import csv_file_handler
+
+log = logging.getLogger("track")
 
 
 class Track(object):
-    def __init__(self, is_track_random=False):
-        self._matrix = None
+    def __init__(self, is_track_random=False, rng=None, custom_map=None):
+        # Obstacles are stored as codes (see obstacles.CODES) in one flat
+        # bytearray. Rows are kept in a circular buffer, logical row y is
+        # stored at row (self._head + y) % self._height, so scrolling the
+        # track only moves the head and overwrites the row that fell off the
+        # end.
+        self._cells = None
+        self._head = 0
+        self._height = 0
+        self._width = 0
+        self._empty_row = None
         self.is_track_random = is_track_random
+        # The game's random generator, so seeded games are reproducible
+        self.rng = rng if rng is not None else random.Random()
         self.reset()
+        # The compiled custom map (see maps.CompiledMap) rows are used in
+        # order instead of random rows, when there is one
         self.custom_index = 0
-        self.map_name = os.listdir("map")
-        if self.map_name != [] and ("disabled" not in self.map_name[0]):
-            self.custom_map = csv_file_handler.CsvFileHandler.read_as_matrix(os.path.join("map", f"{self.map_name[0]}"))
-
-
+        self.custom_map = None
+        self.set_map(custom_map)
 
+    # Game state interface
 
-        # Game state interface
     def update(self):
         """Go to the next game state"""
-        self._matrix.pop()
-        if self.custom_map != []:
-            self.custom_map = self.check_obstacle(self.custom_map)
-            self._matrix.insert(0, self.generate_custom_map(self.custom_map))
+        # The last row becomes the new first row, and is refilled in place
+        self._head = (self._head - 1) % self._height
+        start = self._head * self._width
+        row = memoryview(self._cells)[start : start + self._width]
+        if self.custom_map:
+            self.custom_map.fill(self.custom_index, row)
+            self.custom_index = (self.custom_index + 1) % len(self.custom_map)
         else:
-            self._matrix.insert(0, self._generate_row())
+            self._generate_row(row)
+        row.release()
 
     def state(self):
         """Return read only serialize-able state for sending to client"""
         items = []
-        for y, row in enumerate(self._matrix):
-            for x, obs in enumerate(row):
-                if obs != obstacles.NONE:
-                    items.append({"name": obs, "x": x, "y": y})
+        for i, code in enumerate(self._ordered_cells()):
+            if code:
+                items.append(
+                    {
+                        "name": obstacles.ALL[code],
+                        "x": i % self._width,
+                        "y": i // self._width,
+                    }
+                )
         return items
 
     def matrix(self):
-        """Return the track matrix"""
-        return self._matrix
+        """Return a copy of the track matrix, as obstacle names"""
+        cells = self._ordered_cells()
+        names = obstacles.ALL
+        return [
+            [names[code] for code in cells[start : start + self._width]]
+            for start in range(0, len(cells), self._width)
+        ]
+
+    def codes(self):
+        """Return the obstacle codes of the whole track, row by row"""
+        return bytes(self._ordered_cells())
+
+    def set_map(self, custom_map):
+        """
+        Play a custom map from its first row, None to go back to random rows.
+
+        The obstacles of the map's random cells are drawn once here, and
+        kept for as long as the track plays the map.
+        """
+        if custom_map is not None:
+            custom_map = custom_map.draw(self.rng)
+        self.custom_map = custom_map
+        self.custom_index = 0
+
+    def push(self, codes):
+        """Scroll the track, inserting a row of obstacle codes at the top"""
+        self._head = (self._head - 1) % self._height
+        start = self._head * self._width
+        self._cells[start : start + self._width] = codes
 
     # Track interface
 
     def get(self, x, y):
         """Return the obstacle in position x, y"""
-        return self._matrix[y][x]
+        return obstacles.ALL[self._cells[self._index(x, y)]]
+
+    def get_code(self, x, y):
+        """Return the obstacle code in position x, y"""
+        return self._cells[self._index(x, y)]
 
     def set(self, x, y, obstacle):
         """Set obstacle in position x, y"""
-        self._matrix[y][x] = obstacle
+        self._cells[self._index(x, y)] = obstacles.CODES[obstacle]
 
     def clear(self, x, y):
         """Clear obstacle in position x, y"""
-        self._matrix[y][x] = obstacles.NONE
+        self._cells[self._index(x, y)] = 0
 
     def reset(self):
-        self._matrix = [
-            [obstacles.NONE] * config.matrix_width for x in range(config.matrix_height)
-        ]
+        self._height = config.matrix_height
+        self._width = config.matrix_width
+        self._cells = bytearray(self._height * self._width)
+        self._empty_row = bytes(self._width)
+        self._head = 0
 
     # Private
 
-    def _generate_row(self):
+    def _index(self, x, y):
+        if not 0 <= x < self._width:
+            raise IndexError("track x out of range")
+        return (self._head + y) % self._height * self._width + x
+
+    def _ordered_cells(self):
+        """Return the cells codes in logical row order"""
+        start = self._head * self._width
+        return self._cells[start:] + self._cells[:start]
+
+    def _generate_row(self, row):
         """
-        Generates new row with obstacles
+        Fills row in place with new obstacle codes
 
         Try to create fair but random obstacle stream. Each player get the same
         obstacles, but in different cells if 'is_track_random' is True.
         Otherwise, the tracks will be identical.
         """
 
-        # Create initial empty row
-        row = [obstacles.NONE] * config.matrix_width
+        # Clear the row
+        row[:] = self._empty_row
 
         # Get a random obstacle
-        obstacle = obstacles.get_random_obstacle()
+        obstacle = obstacles.CODES[obstacles.get_random_obstacle(self.rng)]
 
         if self.is_track_random:
             for lane in range(config.max_players):
                 # Get a random cell for each player
-                cell = random.choice(range(0, config.cells_per_player))
+                cell = self.rng.choice(range(0, config.cells_per_player))
 
                 row[cell + lane * config.cells_per_player] = obstacle
         else:
             # Get a random cell, and use it for all players
-            cell = random.choice(range(0, config.cells_per_player))
+            cell = self.rng.choice(range(0, config.cells_per_player))
 
             for lane in range(config.max_players):
                 row[cell + lane * config.cells_per_player] = obstacle
-
-        return row
-
-    def check_obstacle(self, custom_map):
-        for row in range(len(custom_map)-1):
-            for col in range(len(custom_map[row])-1):
-                if custom_map[row][col] not in obstacles.ALL:
-                    print(custom_map[row][col])
-                    custom_map[row][col] = obstacles.get_random_obstacle()
-        return custom_map
-
-    def generate_custom_map(self,custom_map):
-        if self.custom_index >= len(custom_map):
-            self.custom_index = 0
-
-        row = custom_map[self.custom_index]
-        self.custom_index += 1
-
-        return [
-            getattr(obstacles, value.upper(), obstacles.NONE) if value else obstacles.NONE
-            for value in row
-        ]
-